@@ -0,0 +1,249 @@
+'''
+Columnar store for the parsed CNET articles.
+
+Instead of one JSON dict with the text (or tokens) of all ~70k articles, the
+corpus is a single zstd compressed Parquet file with the columns
+	- id: article id
+	- date: day the article was created (from index_articles.json)
+	- title
+	- text: parsed article text (see scraping/cnet/article_parser.py)
+	- tokens: list of tokens (optional, see tokenizer.py)
+
+Articles are streamed in (only one row group is held in memory while
+building) sorted by date, so every row group covers a date range. Reads can
+then be restricted to some columns (e.g. only id and date) and to a date range
+(row groups outside of it are skipped using their statistics) and are memory
+mapped, so analyses never have to hold the whole corpus in RAM.
+
+Build:
+	python src/py/analysis/text-mining/corpus.py
+
+Read:
+	sys.path.append(os.path.join(os.getcwd(), "src/py/analysis/text-mining"))
+	from corpus import read_corpus
+	df = read_corpus(columns=["id", "date"]).to_pandas()
+	table = read_corpus(columns=["id", "text"], date_start="2021-01-01", date_end="2021-12-31")
+'''
+
+import os
+import json
+import time
+import argparse
+from datetime import date, datetime
+from typing import Iterator, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Globals
+path_index = "data/scraped/cnet/index_articles.json"
+path_parsed = "data/scraped/cnet/articles/parsed"
+path_corpus = "data/scraped/cnet/corpus.parquet"
+row_group_size = 2000  # articles per row group
+compression = "zstd"
+
+
+def get_schema(with_tokens: bool = False) -> pa.Schema:
+	fields = [
+	    pa.field("id", pa.string()),
+	    pa.field("date", pa.date32()),
+	    pa.field("title", pa.string()),
+	    pa.field("text", pa.large_string()),
+	]
+	if with_tokens:
+		fields.append(pa.field("tokens", pa.list_(pa.string())))
+	return pa.schema(fields)
+
+
+def get_date(date_created: str) -> date:
+	'''
+		Returns the day of an article's dateCreated ("2022-03-04 12:00:00 ...")
+	'''
+	return datetime.strptime(date_created.split(" ")[0], "%Y-%m-%d").date()
+
+
+class CorpusWriter:
+	'''
+		Streams articles into a Parquet file, one row group at a time.
+
+		Articles are dicts with the keys id, date, title, text (and tokens if
+		with_tokens is set).
+	'''
+
+	def __init__(self,
+	             path: str,
+	             with_tokens: bool = False,
+	             row_group_size: int = row_group_size,
+	             compression: str = compression):
+		self.path = path
+		self.schema = get_schema(with_tokens)
+		self.row_group_size = row_group_size
+		self.buffer = {name: [] for name in self.schema.names}  # type: dict
+		self.count = 0
+		folderpath = os.path.dirname(path)
+		if folderpath != "" and not os.path.exists(folderpath):
+			os.makedirs(folderpath)
+		# written to a temporary file and renamed on close, so readers never see
+		# a partial corpus
+		self.path_tmp = path + ".tmp"
+		self.writer = pq.ParquetWriter(self.path_tmp,
+		                               self.schema,
+		                               compression=compression)
+
+	def write(self, article: dict) -> None:
+		for name in self.schema.names:
+			self.buffer[name].append(article[name])
+		self.count += 1
+		if len(self.buffer["id"]) >= self.row_group_size:
+			self.flush()
+
+	def flush(self) -> None:
+		if len(self.buffer["id"]) == 0:
+			return
+		table = pa.Table.from_pydict(self.buffer, schema=self.schema)
+		self.writer.write_table(table, row_group_size=self.row_group_size)
+		self.buffer = {name: [] for name in self.schema.names}
+
+	def close(self) -> None:
+		self.flush()
+		self.writer.close()
+		os.replace(self.path_tmp, self.path)
+
+	def __enter__(self) -> "CorpusWriter":
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		if exc_type is not None:
+			# don't replace an existing corpus with a partial one
+			self.writer.close()
+			os.remove(self.path_tmp)
+			return
+		self.close()
+
+
+def load_article_metadata(path_index: str = path_index) -> dict:
+	'''
+		Returns article id -> (date, title) from the article index
+	'''
+	with open(path_index, "r") as f:
+		index = json.load(f)
+	return {
+	    article_id: (get_date(article["dateCreated"]), article["title"])
+	    for article_id, article in index["articles"].items()
+	}
+
+
+def iter_parsed_articles(metadata: dict,
+                         path_parsed: str = path_parsed) -> Iterator[dict]:
+	'''
+		Yields the parsed articles (which are in the index and not empty) sorted
+		by date
+	'''
+	article_ids = []
+	with os.scandir(path_parsed) as entries:
+		for entry in entries:
+			if entry.name.endswith(".txt"):
+				article_id = entry.name[:-len(".txt")]
+				if article_id in metadata:
+					article_ids.append(article_id)
+	article_ids.sort(
+	    key=lambda article_id: (metadata[article_id][0], article_id))
+	for article_id in article_ids:
+		with open(os.path.join(path_parsed, f"{article_id}.txt"), "r") as f:
+			text = f.read()
+		if len(text.strip()) == 0:
+			continue
+		article_date, title = metadata[article_id]
+		yield {
+		    "id": article_id,
+		    "date": article_date,
+		    "title": title,
+		    "text": text,
+		}
+
+
+def build_corpus(path_corpus: str = path_corpus,
+                 path_index: str = path_index,
+                 path_parsed: str = path_parsed) -> int:
+	'''
+		Builds the corpus from the parsed articles. Returns the number of articles.
+	'''
+	metadata = load_article_metadata(path_index)
+	with CorpusWriter(path_corpus) as writer:
+		for article in iter_parsed_articles(metadata, path_parsed):
+			writer.write(article)
+	return writer.count
+
+
+def get_filters(date_start: Optional[str | date] = None,
+                date_end: Optional[str | date] = None) -> Optional[list]:
+	filters = []
+	if date_start is not None:
+		if isinstance(date_start, str):
+			date_start = date.fromisoformat(date_start)
+		filters.append(("date", ">=", date_start))
+	if date_end is not None:
+		if isinstance(date_end, str):
+			date_end = date.fromisoformat(date_end)
+		filters.append(("date", "<=", date_end))
+	return filters if len(filters) > 0 else None
+
+
+def read_corpus(path: str = path_corpus,
+                columns: Optional[list[str]] = None,
+                date_start: Optional[str | date] = None,
+                date_end: Optional[str | date] = None,
+                article_ids: Optional[list[str]] = None) -> pa.Table:
+	'''
+		Reads (a part of) the corpus - only the given columns, articles from
+		date_start to date_end (inclusive) and / or the given article ids.
+	'''
+	filters = get_filters(date_start, date_end)
+	if article_ids is not None:
+		filters = (filters or []) + [("id", "in", list(article_ids))]
+	return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+
+def iter_corpus(path: str = path_corpus,
+                columns: Optional[list[str]] = None,
+                batch_size: int = row_group_size) -> Iterator[pa.RecordBatch]:
+	'''
+		Yields the corpus in record batches (memory stays bounded by batch_size)
+	'''
+	parquet_file = pq.ParquetFile(path, memory_map=True)
+	yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def get_corpus_info(path: str = path_corpus) -> dict:
+	parquet_file = pq.ParquetFile(path)
+	return {
+	    "articles": parquet_file.metadata.num_rows,
+	    "row_groups": parquet_file.metadata.num_row_groups,
+	    "columns": parquet_file.schema_arrow.names,
+	    "size": os.path.getsize(path),
+	}
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--index", type=str, default=path_index)
+	parser.add_argument("--parsed", type=str, default=path_parsed)
+	parser.add_argument("--output", type=str, default=path_corpus)
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	time_start = time.time()
+	count = build_corpus(args.output, args.index, args.parsed)
+	info = get_corpus_info(args.output)
+	print(
+	    f"Wrote {count} articles to '{args.output}' ({round(info['size'] / 1024 / 1024, 3)} MB, {info['row_groups']} row groups) in {round(time.time() - time_start, 3)}s"
+	)
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
@@ -0,0 +1,314 @@
+'''
+Positional inverted index over the tokenized corpus (see corpus.py and
+tokenizer.py).
+
+Replaces the ngrams / ngrams_search dicts of text-exploration-parsed.ipynb
+(Python sets of article id strings for every 1-3-gram):
+	- articles get dense int32 ids (in corpus order), terms are interned into a
+		sorted vocabulary (looked up with a binary search)
+	- for every term the postings (articles containing it) are stored as
+		delta encoded article ids, for every posting the token positions are
+		stored delta encoded as well - phrases of any length are answered by
+		intersecting positions, no n-gram keys are stored
+	- everything is kept in flat numpy arrays (CSR like offsets + values, the
+		deltas in the narrowest unsigned dtype that fits) saved as .npy files and
+		memory mapped on load
+
+Build:
+	python src/py/analysis/text-mining/inverted_index.py
+
+Query:
+	index = InvertedIndex.load()
+	index.get_article_ids_containing_search_term("chip shortage")
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+
+# Project imports
+sys.path.append(os.getcwd())
+# text-mining isn't a valid package name - import the sibling modules directly
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from corpus import iter_corpus, path_corpus
+from tokenizer import process_query
+
+# Globals
+path_index = "data/scraped/cnet/inverted_index"
+ARRAYS = [
+    "vocabulary", "article_ids", "dates", "term_offsets", "doc_deltas",
+    "posting_offsets", "position_deltas"
+]
+
+
+def get_narrowest_dtype(values: npt.NDArray) -> np.dtype:
+	'''
+		Returns the smallest unsigned dtype which can hold the (non-negative)
+		values
+	'''
+	max_value = int(values.max()) if len(values) > 0 else 0
+	for dtype in [np.uint8, np.uint16, np.uint32]:
+		if max_value <= np.iinfo(dtype).max:
+			return np.dtype(dtype)
+	return np.dtype(np.uint64)
+
+
+def delta_encode(values: npt.NDArray, offsets: npt.NDArray) -> npt.NDArray:
+	'''
+		Delta encodes the values within every segment (values[offsets[i]:
+		offsets[i + 1]]), the first value of a segment is kept as it is
+	'''
+	deltas = np.diff(values, prepend=0)
+	starts = offsets[:-1][offsets[:-1] < offsets[1:]]
+	deltas[starts] = values[starts]
+	return deltas.astype(get_narrowest_dtype(deltas))
+
+
+def delta_decode(deltas: npt.NDArray, offsets: npt.NDArray) -> npt.NDArray:
+	'''
+		Reverses delta_encode for a slice of segments (offsets relative to the
+		slice)
+	'''
+	values = np.cumsum(deltas, dtype=np.int64)
+	lengths = np.diff(offsets)
+	starts = offsets[:-1][lengths > 0]
+	# sum of all previous segments, subtracted from every value of a segment
+	bases = values[starts] - deltas[starts]
+	return values - np.repeat(bases, lengths[lengths > 0])
+
+
+def is_in_sorted(values: npt.NDArray,
+                 sorted_values: npt.NDArray) -> npt.NDArray:
+	'''
+		np.isin for sorted arrays (a binary search per value instead of sorting
+		both arrays)
+	'''
+	if len(sorted_values) == 0:
+		return np.zeros(len(values), dtype=bool)
+	indices = np.searchsorted(sorted_values, values)
+	indices[indices == len(sorted_values)] = 0
+	return sorted_values[indices] == values
+
+
+def build_index(path_corpus: str = path_corpus,
+                path_index: str = path_index) -> dict:
+	'''
+		Builds the index from the tokens column of the corpus and saves it.
+		Returns the index metadata.
+	'''
+	time_start = time.time()
+	term_ids_provisional = {}  # type: dict[str, int]
+	article_ids = []
+	dates = []
+	doc_term_ids = []
+	for batch in iter_corpus(path_corpus, ["id", "date", "tokens"]):
+		columns = batch.to_pydict()
+		article_ids.extend(columns["id"])
+		dates.extend(columns["date"])
+		for tokens in columns["tokens"]:
+			doc_term_ids.append(
+			    np.fromiter((term_ids_provisional.setdefault(
+			        token, len(term_ids_provisional)) for token in tokens),
+			                dtype=np.int32,
+			                count=len(tokens)))
+	lengths = np.array([len(term_ids) for term_ids in doc_term_ids],
+	                   dtype=np.int64)
+	term_ids = np.concatenate(doc_term_ids) if len(doc_term_ids) > 0 else (
+	    np.zeros(0, dtype=np.int32))
+	del doc_term_ids
+	# sorted vocabulary - term id = index in the vocabulary
+	vocabulary = np.array(list(term_ids_provisional.keys()), dtype=np.str_)
+	order = np.argsort(vocabulary, kind="stable")
+	rank = np.empty(len(order), dtype=np.int32)
+	rank[order] = np.arange(len(order), dtype=np.int32)
+	vocabulary = vocabulary[order]
+	term_ids = rank[term_ids]
+	del term_ids_provisional
+	doc_ids = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+	positions = (np.arange(len(term_ids), dtype=np.int64) -
+	             np.repeat(np.cumsum(lengths) - lengths, lengths)).astype(
+	                 np.int32)
+	# tokens are in (doc, position) order - a stable sort by term keeps it
+	order = np.argsort(term_ids, kind="stable")
+	term_ids = term_ids[order]
+	doc_ids = doc_ids[order]
+	positions = positions[order]
+	del order
+	# a posting starts where the term or the document changes
+	is_start = np.ones(len(term_ids), dtype=bool)
+	is_start[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:]
+	                                                  != doc_ids[:-1])
+	posting_starts = np.flatnonzero(is_start)
+	posting_terms = term_ids[posting_starts]
+	posting_docs = doc_ids[posting_starts]
+	term_offsets = np.searchsorted(posting_terms, np.arange(len(vocabulary) +
+	                                                        1)).astype(np.int64)
+	posting_offsets = np.append(posting_starts, len(term_ids)).astype(np.int64)
+	arrays = {
+	    "vocabulary": vocabulary,
+	    "article_ids": np.array(article_ids, dtype=np.str_),
+	    "dates": np.array(dates, dtype="datetime64[D]"),
+	    "term_offsets": term_offsets,
+	    "doc_deltas": delta_encode(posting_docs, term_offsets),
+	    "posting_offsets": posting_offsets,
+	    "position_deltas": delta_encode(positions, posting_offsets),
+	}
+	if not os.path.exists(path_index):
+		os.makedirs(path_index)
+	for name, array in arrays.items():
+		np.save(os.path.join(path_index, f"{name}.npy"), array)
+	metadata = {
+	    "articles": len(article_ids),
+	    "terms": len(vocabulary),
+	    "postings": len(posting_starts),
+	    "tokens": len(term_ids),
+	    "size": sum(array.nbytes for array in arrays.values()),
+	    "time_build": round(time.time() - time_start, 3),
+	}
+	with open(os.path.join(path_index, "metadata.json"), "w") as f:
+		json.dump(metadata, f, indent='\t')
+	return metadata
+
+
+class InvertedIndex:
+	'''
+		Read side of the index (memory mapped arrays).
+	'''
+
+	def __init__(self, arrays: dict, metadata: dict):
+		self.metadata = metadata
+		self.vocabulary = arrays["vocabulary"]
+		self.article_ids = arrays["article_ids"]
+		self.dates = arrays["dates"]
+		self.term_offsets = arrays["term_offsets"]
+		self.doc_deltas = arrays["doc_deltas"]
+		self.posting_offsets = arrays["posting_offsets"]
+		self.position_deltas = arrays["position_deltas"]
+
+	@staticmethod
+	def load(path_index: str = path_index,
+	         mmap_mode: Optional[str] = "r") -> "InvertedIndex":
+		arrays = {
+		    name:
+		        np.load(os.path.join(path_index, f"{name}.npy"),
+		                mmap_mode=mmap_mode) for name in ARRAYS
+		}
+		with open(os.path.join(path_index, "metadata.json"), "r") as f:
+			metadata = json.load(f)
+		return InvertedIndex(arrays, metadata)
+
+	def get_term_id(self, term: str) -> Optional[int]:
+		term_id = int(np.searchsorted(self.vocabulary, term))
+		if term_id < len(self.vocabulary) and self.vocabulary[term_id] == term:
+			return term_id
+		return None
+
+	def get_doc_ids(self, term_id: int) -> npt.NDArray[np.int64]:
+		'''
+			Returns the (sorted) ids of the articles containing the term
+		'''
+		start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+		return np.cumsum(self.doc_deltas[start:end], dtype=np.int64)
+
+	def get_positions(
+	    self, term_id: int, doc_ids: npt.NDArray
+	) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+		'''
+			Returns the (doc id, position) pairs of the term's occurrences in the
+			given (sorted) documents, sorted by doc id and position
+		'''
+		start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+		term_doc_ids = np.cumsum(self.doc_deltas[start:end], dtype=np.int64)
+		offsets = np.asarray(self.posting_offsets[start:end + 1])
+		counts = np.diff(offsets)
+		# only the postings of the given documents are decoded
+		selected = is_in_sorted(term_doc_ids, doc_ids)
+		deltas = np.asarray(self.position_deltas[offsets[0]:offsets[-1]])
+		deltas = deltas[np.repeat(selected, counts)]
+		counts = counts[selected]
+		positions = delta_decode(deltas, np.append(0, np.cumsum(counts)))
+		return np.repeat(term_doc_ids[selected], counts), positions
+
+	def get_term_counts(self, term_id: int) -> npt.NDArray[np.int64]:
+		'''
+			Returns the number of occurrences of the term in each of the articles
+			containing it (in the order of get_doc_ids)
+		'''
+		start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+		return np.diff(self.posting_offsets[start:end + 1])
+
+	def search_counts(
+	    self, terms: tuple[str, ...]
+	) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+		'''
+			Returns the ids of the articles containing the (processed) terms as a
+			phrase and the number of occurrences of the phrase in each of them
+		'''
+		term_ids = [self.get_term_id(term) for term in terms]
+		if len(term_ids) == 0 or any(term_id is None for term_id in term_ids):
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		if len(term_ids) == 1:
+			return self.get_doc_ids(term_ids[0]), self.get_term_counts(term_ids[0])
+		# articles containing all terms (rarest first - smallest intersections)
+		doc_lists = sorted([self.get_doc_ids(term_id) for term_id in term_ids],
+		                   key=len)
+		doc_ids = doc_lists[0]
+		for doc_list in doc_lists[1:]:
+			doc_ids = doc_ids[is_in_sorted(doc_ids, doc_list)]
+		if len(doc_ids) == 0:
+			return doc_ids, np.zeros(0, dtype=np.int64)
+		# phrase: term k must occur at position p + k - keys (doc, p) must be
+		# present for every term
+		keys = None
+		for k, term_id in enumerate(term_ids):
+			occurrence_doc_ids, positions = self.get_positions(term_id, doc_ids)
+			positions = positions - k
+			valid = positions >= 0
+			term_keys = (occurrence_doc_ids[valid] << 32) | positions[valid]
+			keys = term_keys if keys is None else keys[is_in_sorted(keys, term_keys)]
+			if len(keys) == 0:
+				break
+		# keys are sorted - doc ids are too
+		return np.unique(keys >> 32, return_counts=True)
+
+	def search(self, terms: tuple[str, ...]) -> npt.NDArray[np.int64]:
+		'''
+			Returns the ids of the articles containing the (processed) terms as a
+			phrase
+		'''
+		return self.search_counts(terms)[0]
+
+	def get_article_ids_containing_search_term(self,
+	                                           search_term: str) -> list[str]:
+		'''
+			Returns the ids of the articles containing the search term (processed
+			like the article tokens, e.g. "chip shortages" -> "chip shortag")
+		'''
+		doc_ids = self.search(process_query(search_term))
+		return self.article_ids[doc_ids].tolist()
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--corpus", type=str, default=path_corpus)
+	parser.add_argument("--output", type=str, default=path_index)
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	metadata = build_index(args.corpus, args.output)
+	print(json.dumps(metadata, indent='\t'))
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
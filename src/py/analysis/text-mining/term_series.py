@@ -0,0 +1,288 @@
+'''
+Term frequency time series over the article corpus.
+
+text-exploration-parsed.ipynb counts the articles matching a search term per
+day with Python loops over article ids and their dates. Here the counts are
+sparse matrix products:
+	- A: term x article occurrence counts (scipy.sparse CSR) - taken directly
+		from the inverted index (its offsets and postings already are CSR)
+	- P: article x period indicator (every article belongs to the day / week it
+		was created in)
+	- Q: query x article counts - rows of A for single terms, phrase counts
+		from the positional index for n-grams
+	- Q @ P: query x period counts, divided by the number of articles per
+		period (1 @ P) for the share of articles mentioning a term
+
+so hundreds of search terms are counted in one pass and plotted against the
+events in analysis/events.py.
+
+Usage:
+	python src/py/analysis/text-mining/term_series.py --terms "chip shortage" covid --freq W
+'''
+
+import os
+import sys
+import time
+import argparse
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import scipy.sparse as sp
+
+# Project imports
+sys.path.append(os.getcwd())
+# text-mining isn't a valid package name - import the sibling modules directly
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from inverted_index import InvertedIndex, delta_decode, path_index
+from tokenizer import process_query
+
+# Globals
+FREQUENCIES = ["D", "W"]  # days, weeks (ending on Sunday, like pandas' "W")
+date_start = "2019-01-01"
+date_end = "2023-12-31"
+
+
+def get_term_article_matrix(index: InvertedIndex) -> sp.csr_matrix:
+	'''
+		Returns the term x article occurrence count matrix of the index
+	'''
+	term_offsets = np.asarray(index.term_offsets)
+	doc_ids = delta_decode(np.asarray(index.doc_deltas), term_offsets)
+	counts = np.diff(index.posting_offsets)
+	return sp.csr_matrix(
+	    (counts.astype(np.int32), doc_ids.astype(np.int32), term_offsets),
+	    shape=(len(index.vocabulary), len(index.article_ids)))
+
+
+def get_period_ends(dates: npt.NDArray, freq: str) -> npt.NDArray:
+	'''
+		Returns the last day of the period (day / week) of every date
+	'''
+	if freq not in FREQUENCIES:
+		raise ValueError(
+		    f"Invalid frequency '{freq}' (expected one of {FREQUENCIES})")
+	dates = np.asarray(dates, dtype="datetime64[D]")
+	if freq == "D":
+		return dates
+	# 1970-01-05 was a Monday
+	weekdays = (dates - np.datetime64("1970-01-05", "D")).astype(np.int64) % 7
+	return dates + (6 - weekdays)
+
+
+def get_periods(freq: str,
+                date_start: str = date_start,
+                date_end: str = date_end) -> npt.NDArray:
+	'''
+		Returns the (dense) calendar of periods from date_start to date_end
+	'''
+	start, end = get_period_ends(
+	    np.array([date_start, date_end], dtype="datetime64[D]"), freq)
+	step = 1 if freq == "D" else 7
+	return np.arange(start, end + 1, step, dtype="datetime64[D]")
+
+
+def get_article_period_matrix(dates: npt.NDArray,
+                              periods: npt.NDArray,
+                              freq: str,
+                              date_start: str = date_start,
+                              date_end: str = date_end) -> sp.csr_matrix:
+	'''
+		Returns the article x period indicator matrix (articles from outside of
+		date_start - date_end are in no period)
+	'''
+	dates = np.asarray(dates, dtype="datetime64[D]")
+	valid = (dates >= np.datetime64(date_start, "D")) & (dates <= np.datetime64(
+	    date_end, "D"))
+	article_ids = np.flatnonzero(valid)
+	period_ids = np.searchsorted(periods, get_period_ends(dates[valid], freq))
+	return sp.csr_matrix(
+	    (np.ones(len(article_ids), dtype=np.int32), (article_ids, period_ids)),
+	    shape=(len(dates), len(periods)))
+
+
+class TermSeries:
+	'''
+		Counts search terms per period (see get_series)
+	'''
+
+	def __init__(self,
+	             index: InvertedIndex,
+	             freq: str = "W",
+	             date_start: str = date_start,
+	             date_end: str = date_end):
+		self.index = index
+		self.freq = freq
+		self.matrix = get_term_article_matrix(index)
+		self.periods = get_periods(freq, date_start, date_end)
+		self.article_periods = get_article_period_matrix(np.asarray(index.dates),
+		                                                 self.periods, freq,
+		                                                 date_start, date_end)
+		# number of articles per period
+		self.volume = np.asarray(self.article_periods.sum(axis=0)).ravel()
+
+	def get_query_matrix(self, search_terms: list[str]) -> sp.csr_matrix:
+		'''
+			Returns the search term x article occurrence count matrix
+		'''
+		queries = [process_query(search_term) for search_term in search_terms]
+		term_ids = [
+		    self.index.get_term_id(query[0]) if len(query) == 1 else None
+		    for query in queries
+		]
+		# single terms are rows of the term x article matrix
+		rows_single = [
+		    i for i, term_id in enumerate(term_ids) if term_id is not None
+		]
+		selection = sp.csr_matrix(
+		    (np.ones(len(rows_single), dtype=np.int32),
+		     (rows_single, [term_ids[i] for i in rows_single])),
+		    shape=(len(queries), self.matrix.shape[0]))
+		query_matrix = (selection @ self.matrix).tocoo()
+		# phrases are counted with the positional index
+		rows = [query_matrix.row]
+		cols = [query_matrix.col]
+		data = [query_matrix.data]
+		for i, query in enumerate(queries):
+			if len(query) > 1:
+				doc_ids, counts = self.index.search_counts(query)
+				rows.append(np.full(len(doc_ids), i))
+				cols.append(doc_ids)
+				data.append(counts)
+		return sp.csr_matrix((np.concatenate(data).astype(np.int32),
+		                      (np.concatenate(rows), np.concatenate(cols))),
+		                     shape=(len(queries), self.matrix.shape[1]))
+
+	def get_counts(self,
+	               query_matrix: sp.csr_matrix,
+	               binary: bool = True) -> npt.NDArray:
+		'''
+			Returns the query x period counts - articles mentioning the query
+			(binary) or the number of mentions
+		'''
+		if binary:
+			query_matrix = query_matrix.copy()
+			query_matrix.data[:] = 1
+		return (query_matrix @ self.article_periods).toarray()
+
+	def normalize(self, counts: npt.NDArray) -> npt.NDArray:
+		'''
+			Divides the counts by the number of articles per period
+		'''
+		return np.divide(counts,
+		                 self.volume,
+		                 out=np.zeros(counts.shape, dtype=np.float64),
+		                 where=self.volume > 0)
+
+	def get_series(self,
+	               search_terms: list[str],
+	               binary: bool = True,
+	               normalized: bool = True) -> pd.DataFrame:
+		'''
+			Returns a DataFrame (index: period end, columns: search terms) with the
+			number / share of articles mentioning each search term (binary) or the
+			number of mentions (per article)
+		'''
+		counts = self.get_counts(self.get_query_matrix(search_terms), binary)
+		values = self.normalize(counts) if normalized else counts
+		return pd.DataFrame(values.T,
+		                    index=pd.DatetimeIndex(self.periods, name="date"),
+		                    columns=search_terms)
+
+	def get_joint_series(self,
+	                     search_terms: list[str],
+	                     normalized: bool = True) -> pd.Series:
+		'''
+			Returns the number / share of articles mentioning any of the search
+			terms per period
+		'''
+		query_matrix = self.get_query_matrix(search_terms)
+		# articles with at least one match
+		matches = np.zeros(query_matrix.shape[1], dtype=np.int32)
+		matches[query_matrix.indices] = 1
+		counts = self.article_periods.T @ matches
+		values = self.normalize(counts) if normalized else counts
+		return pd.Series(values,
+		                 index=pd.DatetimeIndex(self.periods, name="date"),
+		                 name="any")
+
+	def get_volume(self) -> pd.Series:
+		return pd.Series(self.volume,
+		                 index=pd.DatetimeIndex(self.periods, name="date"),
+		                 name="articles")
+
+
+def get_figure(df: pd.DataFrame,
+               title: str,
+               events: Optional[list] = None,
+               event_groups: Optional[list[str]] = None):
+	'''
+		Plots the series (columns of df) with the events (from analysis/events.py)
+		in their date range
+	'''
+	# plotting dependencies are only needed here
+	from plotly import graph_objects as go
+	from src.py.analysis.yahoo.stocks.finance_df_utils import add_vline_annotation
+	fig = go.Figure()
+	for column in df.columns:
+		fig.add_trace(go.Scatter(x=df.index, y=df[column], name=str(column)))
+	fig.update_layout(title=title)
+	for event in events or []:
+		if event_groups is not None and event.get("group") not in event_groups:
+			continue
+		if not (df.index[0] <= pd.Timestamp(event["date"]) <= df.index[-1]):
+			continue
+		event_copy = event.copy()
+		if "offset" in event_copy:
+			del event_copy["offset"]
+		add_vline_annotation(fig, event_copy)
+	return fig
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--index", type=str, default=path_index)
+	parser.add_argument("--terms",
+	                    type=str,
+	                    nargs="+",
+	                    required=True,
+	                    help="Search terms")
+	parser.add_argument("--freq",
+	                    type=str,
+	                    default="W",
+	                    choices=FREQUENCIES,
+	                    help="Period (days or weeks)")
+	parser.add_argument("--start", type=str, default=date_start)
+	parser.add_argument("--end", type=str, default=date_end)
+	parser.add_argument("--mentions",
+	                    action="store_true",
+	                    help="Count mentions instead of articles")
+	parser.add_argument("--output",
+	                    type=str,
+	                    default=None,
+	                    help="CSV file for the (normalized) series")
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	time_start = time.time()
+	term_series = TermSeries(InvertedIndex.load(args.index), args.freq,
+	                         args.start, args.end)
+	print(f"Loaded matrices in {round(time.time() - time_start, 3)}s")
+	time_start = time.time()
+	df = term_series.get_series(args.terms, binary=not args.mentions)
+	print(
+	    f"Counted {len(args.terms)} search terms in {round(time.time() - time_start, 3)}s"
+	)
+	print(df.describe().T)
+	if args.output is not None:
+		df.to_csv(args.output)
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
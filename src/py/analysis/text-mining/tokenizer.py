@@ -0,0 +1,242 @@
+'''
+Tokenization of the parsed articles.
+
+Produces the same tokens as get_clean_tokens in merge-parsed-articles.ipynb
+(word_tokenize -> remove stopwords -> lowercase + Porter stem -> keep
+alphanumeric tokens), but:
+	- the stopwords are loaded once per process into a frozenset
+	- there is one stemmer per process and stems are memoized (LRU) - the
+		vocabulary is tiny compared to the number of tokens, so almost every
+		token is a cache hit
+	- articles are tokenized in a process pool, in chunks, and the tokens are
+		streamed into the corpus (tokens column, see corpus.py) batch by batch
+
+Usage:
+	python src/py/analysis/text-mining/tokenizer.py --jobs 8
+	python src/py/analysis/text-mining/tokenizer.py --benchmark --limit 2000
+'''
+
+import os
+import sys
+import time
+import argparse
+import functools
+import multiprocessing
+from typing import Optional
+import nltk
+
+# Project imports
+sys.path.append(os.getcwd())
+# text-mining isn't a valid package name - import the sibling modules directly
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from corpus import CorpusWriter, iter_corpus, path_corpus
+
+# Globals
+jobs = max(1, (os.cpu_count() or 2) - 1)
+chunksize = 50  # articles per task
+batch_size = 2000  # articles read from the corpus (and written) at once
+stem_cache_size = 2**20
+stemmer = nltk.stem.PorterStemmer()
+stopwords = None  # type: Optional[frozenset[str]]
+word_tokenize = nltk.word_tokenize
+
+
+def get_stopwords() -> frozenset[str]:
+	global stopwords
+	if stopwords is None:
+		stopwords = frozenset(nltk.corpus.stopwords.words('english'))
+	return stopwords
+
+
+@functools.lru_cache(maxsize=stem_cache_size)
+def stem(token: str) -> str:
+	'''
+		Lowercases and stems a token (memoized)
+	'''
+	return stemmer.stem(token.lower())
+
+
+def get_clean_tokens(text: str) -> list[str]:
+	'''
+		Returns the tokens of a text
+	'''
+	stopwords = get_stopwords()
+	tokens = []
+	for token in word_tokenize(text):
+		# stopwords are removed before lowercasing (same as the notebook)
+		if token in stopwords:
+			continue
+		token = stem(token)
+		# remove punctuation
+		if token.isalnum():
+			tokens.append(token)
+	return tokens
+
+
+def process_word(word: str) -> str:
+	'''
+		Processes a query word the same way as the article tokens
+	'''
+	word = stem(word)
+	if not word.isalnum():
+		raise ValueError(f"Word '{word}' is not alphanumeric")
+	return word
+
+
+def process_query(search_term: str) -> tuple[str, ...]:
+	'''
+		"Chip shortages" -> ("chip", "shortag")
+	'''
+	return tuple(process_word(word) for word in search_term.split(" "))
+
+
+def tokenize_texts(texts: list[str]) -> list[list[str]]:
+	return [get_clean_tokens(text) for text in texts]
+
+
+def get_chunks(items: list, size: int) -> list[list]:
+	return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def tokenize_corpus(path_input: str = path_corpus,
+                    path_output: str = path_corpus,
+                    jobs: int = jobs,
+                    chunksize: int = chunksize) -> int:
+	'''
+		Tokenizes the articles of the corpus and writes the corpus with a tokens
+		column (path_output may be the same as path_input - the output is only
+		renamed into place when it's complete). Returns the number of articles.
+	'''
+	count = 0
+	time_start = time.time()
+	pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+	try:
+		with CorpusWriter(path_output, with_tokens=True) as writer:
+			for batch in iter_corpus(path_input, ["id", "date", "title", "text"],
+			                         batch_size):
+				columns = batch.to_pydict()
+				chunks = get_chunks(columns["text"], chunksize)
+				if pool is not None:
+					results = pool.map(tokenize_texts, chunks)
+				else:
+					results = map(tokenize_texts, chunks)
+				tokens = [
+				    article_tokens for chunk in results for article_tokens in chunk
+				]
+				for i in range(len(tokens)):
+					writer.write({
+					    "id": columns["id"][i],
+					    "date": columns["date"][i],
+					    "title": columns["title"][i],
+					    "text": columns["text"][i],
+					    "tokens": tokens[i],
+					})
+				count += len(tokens)
+				elapsed = time.time() - time_start
+				print(
+				    f"Tokenized {count} articles ({round(count / elapsed, 3)} articles/s)"
+				)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	return count
+
+
+def get_clean_tokens_notebook(text: str) -> list:
+	'''
+		get_clean_tokens from merge-parsed-articles.ipynb (for the benchmark)
+	'''
+	# Tokenize
+	tokens = word_tokenize(text)
+	# Remove stopwords
+	stopwords_set = set(nltk.corpus.stopwords.words('english'))
+	tokens = [token for token in tokens if token not in stopwords_set]
+	# Stem
+	stemmer = nltk.stem.PorterStemmer()
+	tokens = [stemmer.stem(token.lower()) for token in tokens]
+	# Remove punctuation
+	tokens = [token for token in tokens if token.isalnum()]
+	return tokens
+
+
+def benchmark(path_input: str = path_corpus,
+              limit: int = 2000,
+              jobs: int = jobs) -> None:
+	'''
+		Compares the notebook's per article loop with the memoized tokenizer
+		(serial and in a process pool) on the first limit articles
+	'''
+	texts = []
+	for batch in iter_corpus(path_input, ["text"], batch_size):
+		texts.extend(batch.column("text").to_pylist())
+		if len(texts) >= limit:
+			break
+	texts = texts[:limit]
+	print(f"{len(texts)} articles")
+	time_start = time.perf_counter()
+	tokens_notebook = [get_clean_tokens_notebook(text) for text in texts]
+	time_notebook = time.perf_counter() - time_start
+	print(f"{'notebook loop':>24}: {time_notebook:.3f}s")
+	stem.cache_clear()
+	time_start = time.perf_counter()
+	tokens_memoized = tokenize_texts(texts)
+	time_memoized = time.perf_counter() - time_start
+	info = stem.cache_info()
+	print(
+	    f"{'memoized':>24}: {time_memoized:.3f}s ({time_notebook / time_memoized:.2f}x, stem cache hit rate {info.hits / max(1, info.hits + info.misses):.3f})"
+	)
+	if jobs > 1:
+		time_start = time.perf_counter()
+		with multiprocessing.Pool(jobs) as pool:
+			results = pool.map(tokenize_texts, get_chunks(texts, chunksize))
+		tokens_pool = [
+		    article_tokens for chunk in results for article_tokens in chunk
+		]
+		time_pool = time.perf_counter() - time_start
+		print(
+		    f"{f'memoized, {jobs} processes':>24}: {time_pool:.3f}s ({time_notebook / time_pool:.2f}x)"
+		)
+		assert tokens_pool == tokens_notebook
+	assert tokens_memoized == tokens_notebook
+	print("Tokens are identical.")
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--input", type=str, default=path_corpus)
+	parser.add_argument("--output", type=str, default=path_corpus)
+	parser.add_argument("--jobs",
+	                    type=int,
+	                    default=jobs,
+	                    help="Number of tokenizer processes")
+	parser.add_argument("--chunksize",
+	                    type=int,
+	                    default=chunksize,
+	                    help="Articles per task")
+	parser.add_argument("--benchmark",
+	                    action="store_true",
+	                    help="Compare with the notebook's tokenization")
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=2000,
+	                    help="Number of articles for the benchmark")
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	if args.benchmark:
+		benchmark(args.input, args.limit, args.jobs)
+		return
+	time_start = time.time()
+	count = tokenize_corpus(args.input, args.output, args.jobs, args.chunksize)
+	print(f"Tokenized {count} articles in {round(time.time() - time_start, 3)}s")
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
@@ -0,0 +1,231 @@
+'''
+Batch extraction of the CamelCamelCamel charts (data/scraped/camel/charts).
+
+get_image_data OCRs the whole chart with a new tesseract process per image,
+although only the axis labels have text. Here:
+	- the geometry (axis, gridlines) is found first and only the label strips
+		left of the y axis and below the x axis (right of the y axis) are
+		OCR-ed - stacked into one image, upscaled, with a whitelist of digits,
+		"$" and month names (see get_text_data_cropped in chart_to_data.py)
+	- the charts are processed by a pool of worker processes. Every worker
+		keeps its own tesseract engine loaded (tesserocr) for all of its charts.
+		Without tesserocr the workers fall back to pytesseract (a tesseract
+		process per chart, like get_image_data)
+	- the extracted data points are written to data/scraped/camel/charts-data
+		(one JSON per chart)
+
+Usage:
+	python src/py/scraping/camel/chart_ocr_batch.py --jobs 8 --line new
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from typing import Optional
+import numpy as np
+
+try:
+	import tesserocr
+except ImportError:
+	tesserocr = None
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.camel import chart_to_data as ctd
+
+# Globals
+path_charts = "data/scraped/camel/charts"
+path_output = "data/scraped/camel/charts-data"
+jobs = max(1, (os.cpu_count() or 2) - 1)
+chunksize = 4  # charts handed to a worker at once
+LINE_COLORS = {
+    "amazon": ctd.color_line_amazon,
+    "new": ctd.color_line_new,
+    "used": ctd.color_line_used,
+}
+ocr_api = None  # tesseract engine of the worker process (tesserocr)
+
+
+def init_worker() -> None:
+	'''
+		Loads the tesseract engine of a worker process (once)
+	'''
+	global ocr_api
+	if tesserocr is None:
+		return
+	ocr_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_BLOCK,
+	                                  oem=tesserocr.OEM.DEFAULT)
+	ocr_api.SetVariable("tessedit_char_whitelist", ctd.ocr_whitelist)
+
+
+def ocr_tesserocr(gray: np.ndarray) -> dict:
+	'''
+		OCR of a (grayscale) image of the label strips with the worker's
+		tesseract engine. Returns the words like pytesseract's image_to_data.
+	'''
+	assert ocr_api is not None and tesserocr is not None
+	height, width = gray.shape
+	gray = np.ascontiguousarray(gray)
+	ocr_api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+	ocr_api.Recognize()
+	text_data = {key: [] for key in ctd.TEXT_DATA_KEYS}  # type: dict
+	iterator = ocr_api.GetIterator()
+	if iterator is None:
+		return text_data
+	level = tesserocr.RIL.WORD
+	for word in tesserocr.iterate_level(iterator, level):
+		text = word.GetUTF8Text(level)
+		box = word.BoundingBox(level)
+		if text is None or box is None:
+			continue
+		left, top, right, bottom = box
+		text_data["text"].append(text)
+		text_data["conf"].append(int(word.Confidence(level)))
+		text_data["left"].append(left)
+		text_data["top"].append(top)
+		text_data["width"].append(right - left)
+		text_data["height"].append(bottom - top)
+	return text_data
+
+
+def get_chart_data(img: np.ndarray,
+                   line_color: tuple,
+                   full_ocr: bool = False) -> dict:
+	'''
+		Extracts the data of a chart, OCR-ing only the label strips (or the whole
+		image if full_ocr, like get_image_data)
+	'''
+	labels = ctd.label_image(img)
+	geometry = ctd.get_image_geometry(img, labels)
+	text_data = None
+	if not full_ocr:
+		ocr = ocr_tesserocr if ocr_api is not None else ctd.ocr_pytesseract
+		text_data = ctd.get_text_data_cropped(img, geometry, ocr)
+	return ctd.get_image_data(img, line_color, geometry, text_data, labels)
+
+
+def process_chart(
+    task: tuple[str, str, str, bool]) -> tuple[str, Optional[str]]:
+	'''
+		Extracts the data of a chart file and writes it to the output folder.
+		Returns the filename and the error (if any).
+	'''
+	filepath, folderpath_output, line, full_ocr = task
+	filename = os.path.basename(filepath)
+	try:
+		img = ctd.load_image(filepath)
+		data = get_chart_data(img, LINE_COLORS[line], full_ocr)
+		result = {
+		    "file": filename,
+		    "line": line,
+		    "bounding_box": {
+		        k: int(v) for k, v in data["bounding_box"].items()
+		    },
+		    "x_seconds_per_pixel": data["x_seconds_per_pixel"],
+		    "y_dollars_per_pixel": data["y_dollars_per_pixel"],
+		    "xs": [x.isoformat() for x in data["plot_data"]["xs"]],
+		    "ys": data["plot_data"]["ys"],
+		}
+		path_result = os.path.join(folderpath_output,
+		                           filename.replace(".png", f"-{line}.json"))
+		with open(path_result, "w") as f:
+			json.dump(result, f)
+	except Exception as e:
+		# charts without a line, unreadable labels, write errors etc.
+		return filename, repr(e)
+	return filename, None
+
+
+def get_chart_files(path_charts: str = path_charts,
+                    limit: Optional[int] = None) -> list[str]:
+	filenames = sorted(
+	    f for f in os.listdir(path_charts)
+	    if f.endswith(".png") and not f.endswith("-reconstructed.png"))
+	return [os.path.join(path_charts, f) for f in filenames[:limit]]
+
+
+def process_charts(filepaths: list[str],
+                   folderpath_output: str = path_output,
+                   line: str = "new",
+                   full_ocr: bool = False,
+                   jobs: int = jobs) -> list[tuple[str, str]]:
+	'''
+		Processes the charts in parallel. Returns the failed charts with their
+		errors.
+	'''
+	if not os.path.exists(folderpath_output):
+		os.makedirs(folderpath_output)
+	tasks = [
+	    (filepath, folderpath_output, line, full_ocr) for filepath in filepaths
+	]
+	fails = []
+	time_start = time.time()
+	pool = None
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs, initializer=init_worker)
+		results = pool.imap_unordered(process_chart, tasks, chunksize)
+	else:
+		init_worker()
+		results = map(process_chart, tasks)
+	try:
+		for i, (filename, error) in enumerate(results):
+			if error is not None:
+				fails.append((filename, error))
+			if (i + 1) % 100 == 0 or i + 1 == len(tasks):
+				elapsed = time.time() - time_start
+				print(
+				    f"[{i + 1}/{len(tasks)}] {round((i + 1) / elapsed, 2)} images/s ({len(fails)} failed)"
+				)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	return fails
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--charts", type=str, default=path_charts)
+	parser.add_argument("--output", type=str, default=path_output)
+	parser.add_argument("--line",
+	                    type=str,
+	                    default="new",
+	                    choices=list(LINE_COLORS.keys()),
+	                    help="Chart line to extract")
+	parser.add_argument("--jobs", type=int, default=jobs)
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=None,
+	                    help="Max. number of charts")
+	parser.add_argument("--full-ocr",
+	                    action="store_true",
+	                    help="OCR the whole image (for comparison)")
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	filepaths = get_chart_files(args.charts, args.limit)
+	print(
+	    f"Processing {len(filepaths)} charts with {args.jobs} jobs ({'tesserocr' if tesserocr is not None else 'pytesseract'})..."
+	)
+	time_start = time.time()
+	fails = process_charts(filepaths, args.output, args.line, args.full_ocr,
+	                       args.jobs)
+	elapsed = time.time() - time_start
+	print(
+	    f"Processed {len(filepaths)} charts in {round(elapsed, 3)}s ({round(len(filepaths) / max(elapsed, 1e-9), 2)} images/s, {len(fails)} failed)"
+	)
+	for filename, error in fails[:10]:
+		print(f"Failed: {filename} ({error})")
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
@@ -8,6 +8,12 @@
 
 	The main function you might be interested in is get_image_data(img)
 	which takes an image and returns a dict with all the extracted data
+
+	The geometry (axis, gridlines, price lines and the chart line) is found on
+	a label image - every pixel is packed into a uint32 RGB key and mapped to
+	the index of its chart color (see CHART_COLORS) with one lookup, so the
+	image is scanned once instead of once per color. Lines are found by
+	counting the matching pixels of every row / column (count_mask).
 '''
 
 # TODO: make inverse functions - from values to pixels (for later (visual) verification of the extracted data)
@@ -16,6 +22,7 @@
 # imports
 import time
 import re
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Optional, Union
 import cv2 as cv
@@ -38,6 +45,23 @@ color_line_used = (204, 51, 0)
 color_price_highest = (194, 68, 68)
 color_price_lowest = (119, 195, 107)
 confidence = 80  # pytesseract confidence level
+# OCR of the cropped axis label strips (see get_text_data_cropped)
+ocr_scale = 3  # upscaling of the strips (the labels are only ~10px high)
+ocr_margin = 10  # pixels around the strips
+ocr_gap = 20  # blank pixels between the stacked strips
+# month labels of the x axis (all 12 - "months" above is missing "oct")
+month_names = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct",
+    "Nov", "Dec"
+]
+ocr_whitelist = "$0123456789,." + "".join(
+    sorted(
+        set("".join(month_names).lower()) | set("".join(month_names).upper())))
+TEXT_DATA_KEYS = ["text", "conf", "left", "top", "width", "height"]
+# colors which are labeled by label_image (label = index + 1, 0 = other)
+CHART_COLORS = (color_axis, color_gridline_major, color_gridline_minor,
+                color_line_amazon, color_line_new, color_line_used,
+                color_price_highest, color_price_lowest)
 
 #
 '''
@@ -82,15 +106,88 @@ def mask_image(img: np.ndarray,
 		Returns a masked image where only the pixels of the specified color are kept.
 		If two colors are specified, the pixels between the two colors are kept.
 	'''
-	img_copy = img.copy()
 	if color_range is None:
 		color_range = color
-	img_masked = cv.inRange(img_copy, np.array(color), np.array(color_range))
+	img_masked = cv.inRange(img, np.array(color), np.array(color_range))
 	return img_masked
 
 
+def get_color_key(color: tuple) -> int:
+	'''
+		Packs an RGB color into a single integer (the bytes of the pixel read as a
+		little endian uint32 - 0x00BBGGRR)
+	'''
+	return int(color[0]) | (int(color[1]) << 8) | (int(color[2]) << 16)
+
+
+def pack_image(img: np.ndarray) -> np.ndarray:
+	'''
+		Packs the pixels of an RGB image into uint32 keys (see get_color_key)
+	'''
+	if img.shape[2] == 4:
+		img = cv.cvtColor(img, cv.COLOR_RGBA2RGB)
+	# adding the 4th byte (alpha) lets the pixels be viewed as uint32 - much
+	# faster than shifting and or-ing the channels
+	packed = cv.cvtColor(img, cv.COLOR_RGB2RGBA).view("<u4")[:, :, 0]
+	packed &= 0xFFFFFF
+	return packed
+
+
+@lru_cache(maxsize=4)
+def get_label_lookup(colors: tuple = CHART_COLORS) -> np.ndarray:
+	'''
+		Returns the packed color -> label lookup table (16M entries, built once)
+	'''
+	lookup = np.zeros(1 << 24, dtype=np.uint8)
+	for i, color in enumerate(colors):
+		lookup[get_color_key(color)] = i + 1
+	return lookup
+
+
+def label_image(img: np.ndarray, colors: tuple = CHART_COLORS) -> np.ndarray:
+	'''
+		Returns an image of color labels - the pixels of colors[i] are labeled
+		i + 1, all other pixels 0
+
+		The labels are stored column by column (Fortran order), so the masks
+		taken from them can be scanned per column (get_vertical_pixel_indices)
+		without copying.
+	'''
+	labels = np.take(get_label_lookup(colors), pack_image(img))
+	# the transpose of a transposed copy (faster than np.asfortranarray)
+	return cv.transpose(labels).T
+
+
+def get_color_mask(img: np.ndarray,
+                   labels: np.ndarray,
+                   color: tuple,
+                   colors: tuple = CHART_COLORS) -> np.ndarray:
+	'''
+		Returns the (boolean) mask of a color from the label image (colors which
+		aren't labeled are masked from img)
+	'''
+	if color not in colors:
+		return mask_image(img, color) != 0
+	return labels == colors.index(color) + 1
+
+
+def count_mask(mask: np.ndarray, axis: int) -> np.ndarray:
+	'''
+		Returns the number of True pixels of a boolean mask along an axis (like
+		mask.sum(axis), cv.reduce is several times faster than numpy's sum of
+		booleans)
+	'''
+	if mask.flags.f_contiguous and not mask.flags.c_contiguous:
+		# masks of the (Fortran order) label image - reduce the transpose
+		mask, axis = mask.T, 1 - axis
+	mask = np.ascontiguousarray(mask).view(np.uint8)
+	return cv.reduce(mask, axis, cv.REDUCE_SUM, dtype=cv.CV_32S).ravel()
+
+
 # Key algo for getting chart line coordinates
-def get_vertical_pixel_indices(img: np.ndarray, line_color: tuple) -> list:
+def get_vertical_pixel_indices(img: np.ndarray,
+                               line_color: tuple,
+                               mask: Optional[np.ndarray] = None) -> list:
 	'''
 		Returns a list (length is same as img) where each element is a an index
 		of the center of the first and last non-zero pixel in the column (vertical pixel line)
@@ -99,60 +196,54 @@ def get_vertical_pixel_indices(img: np.ndarray, line_color: tuple) -> list:
 		Useful for getting the averaged coordinates of the chart line.
 		Example: element in list at index 3 has a value of 5 -> (3, 5) ; (x, y) ; (width_i, height_i) of the image
 		The coordinate system for images starts at the top left corner of the image.
+
+		The mask of the line color can be passed instead of computing it from img.
 	'''
-	img_copy = img.copy()
-	# Mask the image to only keep the line color
-	img_masked = mask_image(img_copy, line_color)
-	vertical_pixel_indices = []
-	# transpose the array to make it easier to loop through each column (now row)
-	# loop through each row
-	for i, row in enumerate(img_masked.T):
-		# Find the indices of the non-zero elements
-		nz_indices = np.nonzero(row)[0]
-		# If there are no non-zero elements, add -1 to the list
-		if len(nz_indices) == 0:
-			vertical_pixel_indices.append(-1)
-			continue
-		# Find the first and last non-zero indices
-		first_nz_index = nz_indices[0]
-		last_nz_index = nz_indices[-1]
-		# Find the average of the first and last non-zero indices
-		avg_nz_index = (first_nz_index + last_nz_index) / 2
-		# Get the integer part of the average index
-		avg_nz_index = int(avg_nz_index)
-		# Add the average index to the list
-		vertical_pixel_indices.append(avg_nz_index)
-	# return the list
-	return vertical_pixel_indices
+	if mask is None:
+		# Mask the image to only keep the line color
+		mask = mask_image(img, line_color)
+	if mask.dtype != bool:
+		mask = mask != 0
+	height = mask.shape[0]
+	# first and last non-zero pixel of every column (argmax finds the first True)
+	first_nz_indices = np.argmax(mask, axis=0)
+	if mask.flags.f_contiguous and not mask.flags.c_contiguous:
+		# scanning the reversed view is slow - flip the (contiguous) columns
+		mask_reversed = cv.flip(mask.T.view(np.uint8), 1).T
+	else:
+		mask_reversed = mask[::-1]
+	last_nz_indices = height - 1 - np.argmax(mask_reversed, axis=0)
+	# integer part of the average of the first and last non-zero indices
+	vertical_pixel_indices = (first_nz_indices + last_nz_indices) // 2
+	# columns without non-zero elements
+	vertical_pixel_indices[count_mask(mask, 0) == 0] = -1
+	return vertical_pixel_indices.tolist()
 
 
 def get_line_indices_generic(img: np.ndarray,
                              is_horizontal: bool,
                              color: tuple,
-                             match_threshold: float = 0.2) -> list:
+                             match_threshold: float = 0.2,
+                             mask: Optional[np.ndarray] = None) -> list:
 	'''
 		Find the indices of the lines in the image.
 		Returns tuples of (index, match_count) where match_count is
 		the number of pixels in that line that match the specified color.
+
+		The mask of the color can be passed instead of computing it from img.
 	'''
-	# mask the image
-	img_mask = mask_image(img, color)
-	# show(img_mask)
-	scanline = None
-	# generate scanline
-	if is_horizontal:
-		scanline = np.logical_not(np.zeros(img_mask.shape[1]))
-	else:
-		scanline = np.logical_not(np.zeros(img_mask.shape[0]))
-	matches_indices = []
-	# loop through each row and use logical and to find the number of matches
-	img_mask = img_mask if is_horizontal else img_mask.T
-	for i, row in enumerate(img_mask):
-		match_count = np.sum(np.logical_and(row, scanline))
-		match_ratio = match_count / img_mask.shape[1]
-		if match_ratio > match_threshold:
-			matches_indices.append((i, match_count))
-	return matches_indices
+	if mask is None:
+		# mask the image
+		mask = mask_image(img, color)
+	# show(mask)
+	# number of matches in every row (horizontal) / column (vertical)
+	axis = 1 if is_horizontal else 0
+	if mask.dtype != bool:
+		mask = mask != 0
+	match_counts = count_mask(mask, axis)
+	match_ratios = match_counts / mask.shape[axis]
+	indices = np.flatnonzero(match_ratios > match_threshold)
+	return list(zip(indices.tolist(), match_counts[indices].tolist()))
 
 
 def line_indice_tuples_to_list(line_indice_tuples: list) -> list:
@@ -225,18 +316,20 @@ def tesseract_data_object_to_list_of_objects(data: dict) -> list:
 '''
 
 
-def get_axis_locations(img: np.ndarray, color: tuple = color_axis) -> tuple:
+def get_axis_locations(img: np.ndarray,
+                       color: tuple = color_axis,
+                       mask: Optional[np.ndarray] = None) -> tuple:
 	'''
 			Returns the x and y axis locations of the image.
 		'''
 	# Get x axis location
-	x_indices = get_line_indices_generic(img, True, color, 0.2)
+	x_indices = get_line_indices_generic(img, True, color, 0.2, mask)
 	x_indices_best = get_line_indices_best_matches(x_indices)
 	x_indices_consecutive = get_consecutive_elements(x_indices_best)
 	x_indices_merged = merge_consecutive_elements(x_indices_consecutive)
 	x_index = int(np.average(x_indices_merged))
 	# Get y axis location
-	y_indices = get_line_indices_generic(img, False, color, 0.2)
+	y_indices = get_line_indices_generic(img, False, color, 0.2, mask)
 	y_indices_best = get_line_indices_best_matches(y_indices)
 	y_indices_consecutive = get_consecutive_elements(y_indices_best)
 	y_indices_merged = merge_consecutive_elements(y_indices_consecutive)
@@ -245,16 +338,17 @@ def get_axis_locations(img: np.ndarray, color: tuple = color_axis) -> tuple:
 
 
 def get_major_grid_locations(img: np.ndarray,
-                             color: tuple = color_gridline_major) -> tuple:
+                             color: tuple = color_gridline_major,
+                             mask: Optional[np.ndarray] = None) -> tuple:
 	'''
 		Find the locations of vertical and horizontal major gridlines in the image.
 	'''
-	lines_horizontal = get_line_indices_generic(img, True, color, 0.2)
+	lines_horizontal = get_line_indices_generic(img, True, color, 0.2, mask)
 	lines_horizontal = line_indice_tuples_to_list(lines_horizontal)
 	lines_horizontal_consecutive = get_consecutive_elements(lines_horizontal)
 	lines_horizontal_merged = merge_consecutive_elements(
 	    lines_horizontal_consecutive)
-	lines_vertical = get_line_indices_generic(img, False, color, 0.2)
+	lines_vertical = get_line_indices_generic(img, False, color, 0.2, mask)
 	lines_vertical = line_indice_tuples_to_list(lines_vertical)
 	lines_vertical_consecutive = get_consecutive_elements(lines_vertical)
 	lines_vertical_merged = merge_consecutive_elements(
@@ -263,13 +357,14 @@ def get_major_grid_locations(img: np.ndarray,
 
 
 def get_rightmost_minor_gridline(img: np.ndarray,
-                                 color: tuple = color_gridline_minor) -> int:
+                                 color: tuple = color_gridline_minor,
+                                 mask: Optional[np.ndarray] = None) -> int:
 	'''
 		Find the location of the rightmost minor gridline in the image.
 		Also serves as the right side of the bounding box for the graph (line chart).
 	'''
 	# Get all of the minor gridlines (vertical)
-	lines_x = get_line_indices_generic(img, False, color, 0.2)
+	lines_x = get_line_indices_generic(img, False, color, 0.2, mask)
 	lines_x = line_indice_tuples_to_list(lines_x)
 	# Get the rightmost minor gridline
 	rightmost_minor_gridline = max(lines_x)
@@ -277,11 +372,12 @@ def get_rightmost_minor_gridline(img: np.ndarray,
 
 
 def get_max_price_index(img: np.ndarray,
-                        color: tuple = color_price_highest) -> int:
+                        color: tuple = color_price_highest,
+                        mask: Optional[np.ndarray] = None) -> int:
 	'''
 		Returns the index of the horizonal line representing the highest price.
 	'''
-	possible_indices = get_line_indices_generic(img, True, color, 0.2)
+	possible_indices = get_line_indices_generic(img, True, color, 0.2, mask)
 	possible_indices_best = get_line_indices_best_matches(possible_indices)
 	possible_indices_consecutive = get_consecutive_elements(
 	    possible_indices_best)
@@ -292,11 +388,12 @@ def get_max_price_index(img: np.ndarray,
 
 
 def get_min_price_index(img: np.ndarray,
-                        color: tuple = color_price_lowest) -> int:
+                        color: tuple = color_price_lowest,
+                        mask: Optional[np.ndarray] = None) -> int:
 	'''
 		Returns the index of the horizonal line representing the lowest price.
 	'''
-	possible_indices = get_line_indices_generic(img, True, color, 0.2)
+	possible_indices = get_line_indices_generic(img, True, color, 0.2, mask)
 	possible_indices_best = get_line_indices_best_matches(possible_indices)
 	possible_indices_consecutive = get_consecutive_elements(
 	    possible_indices_best)
@@ -372,8 +469,7 @@ def get_text_data(img: np.ndarray) -> dict:
 	'''
 		Get the text data from the image.
 	'''
-	img_copy = img.copy()
-	gray = cv.cvtColor(img_copy, cv.COLOR_BGR2GRAY)
+	gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
 	# show(gray)
 	text_data = pytesseract.image_to_data(
 	    gray, output_type=Output.DICT,
@@ -381,6 +477,107 @@ def get_text_data(img: np.ndarray) -> dict:
 	return text_data
 
 
+def get_ocr_config(whitelist: str = ocr_whitelist) -> str:
+	'''
+		Returns the tesseract config for the label strips (only digits, "$" and
+		the letters of month names are recognized)
+	'''
+	return f"--psm 6 --oem 3 -c tessedit_char_whitelist={whitelist}"
+
+
+def get_label_strips(img: np.ndarray, geometry: dict) -> list:
+	'''
+		Returns the parts of the image with the axis labels as (left, top, crop)
+		tuples - the strip left of the y axis (prices) and the strip below the x
+		axis right of the y axis (months and years). The plot area has no text.
+	'''
+	height, width = img.shape[:2]
+	x_axis_location = geometry["x_axis_location"]
+	y_axis_location = geometry["y_axis_location"]
+	# the lowest price label can be centered on the x axis
+	bottom = min(height, x_axis_location + ocr_margin)
+	# below the axis line and right of the y axis (the strips don't overlap)
+	top = min(height, x_axis_location + 2)
+	return [
+	    (0, 0, img[0:bottom, 0:y_axis_location]),
+	    (y_axis_location, top, img[top:height, y_axis_location:width]),
+	]
+
+
+def ocr_pytesseract(gray: np.ndarray) -> dict:
+	'''
+		OCR of a (grayscale) image of the label strips with pytesseract (a
+		tesseract process per call)
+	'''
+	return pytesseract.image_to_data(gray,
+	                                 output_type=Output.DICT,
+	                                 config=get_ocr_config())
+
+
+def stack_label_strips(img: np.ndarray,
+                       strips: list,
+                       gap: int = ocr_gap) -> tuple[np.ndarray, list]:
+	'''
+		Stacks the (grayscale) label strips into a single image (white
+		background, gap rows between the strips) so all labels are OCR-ed at
+		once. Returns the image and the (row in the stack, strip) pairs.
+	'''
+	strips = [strip for strip in strips if strip[2].size > 0]
+	width = max([left + crop.shape[1] for left, _, crop in strips], default=0)
+	height = sum(crop.shape[0] for _, _, crop in strips)
+	height += gap * max(0, len(strips) - 1)
+	stack = np.full((height, width), 255, dtype=np.uint8)
+	offsets = []
+	row = 0
+	for left, top, crop in strips:
+		crop_height, crop_width = crop.shape[:2]
+		stack[row:row + crop_height,
+		      left:left + crop_width] = cv.cvtColor(crop, cv.COLOR_BGR2GRAY)
+		offsets.append((row, (left, top, crop)))
+		row += crop_height + gap
+	return stack, offsets
+
+
+def get_text_data_cropped(img: np.ndarray,
+                          geometry: dict,
+                          ocr=ocr_pytesseract,
+                          scale: int = ocr_scale) -> dict:
+	'''
+		Get the text data of the axis labels only (see get_label_strips). The
+		strips are stacked into one image (see stack_label_strips), upscaled and
+		OCR-ed with a single ocr call. The boxes are mapped back to the
+		coordinates of the image. ocr takes a grayscale image and returns a dict
+		like pytesseract's image_to_data (with at least TEXT_DATA_KEYS).
+	'''
+	text_data = {key: [] for key in TEXT_DATA_KEYS}  # type: dict
+	stack, offsets = stack_label_strips(img, get_label_strips(img, geometry))
+	if stack.size == 0:
+		return text_data
+	stack = cv.resize(stack,
+	                  None,
+	                  fx=scale,
+	                  fy=scale,
+	                  interpolation=cv.INTER_CUBIC)
+	stack_data = ocr(stack)
+	for i in range(len(stack_data["text"])):
+		box_top = int(stack_data["top"][i]) // scale
+		box_height = int(stack_data["height"][i]) // scale
+		center = box_top + box_height / 2
+		# the strip the box is in (boxes in the gaps are dropped)
+		for row, (left, top, crop) in offsets:
+			if row <= center < row + crop.shape[0]:
+				break
+		else:
+			continue
+		text_data["text"].append(stack_data["text"][i])
+		text_data["conf"].append(stack_data["conf"][i])
+		text_data["left"].append(int(stack_data["left"][i]) // scale)
+		text_data["top"].append(top + box_top - row)
+		text_data["width"].append(int(stack_data["width"][i]) // scale)
+		text_data["height"].append(box_height)
+	return text_data
+
+
 def filter_text_data(text_data: dict, confidence: int = confidence) -> list:
 	# make a copy of the text data
 	text_data_copy = text_data.copy()
@@ -462,43 +659,65 @@ def mask_image_bounding_box(img: np.ndarray, left: int, top: int, right: int,
 	'''
 		Masks the image with a bounding box.
 	'''
-	img_copy = img.copy()
-	mask = np.zeros(img_copy.shape[:2], dtype=np.uint8)
+	mask = np.zeros(img.shape[:2], dtype=np.uint8)
 	mask[top:bottom, left:right] = 255
-	masked_img = cv.bitwise_and(img_copy, img_copy, mask=mask)
+	masked_img = cv.bitwise_and(img, img, mask=mask)
 	# show(masked_img)
 	return masked_img
 
 
-# This is the ultimate function that converts the chart image to data
-# TODO: write 'jsdoc' for this function - all that it returns in a dict
-# TODO: make "validation" methods to check if the data is correct
-def get_image_data(img: np.ndarray, line_color: tuple) -> dict:
+def get_bounding_box_mask(img: np.ndarray, labels: np.ndarray, color: tuple,
+                          left: int, top: int, right: int,
+                          bottom: int) -> np.ndarray:
 	'''
-		Extracts data from CamelCamelCamel line chart image
+		Returns the mask of a color inside of a bounding box (same as masking the
+		result of mask_image_bounding_box, without copying the image)
+	'''
+	mask = np.zeros(labels.shape, dtype=bool, order="F")
+	mask[top:bottom, left:right] = get_color_mask(img[top:bottom, left:right],
+	                                              labels[top:bottom,
+	                                                     left:right], color)
+	return mask
+
+
+def get_image_geometry(img: np.ndarray,
+                       labels: Optional[np.ndarray] = None) -> dict:
+	'''
+		Finds the axis, gridlines and price lines of a CamelCamelCamel line chart
+		image (the part of get_image_data which doesn't need OCR)
 	'''
-	img_copy = img.copy()
+	if labels is None:
+		labels = label_image(img)
 	data = {}  # extracted data
 
 	# Get axis locations
-	x_axis_location, y_axis_location = get_axis_locations(img_copy)
+	x_axis_location, y_axis_location = get_axis_locations(img,
+	                                                      mask=get_color_mask(
+	                                                          img, labels,
+	                                                          color_axis))
 	# should I use location or position or index or something else
 	# naming was made on the fly and is not consistent
 	data["x_axis_location"] = x_axis_location
 	data["y_axis_location"] = y_axis_location
 
 	# Get rightmost minor gridline location
-	rightmost_minor_gridline = get_rightmost_minor_gridline(img_copy)
+	rightmost_minor_gridline = get_rightmost_minor_gridline(
+	    img, mask=get_color_mask(img, labels, color_gridline_minor))
 	data["rightmost_minor_gridline"] = rightmost_minor_gridline
 
 	# Get min and max price indices
-	min_price_index = get_min_price_index(img_copy)
-	max_price_index = get_max_price_index(img_copy)
+	min_price_index = get_min_price_index(img,
+	                                      mask=get_color_mask(
+	                                          img, labels, color_price_lowest))
+	max_price_index = get_max_price_index(img,
+	                                      mask=get_color_mask(
+	                                          img, labels, color_price_highest))
 	data["min_price_index"] = min_price_index
 	data["max_price_index"] = max_price_index
 
 	# Get gridlines
-	grid_y_locations, grid_x_locations = get_major_grid_locations(img_copy)
+	grid_y_locations, grid_x_locations = get_major_grid_locations(
+	    img, mask=get_color_mask(img, labels, color_gridline_major))
 	grid_x_locations = merge_consecutive_elements(
 	    get_consecutive_elements(grid_x_locations))
 	grid_y_locations = merge_consecutive_elements(
@@ -507,9 +726,40 @@ def get_image_data(img: np.ndarray, line_color: tuple) -> dict:
 	grid_y_locations.append(x_axis_location)
 	data["gridlines_vertical_indices"] = grid_x_locations
 	data["gridlines_horizonal_indices"] = grid_y_locations
+	return data
+
+
+# This is the ultimate function that converts the chart image to data
+# TODO: write 'jsdoc' for this function - all that it returns in a dict
+# TODO: make "validation" methods to check if the data is correct
+def get_image_data(img: np.ndarray,
+                   line_color: tuple,
+                   geometry: Optional[dict] = None,
+                   text_data: Optional[dict] = None,
+                   labels: Optional[np.ndarray] = None) -> dict:
+	'''
+		Extracts data from CamelCamelCamel line chart image
+
+		The geometry (get_image_geometry), the text data (e.g. from
+		get_text_data_cropped) and the labels (label_image) can be passed if
+		they are already known - otherwise the whole image is OCR-ed with
+		get_text_data.
+	'''
+	# the image is labeled once and all masks are taken from the labels
+	if labels is None:
+		labels = label_image(img)
+	if geometry is None:
+		geometry = get_image_geometry(img, labels)
+	data = dict(geometry)  # extracted data
+	x_axis_location = data["x_axis_location"]
+	y_axis_location = data["y_axis_location"]
+	rightmost_minor_gridline = data["rightmost_minor_gridline"]
+	grid_x_locations = data["gridlines_vertical_indices"]
+	grid_y_locations = data["gridlines_horizonal_indices"]
 
 	# get text from image
-	text_data = get_text_data(img_copy)
+	if text_data is None:
+		text_data = get_text_data(img)
 	text_data_filtered = filter_text_data(text_data)
 	data["text_data"] = text_data_filtered
 
@@ -582,6 +832,7 @@ def get_image_data(img: np.ndarray, line_color: tuple) -> dict:
 	# After automatically processing images, we can manually check if the
 	# validity of the results
 	#
+	# img_copy = img.copy()
 	# # draw a horizontal line at the y axis label location
 	# cv.line(img_copy, (0, int(x_axis_location)),
 	#         (img_copy.shape[1], int(x_axis_location)), (255, 0, 0), 2)
@@ -616,20 +867,22 @@ def get_image_data(img: np.ndarray, line_color: tuple) -> dict:
 	data["time_of_y_axis"] = time_of_y_axis
 	data["value_of_x_axis"] = value_of_x_axis
 
-	# Mask the image to ensure we only get the data portion of the line chart
-	masked_img = mask_image_bounding_box(img_copy, y_axis_location,
-	                                     y_pair_smallest[1],
-	                                     rightmost_minor_gridline,
-	                                     x_axis_location)
+	# Mask the line to ensure we only get the data portion of the line chart
+	left, top = y_axis_location, y_pair_smallest[1]
+	right, bottom = rightmost_minor_gridline, x_axis_location
+	line_mask = get_bounding_box_mask(img, labels, line_color, left, top, right,
+	                                  bottom)
 	data["bounding_box"] = {
-	    "left": y_axis_location,
-	    "top": y_pair_smallest[1],
-	    "right": rightmost_minor_gridline,
-	    "bottom": x_axis_location
+	    "left": left,
+	    "top": top,
+	    "right": right,
+	    "bottom": bottom
 	}
 
 	# Get vertical pixes indices from the image (aproximate points on the line chart)
-	vertical_pixel_indices = get_vertical_pixel_indices(masked_img, line_color)
+	vertical_pixel_indices = get_vertical_pixel_indices(img,
+	                                                    line_color,
+	                                                    mask=line_mask)
 	# calculate x and y values for each pixel
 	extracted_data = []
 	for y, x in enumerate(vertical_pixel_indices):
@@ -785,4 +1038,4 @@ def main():
 
 if __name__ == "__main__":
 	main()
-	print("ALL DONE")
\ No newline at end of file
+	print("ALL DONE")
@@ -0,0 +1,274 @@
+'''
+Benchmark of the geometry stage of chart_to_data.py (everything but OCR):
+axis, gridlines, price lines and the chart line indices of every line color.
+
+The previous implementation (a copy of the image and a cv.inRange per color,
+a Python loop over rows / columns against a scanline of ones and a loop over
+the columns for the chart line) is kept here as the reference. The outputs of
+both are compared for every image.
+
+Without downloaded charts (data/scraped/camel/charts) synthetic charts in the
+CamelCamelCamel colors can be generated with --synthetic.
+
+Usage:
+	python src/py/scraping/camel/chart_to_data_benchmark.py --limit 50
+	python src/py/scraping/camel/chart_to_data_benchmark.py --synthetic 20
+'''
+
+import os
+import sys
+import time
+import argparse
+from typing import Optional
+import cv2 as cv
+import numpy as np
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.camel import chart_to_data as ctd
+
+# Globals
+path_charts = "data/scraped/camel/charts"
+LINE_COLORS = [ctd.color_line_amazon, ctd.color_line_new, ctd.color_line_used]
+
+#
+'''
+	Reference (previous) implementation
+'''
+
+
+def mask_image_reference(img: np.ndarray, color: tuple) -> np.ndarray:
+	img_copy = img.copy()
+	return cv.inRange(img_copy, np.array(color), np.array(color))
+
+
+def get_line_indices_reference(img: np.ndarray, is_horizontal: bool,
+                               color: tuple, match_threshold: float) -> list:
+	img_mask = mask_image_reference(img, color)
+	if is_horizontal:
+		scanline = np.logical_not(np.zeros(img_mask.shape[1]))
+	else:
+		scanline = np.logical_not(np.zeros(img_mask.shape[0]))
+	matches_indices = []
+	img_mask = img_mask if is_horizontal else img_mask.T
+	for i, row in enumerate(img_mask):
+		match_count = np.sum(np.logical_and(row, scanline))
+		match_ratio = match_count / img_mask.shape[1]
+		if match_ratio > match_threshold:
+			matches_indices.append((i, match_count))
+	return matches_indices
+
+
+def get_vertical_pixel_indices_reference(img: np.ndarray,
+                                         line_color: tuple) -> list:
+	img_copy = img.copy()
+	img_masked = mask_image_reference(img_copy, line_color)
+	vertical_pixel_indices = []
+	for row in img_masked.T:
+		nz_indices = np.nonzero(row)[0]
+		if len(nz_indices) == 0:
+			vertical_pixel_indices.append(-1)
+			continue
+		vertical_pixel_indices.append(int((nz_indices[0] + nz_indices[-1]) / 2))
+	return vertical_pixel_indices
+
+
+def get_best_line_index(matches_indices: list) -> int:
+	indices_best = ctd.get_line_indices_best_matches(matches_indices)
+	return int(
+	    np.average(
+	        ctd.merge_consecutive_elements(
+	            ctd.get_consecutive_elements(indices_best))))
+
+
+def get_merged_line_indices(matches_indices: list) -> list:
+	return ctd.merge_consecutive_elements(
+	    ctd.get_consecutive_elements(
+	        ctd.line_indice_tuples_to_list(matches_indices)))
+
+
+def get_geometry_reference(img: np.ndarray) -> dict:
+	'''
+		Geometry stage with the previous implementation
+	'''
+	img_copy = img.copy()
+	data = {}
+	data["x_axis_location"] = get_best_line_index(
+	    get_line_indices_reference(img_copy, True, ctd.color_axis, 0.2))
+	data["y_axis_location"] = get_best_line_index(
+	    get_line_indices_reference(img_copy, False, ctd.color_axis, 0.2))
+	data["rightmost_minor_gridline"] = max(
+	    ctd.line_indice_tuples_to_list(
+	        get_line_indices_reference(img_copy, False, ctd.color_gridline_minor,
+	                                   0.2)))
+	data["min_price_index"] = get_best_line_index(
+	    get_line_indices_reference(img_copy, True, ctd.color_price_lowest, 0.2))
+	data["max_price_index"] = get_best_line_index(
+	    get_line_indices_reference(img_copy, True, ctd.color_price_highest, 0.2))
+	grid_y_locations = get_merged_line_indices(
+	    get_line_indices_reference(img_copy, True, ctd.color_gridline_major,
+	                               0.2))
+	grid_x_locations = get_merged_line_indices(
+	    get_line_indices_reference(img_copy, False, ctd.color_gridline_major,
+	                               0.2))
+	grid_x_locations = ctd.merge_consecutive_elements(
+	    ctd.get_consecutive_elements(grid_x_locations))
+	grid_y_locations = ctd.merge_consecutive_elements(
+	    ctd.get_consecutive_elements(grid_y_locations))
+	grid_y_locations.append(data["x_axis_location"])
+	data["gridlines_vertical_indices"] = grid_x_locations
+	data["gridlines_horizonal_indices"] = grid_y_locations
+	# the top of the bounding box comes from OCR - the image's top is used
+	masked_img = ctd.mask_image_bounding_box(img_copy, data["y_axis_location"],
+	                                         0, data["rightmost_minor_gridline"],
+	                                         data["x_axis_location"])
+	for line_color in LINE_COLORS:
+		data[line_color] = get_vertical_pixel_indices_reference(
+		    masked_img, line_color)
+	return data
+
+
+def get_geometry(img: np.ndarray) -> dict:
+	'''
+		Geometry stage with chart_to_data.py
+	'''
+	labels = ctd.label_image(img)
+	data = ctd.get_image_geometry(img, labels)
+	left, right = data["y_axis_location"], data["rightmost_minor_gridline"]
+	bottom = data["x_axis_location"]
+	for line_color in LINE_COLORS:
+		line_mask = ctd.get_bounding_box_mask(img, labels, line_color, left, 0,
+		                                      right, bottom)
+		data[line_color] = ctd.get_vertical_pixel_indices(img,
+		                                                  line_color,
+		                                                  mask=line_mask)
+	return data
+
+
+#
+'''
+	Images
+'''
+
+
+def get_synthetic_chart(width: int = 1125,
+                        height: int = 600,
+                        seed: int = 0) -> np.ndarray:
+	'''
+		Returns a chart in the CamelCamelCamel colors (RGB) - gridlines, axis,
+		highest / lowest price lines and three random walk price lines
+	'''
+	rng = np.random.default_rng(seed)
+	img = np.full((height, width, 3), 255, dtype=np.uint8)
+	left, right, top, bottom = 60, width - 20, 20, height - 50
+	for x in range(left, right, 15):
+		cv.line(img, (x, top), (x, bottom), ctd.color_gridline_minor, 1)
+	for x in range(left + 50, right, 150):
+		cv.line(img, (x, top), (x, bottom), ctd.color_gridline_major, 1)
+	for y in range(bottom - 60, top, -60):
+		cv.line(img, (left, y), (right, y), ctd.color_gridline_major, 1)
+	prices = {}
+	for line_color in LINE_COLORS:
+		steps = rng.normal(0, 3, right - left)
+		prices[line_color] = np.clip((bottom + top) / 2 + np.cumsum(steps),
+		                             top + 5, bottom - 5)
+	highest = int(min(p.min() for p in prices.values()))
+	lowest = int(max(p.max() for p in prices.values()))
+	cv.line(img, (left, highest), (right, highest), ctd.color_price_highest, 1)
+	cv.line(img, (left, lowest), (right, lowest), ctd.color_price_lowest, 1)
+	for line_color, ys in prices.items():
+		points = np.stack([np.arange(left, right), ys.astype(np.int32)], axis=1)
+		cv.polylines(img, [points.astype(np.int32)], False, line_color, 2)
+	cv.line(img, (left, top), (left, bottom), ctd.color_axis, 2)
+	cv.line(img, (left, bottom), (right, bottom), ctd.color_axis, 2)
+	return img
+
+
+def load_images(path_charts: str = path_charts,
+                limit: Optional[int] = None,
+                synthetic: int = 0) -> list[np.ndarray]:
+	if synthetic > 0:
+		return [get_synthetic_chart(seed=i) for i in range(synthetic)]
+	filenames = sorted(f for f in os.listdir(path_charts) if f.endswith(".png"))
+	filenames = [f for f in filenames if not f.endswith("-reconstructed.png")]
+	return [
+	    ctd.load_image(os.path.join(path_charts, filename))
+	    for filename in filenames[:limit]
+	]
+
+
+def is_equal(data_reference: dict, data: dict) -> bool:
+	for key, value in data_reference.items():
+		if isinstance(value, list):
+			if [int(v) for v in value] != [int(v) for v in data[key]]:
+				return False
+		elif int(value) != int(data[key]):
+			return False
+	return True
+
+
+def benchmark(images: list[np.ndarray], repeat: int = 3) -> None:
+	'''
+		Times the geometry stage of both implementations (best of repeat) and
+		checks that their outputs are the same
+	'''
+	references = []
+	for img in images:
+		try:
+			references.append((img, get_geometry_reference(img)))
+		except (ValueError, IndexError):
+			# charts without some of the lines (empty matches) are skipped
+			continue
+	print(f"{len(references)}/{len(images)} images with all lines")
+	images = [img for img, _ in references]
+	times = {}
+	for name, get in [("reference", get_geometry_reference),
+	                  ("labels", get_geometry)]:
+		best = float("inf")
+		for _ in range(repeat):
+			time_start = time.perf_counter()
+			for img in images:
+				get(img)
+			best = min(best, time.perf_counter() - time_start)
+		times[name] = best
+		print(
+		    f"{name:>10}: {best:.3f}s ({1000 * best / len(images):.2f} ms per image)"
+		)
+	print(f"Speedup: {times['reference'] / times['labels']:.2f}x")
+	fails = 0
+	for img, reference in references:
+		if not is_equal(reference, get_geometry(img)):
+			fails += 1
+	print(f"Outputs differ for {fails}/{len(images)} images.")
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--charts", type=str, default=path_charts)
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=50,
+	                    help="Max. number of charts")
+	parser.add_argument("--synthetic",
+	                    type=int,
+	                    default=0,
+	                    help="Use this many synthetic charts instead")
+	parser.add_argument("--repeat", type=int, default=3)
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	images = load_images(args.charts, args.limit, args.synthetic)
+	print(f"{len(images)} images")
+	# build the label lookup table before timing
+	ctd.get_label_lookup()
+	benchmark(images, args.repeat)
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
@@ -0,0 +1,240 @@
+'''
+Downloads the articles from the index concurrently in a single process.
+
+Requests go through one keep-alive connection pool (aiohttp) with a bounded
+number of concurrent requests and a per host token bucket. The rate adapts to
+429 responses (see src/py/utils/scraping/rate_limiter.py) instead of sleeping a
+fixed random amount of time. HTML is written atomically (temporary file +
+rename) so an interrupted run never leaves a partial article behind.
+
+Usage:
+	python src/py/scraping/cnet/article_downloader_async.py --concurrency 16 --rate 5
+'''
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.utils.logger import Logger
+from src.py.utils.scraping.rate_limiter import HostRateLimiter, get_backoff, get_retry_after
+
+# Globals
+script_path = os.path.dirname(os.path.realpath(__file__))
+stop_path = os.path.join(script_path, "article_downloader_stop")
+index_path = "data/scraped/cnet/index_articles.json"
+output_path_root = "data/scraped/cnet/articles/html"
+url_root = "https://www.cnet.com/news"
+concurrency = 16  # max. number of requests in flight
+rate = 5.0  # max. requests per second per host
+retries = 5  # retries per article (429, 5xx and network errors)
+fails = []
+logger = Logger({
+    "filepath":
+        os.path.join(*[
+            "data/scraped/cnet", "logs",
+            "scraper_cnet_article_downloader_async.log"
+        ]),
+    "level":
+        "DEBUG",
+})
+user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+stats = {
+    "downloaded": 0,
+    "failed": 0,
+    "throttled": 0,
+}
+
+
+def load_index() -> dict:
+	'''
+		Loads the index from a file
+	'''
+	logger.info(f"Loading index from '{index_path}'...")
+	if not os.path.exists(index_path):
+		logger.info(
+		    "Index file does not exist. Try running article_indexer.py first.")
+		sys.exit(1)
+	with open(index_path, "r", encoding="utf-8") as f:
+		index = json.load(f)
+	logger.info("Loaded index from file.")
+	return index
+
+
+def get_downloaded_ids() -> set:
+	'''
+		Returns the ids of the articles which have already been downloaded
+		(a single directory scan instead of a stat call per article)
+	'''
+	downloaded = set()
+	with os.scandir(output_path_root) as entries:
+		for entry in entries:
+			if entry.name.endswith(".html"):
+				downloaded.add(entry.name[:-len(".html")])
+	return downloaded
+
+
+def write_atomic(output_path: str, data: str) -> None:
+	'''
+		Writes the file to a temporary path and renames it into place
+	'''
+	output_path_tmp = output_path + ".tmp"
+	with open(output_path_tmp, "w", encoding="utf-8") as f:
+		f.write(data)
+	os.replace(output_path_tmp, output_path)
+
+
+async def download_article(session: aiohttp.ClientSession,
+                           limiter: HostRateLimiter, article_id: str,
+                           slug: str) -> bool:
+	'''
+		Downloads an article (with retries). Returns True on success.
+	'''
+	url = f"{url_root}/{slug}"
+	output_path = os.path.join(output_path_root, f"{article_id}.html")
+	for attempt in range(retries + 1):
+		bucket = await limiter.acquire(url)
+		try:
+			async with session.get(url) as response:
+				if response.status == 200:
+					data = await response.text()
+					bucket.on_success()
+					await asyncio.to_thread(write_atomic, output_path, data)
+					return True
+				if response.status == 429:
+					stats["throttled"] += 1
+					retry_after = get_retry_after(response.headers.get("Retry-After"))
+					pause = bucket.on_throttle(retry_after)
+					logger.warning(
+					    f"Got status code 429 for '{article_id}' - lowering the rate to {round(bucket.rate, 3)} req/s and pausing for {round(pause, 3)}s."
+					)
+					continue
+				if response.status < 500:
+					# 404 etc. - retrying won't help
+					logger.error(
+					    f"Got status code {response.status} for '{article_id}'!")
+					return False
+				logger.error(
+				    f"Got status code {response.status} for '{article_id}' (attempt {attempt + 1})."
+				)
+		except Exception as e:
+			logger.error(
+			    f"Got exception for '{article_id}' (attempt {attempt + 1}): {e}")
+		await asyncio.sleep(get_backoff(attempt))
+	return False
+
+
+async def worker(queue: asyncio.Queue, session: aiohttp.ClientSession,
+                 limiter: HostRateLimiter, total: int, time_start: float):
+	'''
+		Downloads articles from the queue until it receives None
+	'''
+	while True:
+		item = await queue.get()
+		if item is None:
+			queue.task_done()
+			return
+		article_id, slug = item
+		success = await download_article(session, limiter, article_id, slug)
+		if success:
+			stats["downloaded"] += 1
+		else:
+			stats["failed"] += 1
+			fails.append(article_id)
+			logger.error(f"Failed to download article '{article_id}'!")
+		done = stats["downloaded"] + stats["failed"]
+		if done % 100 == 0:
+			elapsed = time.time() - time_start
+			logger.info(
+			    f"{done}/{total} - {round(done / elapsed, 3)} articles/s ({stats['failed']} failed, {stats['throttled']} throttled)"
+			)
+		queue.task_done()
+
+
+async def download_articles(index: dict):
+	'''
+		Downloads the articles which haven't been downloaded yet
+	'''
+	downloaded = get_downloaded_ids()
+	todo = [(article_id, article["slug"])
+	        for article_id, article in index["articles"].items()
+	        if article_id not in downloaded]
+	logger.info(
+	    f"{len(downloaded)} articles already downloaded, {len(todo)} left to download."
+	)
+	if len(todo) == 0:
+		return
+	time_start = time.time()
+	limiter = HostRateLimiter(rate)
+	connector = aiohttp.TCPConnector(limit=concurrency,
+	                                 limit_per_host=concurrency)
+	timeout = aiohttp.ClientTimeout(total=30)
+	headers = {"User-Agent": user_agent}
+	async with aiohttp.ClientSession(connector=connector,
+	                                 timeout=timeout,
+	                                 headers=headers) as session:
+		# bounded queue - items are produced as workers free up
+		queue = asyncio.Queue(maxsize=concurrency * 2)
+		workers = [
+		    asyncio.create_task(
+		        worker(queue, session, limiter, len(todo), time_start))
+		    for _ in range(concurrency)
+		]
+		for item in todo:
+			if os.path.exists(stop_path):
+				logger.info("Stop file found. Safely stopping.")
+				break
+			await queue.put(item)
+		for _ in workers:
+			await queue.put(None)
+		await asyncio.gather(*workers)
+	elapsed = time.time() - time_start
+	logger.info(
+	    f"Downloaded {stats['downloaded']} articles in {round(elapsed, 3)}s ({round(stats['downloaded'] / elapsed, 3)} articles/s)."
+	)
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--concurrency",
+	                    type=int,
+	                    default=concurrency,
+	                    help="Max. number of requests in flight")
+	parser.add_argument("--rate",
+	                    type=float,
+	                    default=rate,
+	                    help="Max. requests per second per host")
+	parser.add_argument("--retries",
+	                    type=int,
+	                    default=retries,
+	                    help="Retries per article")
+	return parser.parse_args()
+
+
+def main():
+	'''
+		Main entrypoint
+	'''
+	global concurrency, rate, retries
+	args = get_args()
+	concurrency = args.concurrency
+	rate = args.rate
+	retries = args.retries
+	index = load_index()
+	if not os.path.exists(output_path_root):
+		os.makedirs(output_path_root)
+	asyncio.run(download_articles(index))
+	logger.info(f"Fails ({len(fails)}): {fails}")
+
+
+if __name__ == "__main__":
+	main()
+	logger.info("Done.")
@@ -23,19 +23,27 @@ output_path_root = "data/scraped/cnet/articles/html"
 article_id = ""
 article_slug = ""
 logger = Logger({"typeinit": True})
-logger = Logger({
-    "filepath":
-        os.path.join(
-            *["data/scraped/cnet", "logs", "tasks", f"{sys.argv[1]}.log"]),
-    "level":
-        "DEBUG",
-})
 user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
 user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 session = requests.Session()
 session.headers.update({"User-Agent": user_agent})
 
 
+def init_logger(article_id: str) -> Logger:
+	'''
+		Initializes the per article logger
+	'''
+	global logger
+	logger = Logger({
+	    "filepath":
+	        os.path.join(
+	            *["data/scraped/cnet", "logs", "tasks", f"{article_id}.log"]),
+	    "level":
+	        "DEBUG",
+	})
+	return logger
+
+
 def get_data(url: str) -> Tuple[str, None] | Tuple[None, str]:
 	'''
 		Gets the data from the given url
@@ -55,14 +63,14 @@ def get_data(url: str) -> Tuple[str, None] | Tuple[None, str]:
 		return None, f"Got exception: {e}"
 
 
-def download_article():
+def download_article() -> int:
 	'''
-		Downloads an article
+		Downloads an article (returns the exit code)
 	'''
 	output_path = os.path.join(output_path_root, f"{article_id}.html")
 	if os.path.exists(output_path):
 		logger.info(f"Article '{article_id}' already exists. Skipping...")
-		return
+		return 0
 	if not os.path.exists(output_path_root):
 		os.makedirs(output_path_root)
 	url = f"https://www.cnet.com/news/{article_slug}"
@@ -70,11 +78,12 @@ def download_article():
 	data, error = get_data(url)
 	if error is not None:
 		logger.error(f"Failed to download article '{article_id}'!")
-		sys.exit(1)
+		return 1
 	assert data is not None
 	with open(output_path, "w", encoding="utf-8") as f:
 		f.write(data)
 	logger.info(f"Downloaded article and saved it.")
+	return 0
 
 
 def load_args():
@@ -89,13 +98,36 @@ def load_args():
 	logger.info(f"Article slug: '{article_slug}'")
 
 
+def run(id: str, slug: str) -> int:
+	'''
+		Entrypoint for the scheduler's pooled workers
+		(src.py.scraping.cnet.article_downloader_worker:run) - the session and
+		imports are reused between articles handled by the same pool process.
+		Uses module globals, so it's only safe with the "process" pool type.
+	'''
+	global article_id, article_slug
+	article_id = id
+	article_slug = slug
+	init_logger(article_id)
+	try:
+		logger.info("Starting...")
+		exit_code = download_article()
+		logger.info("Done.")
+		return exit_code
+	finally:
+		logger.stop()
+
+
 def main():
 	'''
 		Main entrypoint
 	'''
+	init_logger(sys.argv[1])
 	logger.info("Starting...")
 	load_args()
-	download_article()
+	exit_code = download_article()
+	if exit_code != 0:
+		sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+# Incremental persistence of the article index
+
+import os
+import json
+from datetime import datetime, timezone
+
+
+def get_default_index(year_start: int, year_end: int, limit: int) -> dict:
+	return {
+	    "metadata": {
+	        "created": datetime.now(timezone.utc).isoformat(),
+	        "last_updated": datetime.now(timezone.utc).isoformat(),
+	    },
+	    "articles": {},
+	    "state": {
+	        "year_start": year_start,
+	        "year_end": year_end,
+	        "limit": limit,
+	        "years": {},
+	    }
+	}
+
+
+class ArticleIndexStore:
+	'''
+		Persists the article index incrementally.
+
+		Every page of sitemap items is appended to a JSON lines log next to
+		index_articles.json as soon as it arrives (one line per page), instead of
+		re-serialising the whole index - a crash loses at most the page in
+		flight. The log is compacted into index_articles.json (same format as
+		before, so the downloaders and the parser keep working) at the end of a
+		run.
+
+		The paging state is kept per year (index["state"]["years"]), so years
+		can be indexed concurrently and each of them resumes where it stopped.
+
+		On load, index_articles.json is read and the log is replayed on top of it.
+	'''
+
+	def __init__(self, index_path: str):
+		self.index_path = index_path
+		self.log_path = index_path.replace(".json", ".log.jsonl")
+		self.index = {}  # type: dict
+		self.pages_in_log = 0
+
+	def load(self, year_start: int, year_end: int, limit: int) -> dict:
+		'''
+			Loads index_articles.json and replays the log on top of it.
+		'''
+		if os.path.exists(self.index_path):
+			with open(self.index_path, "r", encoding="utf-8") as f:
+				self.index = json.load(f)
+		else:
+			self.index = get_default_index(year_start, year_end, limit)
+		self.migrate_state()
+		if os.path.exists(self.log_path):
+			with open(self.log_path, "r", encoding="utf-8") as f:
+				for line in f:
+					try:
+						record = json.loads(line)
+					except json.JSONDecodeError:
+						# partially written last line
+						continue
+					self.apply(record)
+					self.pages_in_log += 1
+		return self.index
+
+	def migrate_state(self) -> None:
+		'''
+			Converts the sequential state (a single year / offset cursor) to the
+			per year state
+		'''
+		state = self.index["state"]
+		if "years" in state:
+			return
+		state["years"] = {}
+		if "year" in state:
+			for year in range(state["year_start"], state["year"]):
+				state["years"][str(year)] = {"offset": 0, "done": True}
+			state["years"][str(state["year"])] = {
+			    "offset": state["offset"],
+			    "done": False
+			}
+			del state["year"]
+			del state["offset"]
+
+	def apply(self, record: dict) -> None:
+		'''
+			Applies a log record to the in-memory index.
+		'''
+		if record["type"] == "page":
+			for article in record["items"]:
+				self.index["articles"][article["id"]] = article
+			self.index["state"]["years"][str(record["year"])] = {
+			    "offset": record["offset_next"],
+			    "done": record["done"],
+			}
+			self.index["metadata"]["last_updated"] = record["time"]
+
+	def get_year_state(self, year: int) -> dict:
+		return self.index["state"]["years"].get(str(year), {
+		    "offset": 0,
+		    "done": False
+		})
+
+	def add_page(self, year: int, offset_next: int, done: bool,
+	             items: list) -> None:
+		'''
+			Adds a page of items to the index and appends it to the log.
+		'''
+		record = {
+		    "type": "page",
+		    "year": year,
+		    "offset_next": offset_next,
+		    "done": done,
+		    "items": items,
+		    "time": datetime.now(timezone.utc).isoformat(),
+		}
+		self.apply(record)
+		with open(self.log_path, "a", encoding="utf-8") as f:
+			f.write(json.dumps(record) + "\n")
+			f.flush()
+			os.fsync(f.fileno())
+		self.pages_in_log += 1
+
+	def compact(self) -> None:
+		'''
+			Writes the whole index to index_articles.json (atomically) and removes
+			the log.
+		'''
+		if self.pages_in_log == 0 and os.path.exists(self.index_path):
+			return
+		index_path_tmp = self.index_path + ".tmp"
+		with open(index_path_tmp, "w", encoding="utf-8") as f:
+			json.dump(self.index, f, indent=2)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(index_path_tmp, self.index_path)
+		if os.path.exists(self.log_path):
+			os.remove(self.log_path)
+		self.pages_in_log = 0
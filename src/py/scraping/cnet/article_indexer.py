@@ -3,13 +3,14 @@ import sys
 import json
 import time
 import random
+import argparse
 from typing import Tuple
 import requests
-from datetime import datetime, timezone
 
 # Project imports
 sys.path.append(os.getcwd())
 from src.py.utils.logger import Logger
+from src.py.scraping.cnet.article_index_store import ArticleIndexStore
 
 # Project imports
 year_start = 2019
@@ -22,7 +23,10 @@ apikey = ""
 stop_path = os.path.join(script_path,
                          "stop")  # if this file exists, stop scraping
 output_path_root = "data/scraped/cnet"
+url_root = "https://bender.cnetstatic.com/api/neutron/sitemaps/cnet/articles/year"
+refresh = False  # re-index finished years until known articles are reached
 index = {}
+index_store = ArticleIndexStore(index_path)
 fails = []
 logger = Logger({
     "filepath":
@@ -56,43 +60,74 @@ def load_apikey():
 
 def load_index():
 	'''
-		Loads the index from a file
+		Loads the index from a file (and the pages logged since it was saved)
 	'''
 	global index
 	logger.info(f"Loading index from '{index_path}'...")
 	if not os.path.exists(index_path):
 		logger.info("Index file does not exist. Creating new index...")
-		index = {
-		    "metadata": {
-		        "created": datetime.now(timezone.utc).isoformat(),
-		        "last_updated": datetime.now(timezone.utc).isoformat(),
-		    },
-		    "articles": {},
-		    "state": {
-		        "year": year_start,
-		        "year_start": year_start,
-		        "year_end": year_end,
-		        "limit": limit,
-		        "offset": 0,
-		    }
-		}
-	else:
-		with open(index_path, "r", encoding="utf-8") as f:
-			index = json.load(f)
-		logger.info("Loaded index from file.")
+	index = index_store.load(year_start, year_end, limit)
+	logger.info(
+	    f"Loaded index with {len(index['articles'])} articles ({index_store.pages_in_log} pages replayed from '{index_store.log_path}')."
+	)
 
 
 def save_index() -> None:
 	'''
-		Saves the index to a file
+		Saves the index to a file (compacts the page log)
 	'''
 	logger.info(f"Saving index to '{index_path}'...")
-	with open(index_path, "w", encoding="utf-8") as f:
-		# json.dump(index, f)  #, indent=2)
-		json.dump(index, f, indent=2)
+	index_store.compact()
 	logger.info("Saved index to file.")
 
 
+def get_url(year: int, offset: int) -> str:
+	return f"{url_root}/{year}/web?limit={index['state']['limit']}&offset={offset}&apiKey={apikey}"
+
+
+def get_years() -> list[int]:
+	'''
+		Returns the years which still have to be indexed (all of them when
+		refreshing)
+	'''
+	years = []
+	for year in range(index["state"]["year_start"],
+	                  index["state"]["year_end"] + 1):
+		if refresh or not index_store.get_year_state(year)["done"]:
+			years.append(year)
+	return years
+
+
+def get_start_offset(year: int) -> int:
+	'''
+		Finished years are refreshed from the first page, the others resume
+	'''
+	year_state = index_store.get_year_state(year)
+	return 0 if year_state["done"] else year_state["offset"]
+
+
+def add_page(year: int, offset: int, data: dict) -> bool:
+	'''
+		Adds a page of the year's sitemap to the index. Returns True if the year
+		is finished - there is no next page or, when refreshing a finished year,
+		the page contains articles which are already in the index (the sitemap
+		lists the newest articles first, everything after them is known).
+	'''
+	year_state = index_store.get_year_state(year)
+	items = data["data"]["items"]
+	has_next = data["links"]["next"]["href"] is not None
+	if year_state["done"]:
+		items_new = [
+		    article for article in items if article["id"] not in index["articles"]
+		]
+		logger.info(f"Got '{len(items_new)}' new articles.")
+		index_store.add_page(year, year_state["offset"], True, items_new)
+		return not has_next or len(items_new) < len(items)
+	index_store.add_page(year, offset + index["state"]["limit"], not has_next,
+	                     items)
+	return not has_next
+
+
 def get_data(url: str) -> Tuple[dict, None] | Tuple[None, str]:
 	'''
 		Gets the data from the given url
@@ -128,13 +163,10 @@ def fill_index():
 	logger.info(f"Current state: {json.dumps(index['state'], indent=2)}")
 	logger.info("")
 	limit = index["state"]["limit"]
-	start_at_year = index["state"]["year"]
-	start_at_offset = index["state"]["offset"]
-	for year in range(start_at_year, index["state"]["year_end"] + 1):
+	for year in get_years():
 		logger.info(f"Scraping year '{year}'...")
 		logger.info("")
-		index["state"]["year"] = year
-		offset = start_at_offset
+		offset = get_start_offset(year)
 		while True:
 			time_start = time.time()
 			if os.path.exists(stop_path):
@@ -144,8 +176,7 @@ def fill_index():
 			logger.info(
 			    f"Scraping year '{year}' with offset '{offset}' and limit '{limit}'..."
 			)
-			url = f"https://bender.cnetstatic.com/api/neutron/sitemaps/cnet/articles/year/{year}/web?limit={limit}&offset={offset}&apiKey={apikey}"
-			data, err = get_data(url)
+			data, err = get_data(get_url(year, offset))
 			if err is not None:
 				logger.error(f"Got error: {err}")
 				save_index()
@@ -153,27 +184,38 @@ def fill_index():
 			assert data is not None
 			num_items = data["meta"]["numOfItems"]
 			logger.info(f"Got '{num_items}' articles.")
-			for article in data["data"]["items"]:
-				index["articles"][article["id"]] = article
-			index["state"]["offset"] = offset
-			index["state"]["last_updated"] = datetime.now(timezone.utc).isoformat()
+			# every page is persisted as it arrives
+			is_done = add_page(year, offset, data)
 			logger.info(f"Total articles: '{len(index['articles'])}'")
-			# save_index() # takes too long
 			wait_random()
 			logger.info(
 			    f"Total time: '{round(time.time() - time_start, 3)}' seconds")
 			logger.info("")
-			if data["links"]["next"]["href"] is None:
+			if is_done:
 				logger.info("No more articles. Moving to next year...")
 				logger.info("")
 				break
 			offset += limit
-		start_at_offset = 0
 	save_index()
 	logger.info("Successfully filled the index with articles!")
 
 
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument(
+	    "--refresh",
+	    action="store_true",
+	    help="Re-index finished years until already known articles are reached")
+	return parser.parse_args()
+
+
 def main():
+	global refresh
+	args = get_args()
+	refresh = args.refresh
 	load_apikey()
 	load_index()
 	fill_index()
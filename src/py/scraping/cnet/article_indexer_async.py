@@ -0,0 +1,186 @@
+'''
+Concurrent version of article_indexer.py.
+
+The sitemap is partitioned by year - every year is paged by its own
+coroutine, so several years are fetched at once. All requests go through one
+keep-alive connection pool (aiohttp) and one token bucket for the sitemap host
+(see src/py/utils/scraping/rate_limiter.py), which replaces the random 1-3s
+sleep after every page and backs off on 429 responses.
+
+Pages are appended to the index log as they arrive and the paging state is
+kept per year (see article_index_store.py), so an interrupted run resumes
+every year where it stopped. With --refresh, finished years are paged again
+from the start until already known articles are reached, so re-indexing a
+year only costs its new articles.
+
+Usage:
+	python src/py/scraping/cnet/article_indexer_async.py --concurrency 3 --rate 1
+	python src/py/scraping/cnet/article_indexer_async.py --refresh
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import aiohttp
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.cnet import article_indexer
+from src.py.utils.scraping.rate_limiter import HostRateLimiter, get_backoff, get_retry_after
+
+# Globals
+concurrency = 3  # max. number of years indexed at once
+rate = 1.0  # max. requests per second (shared by all years)
+retries = 5  # retries per page (429, 5xx and network errors)
+logger = article_indexer.logger
+stats = {
+    "pages": 0,
+    "failed": 0,
+    "throttled": 0,
+}
+
+
+async def get_page(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                   year: int,
+                   offset: int) -> tuple[dict, None] | tuple[None, str]:
+	'''
+		Gets a page of the year's sitemap (with retries)
+	'''
+	url = article_indexer.get_url(year, offset)
+	err_msg = f"Error getting year '{year}' with offset '{offset}'!"
+	for attempt in range(retries + 1):
+		bucket = await limiter.acquire(url)
+		try:
+			async with session.get(url) as response:
+				if response.status == 200:
+					data = await response.json(content_type=None)
+					bucket.on_success()
+					return data, None
+				err_msg = f"Got status code {response.status} for year '{year}' with offset '{offset}'!"
+				if response.status == 429:
+					stats["throttled"] += 1
+					retry_after = get_retry_after(response.headers.get("Retry-After"))
+					pause = bucket.on_throttle(retry_after)
+					logger.warning(
+					    f"Got status code 429 - lowering the rate to {round(bucket.rate, 3)} req/s and pausing for {round(pause, 3)}s."
+					)
+					continue
+				if response.status < 500:
+					# 401 (expired API key), 404 etc. - retrying won't help
+					logger.error(err_msg)
+					return None, err_msg
+				logger.error(f"{err_msg} (attempt {attempt + 1})")
+		except Exception as e:
+			err_msg = f"Got exception for year '{year}' with offset '{offset}': {e}"
+			logger.error(f"{err_msg} (attempt {attempt + 1})")
+		await asyncio.sleep(get_backoff(attempt))
+	return None, err_msg
+
+
+async def index_year(session: aiohttp.ClientSession, limiter: HostRateLimiter,
+                     semaphore: asyncio.Semaphore, year: int) -> None:
+	'''
+		Pages through the year's sitemap until it's finished (or the stop file
+		appears)
+	'''
+	async with semaphore:
+		offset = article_indexer.get_start_offset(year)
+		logger.info(f"Scraping year '{year}' from offset '{offset}'...")
+		while True:
+			if os.path.exists(article_indexer.stop_path):
+				logger.info(
+				    f"Stop file '{article_indexer.stop_path}' exists. Stopping year '{year}'..."
+				)
+				return
+			data, err = await get_page(session, limiter, year, offset)
+			if err is not None:
+				stats["failed"] += 1
+				logger.error(f"Stopping year '{year}': {err}")
+				return
+			assert data is not None
+			stats["pages"] += 1
+			# pages are added from the event loop only - no locking needed
+			is_done = article_indexer.add_page(year, offset, data)
+			logger.info(
+			    f"Year '{year}', offset '{offset}': got '{data['meta']['numOfItems']}' articles (total: '{len(article_indexer.index['articles'])}')."
+			)
+			if is_done:
+				logger.info(f"Finished year '{year}'.")
+				return
+			offset += article_indexer.index["state"]["limit"]
+
+
+async def fill_index() -> None:
+	'''
+		Indexes the years concurrently
+	'''
+	years = article_indexer.get_years()
+	logger.info(f"Indexing years {years}...")
+	time_start = time.time()
+	limiter = HostRateLimiter(rate)
+	semaphore = asyncio.Semaphore(concurrency)
+	connector = aiohttp.TCPConnector(limit=concurrency,
+	                                 limit_per_host=concurrency)
+	timeout = aiohttp.ClientTimeout(total=60)
+	headers = {
+	    "User-Agent": article_indexer.user_agent,
+	    "apiKey": article_indexer.apikey,
+	}
+	async with aiohttp.ClientSession(connector=connector,
+	                                 timeout=timeout,
+	                                 headers=headers) as session:
+		await asyncio.gather(
+		    *[index_year(session, limiter, semaphore, year) for year in years])
+	elapsed = time.time() - time_start
+	logger.info(
+	    f"Got {stats['pages']} pages in {round(elapsed, 3)}s ({stats['failed']} years failed, {stats['throttled']} throttled)."
+	)
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--concurrency",
+	                    type=int,
+	                    default=concurrency,
+	                    help="Max. number of years indexed at once")
+	parser.add_argument("--rate",
+	                    type=float,
+	                    default=rate,
+	                    help="Max. requests per second")
+	parser.add_argument("--retries",
+	                    type=int,
+	                    default=retries,
+	                    help="Retries per page")
+	parser.add_argument(
+	    "--refresh",
+	    action="store_true",
+	    help="Re-index finished years until already known articles are reached")
+	return parser.parse_args()
+
+
+def main():
+	'''
+		Main entrypoint
+	'''
+	global concurrency, rate, retries
+	args = get_args()
+	concurrency = args.concurrency
+	rate = args.rate
+	retries = args.retries
+	article_indexer.refresh = args.refresh
+	article_indexer.load_apikey()
+	article_indexer.load_index()
+	try:
+		asyncio.run(fill_index())
+	finally:
+		article_indexer.save_index()
+
+
+if __name__ == "__main__":
+	main()
+	logger.info("Done.")
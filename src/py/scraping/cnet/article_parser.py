@@ -4,7 +4,13 @@ import sys
 import json
 import time
 import random
-from bs4 import BeautifulSoup as bs
+import argparse
+import multiprocessing
+from typing import Optional
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.utils.scraping.html_parser import parse
 
 # TODO: use fuzzy matching to match titles
 
@@ -12,6 +18,7 @@ from bs4 import BeautifulSoup as bs
 index = {}
 override = False
 shuffle_html_files = True
+parser_backend = None  # None - fastest available (see html_parser.py)
 path_index = "data/scraped/cnet/index_articles.json"
 path_data_root = "data/scraped/cnet/articles"
 path_html = os.path.join(path_data_root, "html")
@@ -20,33 +27,86 @@ script_path = os.path.dirname(os.path.realpath(__file__))
 stopfile_path = os.path.join(script_path, "article_parser_stop")
 html_files = []
 fails = []
+jobs = 1  # number of parser processes
+chunksize = 16  # files handed to a parser process at once
+titles = {
+}  # article id -> title (the only part of the index parse_file needs)
 
 
 def load_index():
 	global index
+	global titles
 	if not os.path.exists(path_index):
 		print("Index file not found. Run the indexer first.")
 		sys.exit(1)
 	with open(path_index, "r") as f:
 		index = json.load(f)
+	titles = {
+	    article_id: article["title"]
+	    for article_id, article in index["articles"].items()
+	}
 	print(f"Got {len(index['articles'])} articles in index")
 
 
+def get_filenames(folderpath: str, extension: str) -> set:
+	'''
+		Returns the names (without the extension) of the files in the folder
+		(a single directory scan instead of a stat call per file)
+	'''
+	filenames = set()
+	if not os.path.exists(folderpath):
+		return filenames
+	with os.scandir(folderpath) as entries:
+		for entry in entries:
+			if entry.name.endswith(extension):
+				filenames.add(entry.name[:-len(extension)])
+	return filenames
+
+
 def load_filenames():
+	'''
+		Loads the html files which haven't been parsed yet (all of them if
+		override is set)
+	'''
 	global html_files
-	html_files = os.listdir(path_html)
+	ids_html = get_filenames(path_html, ".html")
+	ids_parsed = set() if override else get_filenames(path_parsed, ".txt")
+	html_files = [f"{article_id}.html" for article_id in ids_html - ids_parsed]
 	if shuffle_html_files is True:
 		random.shuffle(html_files)
-	print(f"Got {len(html_files)} html files from '{path_html}'")
+	else:
+		html_files.sort()
+	print(
+	    f"Got {len(ids_html)} html files from '{path_html}' ({len(ids_html) - len(html_files)} already parsed)"
+	)
 
 
-def remove_tags(soup, tagnames: list):
-	for tag in soup([tagnames]):
-		tag.decompose()
+def init_worker(titles_shared: dict, backend: Optional[str]):
+	'''
+		Sets the title map and the parser backend in a parser process (processes
+		which aren't forked don't inherit the globals set in main)
+	'''
+	global titles, parser_backend
+	titles = titles_shared
+	parser_backend = backend
+
+
+def write_atomic(path_output: str, data: str) -> None:
+	'''
+		Writes the file to a temporary path and renames it into place
+	'''
+	path_output_tmp = path_output + ".tmp"
+	with open(path_output_tmp, "w") as f:
+		f.write(data)
+	os.replace(path_output_tmp, path_output)
+
+
+def remove_tags(root, tagnames: list):
+	root.remove(tagnames)
 
 
 def process_paragraph(p):
-	res_text = p.text
+	res_text = p.text()
 	res_text = res_text.replace("\n", " ")
 	res_text = res_text.replace("\xa0", " ")
 	res_text = res_text.strip()
@@ -54,93 +114,101 @@ def process_paragraph(p):
 	return res_text
 
 
-def parse_file(filepath: str):
+def parse_file(filepath: str) -> tuple[str, Optional[str]]:
 	'''
 		Parses a single html file and extracts the article content.
+		Returns the article id and the error (None on success).
 	'''
-	global fails
 	article_id = filepath.split(".")[0]
 	try:
 		path_output = os.path.join(path_parsed, filepath.replace(".html", ".txt"))
-		if override == False and os.path.exists(path_output):
-			print(f"File '{filepath}' already parsed. Skipping...")
-			print("")
-			return
 		# print(f"Parsing file '{filepath}'")
 		article_text = ""
 		with open(os.path.join(path_html, filepath), "r") as f:
 			article_text = f.read()
-		article = index["articles"][article_id]
-		soup = bs(article_text, "html.parser")
+		title_index = titles[article_id]
+		root = parse(article_text, parser_backend)
 		# Remove unwanted tags
 		unwanted_tags = [
 		    "script", "style", "symbol", "svg", "path", "figure", "picture"
 		]
-		remove_tags(soup, unwanted_tags)
-		title = soup.find("title").text.replace(  # type: ignore
+		remove_tags(root, unwanted_tags)
+		title = root.css_first("title").text().replace(  # type: ignore
 		    " - CNET", "").strip()
-		if title != article["title"]:
-			print(f"WARNING: Title mismatch: '{title}' != '{article['title']}'")
+		if title != title_index:
+			print(f"WARNING: Title mismatch: '{title}' != '{title_index}'")
 			print("")
-			return
+			return article_id, None
 		# Extract article content
-		article_div = soup.find("div", {"id": f"page-article-{article_id}"})
-		article_body_div = article_div.find(  # type: ignore
-		    "div", {"class": "c-pageArticle_body"})  # type: ignore
-		article_content_div = article_body_div.find(  # type: ignore
-		    "div",
-		    {"class": lambda x: x and "c-ShortcodeContent" in x})  # type: ignore
-		paragraphs = article_content_div.find_all(  # type: ignore
-		    "p", recursive=True)
+		# (attribute selector - ids starting with a digit aren't valid in #id)
+		article_div = root.css_first(f"div[id='page-article-{article_id}']")
+		article_body_div = article_div.css_first(  # type: ignore
+		    "div.c-pageArticle_body")
+		article_content_div = article_body_div.css_first(  # type: ignore
+		    "div[class*='c-ShortcodeContent']")
+		paragraphs = article_content_div.css("p")  # type: ignore
 		print(f"Found {len(paragraphs)} paragraphs")
 		paragraphs_processed = list(map(process_paragraph, paragraphs))
 		article_text = "\n\n".join(paragraphs_processed)
 		word_count = len(article_text.split(" "))
 		print(f"Word count: {word_count}")
 		# Write to file
-		with open(path_output, "w") as f:
-			f.write(article_text)
+		write_atomic(path_output, article_text)
 		print(f"Successfully parsed file.")
 		print("")
+		return article_id, None
 	except Exception as e:
 		print(f"Error parsing file '{filepath}': {e}")
 		print("")
-		fails.append((article_id, e))
-		return
+		return article_id, str(e)
 
 
 def parse_all():
 	'''
-		Parses all html files in the html folder.
+		Parses all html files in the html folder (in a pool of jobs processes if
+		jobs > 1).
 	'''
 	print("Parsing all files...")
 	print("")
+	if len(html_files) == 0:
+		print("Nothing to parse.")
+		return
 	count_parsed = 0
 	time_start = time.time()
-	for i, html_filepath in enumerate(html_files):
-		if os.path.exists(stopfile_path):
-			print("Stopfile found. Stopping...")
-			break
-		path_output = os.path.join(path_parsed,
-		                           html_filepath.replace(".html", ".txt"))
-		if override == False and os.path.exists(path_output):
-			print(
-			    f"[{i+1}/{len(html_files)}] File '{html_filepath}' already parsed. Skipping..."
-			)
-			print("")
-			continue
-		print(f"[{i+1}/{len(html_files)}] Parsing file '{html_filepath}'")
-		parse_file(html_filepath)
-		count_parsed += 1
-		if i % 100 == 0:
-			time_elapsed = time.time() - time_start
-			average_time = time_elapsed / count_parsed
-			articles_left = len(html_files) - count_parsed
-			time_left = articles_left * average_time
-			print(f"Avg. time per article: {average_time}s ({time_left}s left)")
-			# print(f"Time elapsed: {time_elapsed}")
-			print("")
-	count_successful = len(html_files) - len(fails)
+	pool = None
+	if jobs > 1:
+		# every process gets its own read-only copy of the title map (shared
+		# copy-on-write when processes are forked)
+		pool = multiprocessing.Pool(jobs,
+		                            initializer=init_worker,
+		                            initargs=(titles, parser_backend))
+		results = pool.imap_unordered(parse_file, html_files, chunksize)
+	else:
+		results = map(parse_file, html_files)
+	try:
+		for i, (article_id, error) in enumerate(results):
+			count_parsed += 1
+			if error is not None:
+				fails.append((article_id, error))
+			if i % 100 == 0:
+				time_elapsed = time.time() - time_start
+				average_time = time_elapsed / count_parsed
+				articles_left = len(html_files) - count_parsed
+				time_left = articles_left * average_time
+				print(
+				    f"[{count_parsed}/{len(html_files)}] Avg. time per article: {average_time}s ({time_left}s left)"
+				)
+				# print(f"Time elapsed: {time_elapsed}")
+				print("")
+			if os.path.exists(stopfile_path):
+				print("Stopfile found. Stopping...")
+				break
+	finally:
+		if pool is not None:
+			# outputs are written atomically - killing the workers is safe
+			pool.terminate()
+			pool.join()
+	count_successful = count_parsed - len(fails)
 	print(
 	    f"Successfully parsed {count_successful}/{len(html_files)} ({round(count_successful/len(html_files)*100, 3)} %)"
 	)
@@ -153,7 +221,39 @@ def parse_all():
 		print("")
 
 
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--jobs",
+	                    type=int,
+	                    default=jobs,
+	                    help="Number of parser processes")
+	parser.add_argument("--chunksize",
+	                    type=int,
+	                    default=chunksize,
+	                    help="Files handed to a parser process at once")
+	parser.add_argument(
+	    "--backend",
+	    type=str,
+	    default=parser_backend,
+	    help="HTML parser backend (selectolax, lxml or html.parser)")
+	parser.add_argument("--override",
+	                    action="store_true",
+	                    help="Parse files which have already been parsed")
+	return parser.parse_args()
+
+
 def main():
+	global jobs, chunksize, override, parser_backend
+	args = get_args()
+	parser_backend = args.backend
+	jobs = args.jobs
+	chunksize = args.chunksize
+	override = override or args.override
+	if not os.path.exists(path_parsed):
+		os.makedirs(path_parsed)
 	load_index()
 	load_filenames()
 	parse_all()
@@ -43,6 +43,28 @@ def get_token_status() -> Tuple[dict, None] | Tuple[None, Exception]:
 	return None, Exception(f"Error: {response.status_code}")
 
 
+def get_products_params(asin: str | list[str],
+                        domain_id: int,
+                        stats: Optional[Tuple[str, str]] = ("2011-01-01",
+                                                            "2025-01-01"),
+                        history: bool = True,
+                        rating: bool = True) -> dict:
+	'''
+		Returns the query parameters of a /product request (up to 100 ASINs can be
+		requested at once)
+	'''
+	params = {
+	    "key": api_key,
+	    "domain": domain_id,
+	    "asin": asin if isinstance(asin, str) else ",".join(asin),
+	    "history": 1 if history is True else 0,
+	    "rating": 1 if rating is True else 0
+	}
+	if stats:
+		params["stats"] = f"{stats[0]},{stats[1]}"
+	return params
+
+
 def get_products_reponse(
     asin: str,
     domain_id: int,
@@ -63,15 +85,7 @@ def get_products_reponse(
 		Returns:
 			Product information
 	'''
-	params = {
-	    "key": api_key,
-	    "domain": domain_id,
-	    "asin": asin,
-	    "history": 1 if history is True else 0,
-	    "rating": 1 if rating is True else 0
-	}
-	if stats:
-		params["stats"] = f"{stats[0]},{stats[1]}"
+	params = get_products_params(asin, domain_id, stats, history, rating)
 	# response, err = wrapper(requests.get, f"{api_url}/product", params=params)
 	# timeout 60 seconds, retry 3 times
 	response, err = wrapper(requests.get,
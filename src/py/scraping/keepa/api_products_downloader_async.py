@@ -0,0 +1,328 @@
+'''
+Concurrent version of api_products_downloader.py.
+
+	- ASINs are requested in batches (the /product endpoint accepts up to 100
+		comma separated ASINs) and the responses are split back into the usual
+		per-ASIN files (data/keepa/products/domains/<domain>/<asin>.json - same
+		format as get_all: the response with a single product)
+	- all domains are downloaded concurrently. Keepa's tokens belong to the API
+		key (not to the domain), so every request waits on one shared
+		KeepaTokenBucket, which follows the tokensLeft / refillRate / refillIn
+		fields of the responses instead of sleeping after every product
+	- errors are retried with exponential backoff (429 waits for the next
+		refill), instead of writing an error file and sleeping for 60s. Batches
+		which still fail are left without files, so the next run retries them
+
+Usage:
+	python src/py/scraping/keepa/api_products_downloader_async.py --domains 1 3 2 --batch-size 100
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Optional
+import aiohttp
+import orjson
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.keepa import api_products_downloader as downloader
+from src.py.utils.scraping.rate_limiter import get_backoff
+
+# Globals
+domains = downloader.domains
+batch_size = 100  # ASINs per request (max. 100)
+concurrency = 3  # max. number of requests in flight (across domains)
+retries = 5  # retries per batch (429, 5xx and network errors)
+tokens_per_product = 2  # estimate of the request cost (history + rating)
+refill_period = 60  # seconds between keepa's refills
+refill_margin = 1.0  # seconds to wait after a refill (clocks are not in sync)
+stats = {
+    "requests": 0,
+    "products": 0,
+    "failed": 0,
+    "throttled": 0,
+    "waited": 0.0,
+}
+
+
+class KeepaTokenBucket:
+	'''
+		Model of the token bucket of a Keepa API key.
+
+		Keepa adds refillRate tokens every minute (the next refill is in refillIn
+		milliseconds) up to an hour's worth of tokens. Every response carries
+		the current state, which replaces the estimate. Tokens of requests which
+		are still in flight are reserved (at tokens_per_product per ASIN) until
+		their response arrives.
+	'''
+
+	def __init__(self, tokens_left: int, refill_rate: int, refill_in: int):
+		self.lock = asyncio.Lock()
+		self.reserved = 0
+		self.timestamp = 0
+		self.update({
+		    "tokensLeft": tokens_left,
+		    "refillRate": refill_rate,
+		    "refillIn": refill_in,
+		    "timestamp": 0,
+		})
+
+	def update(self, info_object: dict) -> None:
+		'''
+			Takes over the token state of a response (older responses are ignored)
+		'''
+		if info_object.get("timestamp", 0) < self.timestamp:
+			return
+		self.timestamp = info_object.get("timestamp", 0)
+		self.tokens_left = info_object["tokensLeft"]
+		self.refill_rate = max(1, info_object["refillRate"])
+		self.capacity = self.refill_rate * 60
+		self.time_refill = time.monotonic() + info_object["refillIn"] / 1000
+
+	def get_tokens(self) -> float:
+		'''
+			Returns the estimated number of available tokens (refills included)
+		'''
+		now = time.monotonic()
+		tokens = self.tokens_left
+		if now >= self.time_refill:
+			refills = 1 + int((now - self.time_refill) // refill_period)
+			tokens = min(self.capacity, tokens + refills * self.refill_rate)
+		return tokens - self.reserved
+
+	def get_wait_time(self, tokens: float) -> float:
+		'''
+			Returns the seconds until the given number of tokens is available
+		'''
+		now = time.monotonic()
+		missing = tokens - self.get_tokens()
+		if missing <= 0:
+			return 0.0
+		time_refill = self.time_refill
+		while time_refill <= now:
+			time_refill += refill_period
+		refills = int(-(-missing // self.refill_rate))
+		return time_refill - now + (refills - 1) * refill_period + refill_margin
+
+	async def acquire(self, tokens: float) -> float:
+		'''
+			Waits until the tokens are available and reserves them. Returns the
+			reserved tokens.
+		'''
+		# one request can't need more than a full bucket
+		tokens = min(tokens, self.capacity)
+		# the lock makes waiters queue up in FIFO order
+		async with self.lock:
+			while True:
+				wait_time = self.get_wait_time(tokens)
+				if wait_time <= 0:
+					self.reserved += tokens
+					return tokens
+				downloader.logger.info(
+				    f"Waiting {round(wait_time, 3)}s for {tokens} tokens (estimated {round(self.get_tokens(), 1)} left)"
+				)
+				stats["waited"] += wait_time
+				await asyncio.sleep(wait_time)
+
+	def release(self, tokens: float, info_object: Optional[dict] = None) -> None:
+		'''
+			Releases a reservation (and takes over the state of the response)
+		'''
+		self.reserved -= tokens
+		if info_object is not None and "tokensLeft" in info_object:
+			self.update(info_object)
+
+
+async def get_token_bucket(session: aiohttp.ClientSession) -> KeepaTokenBucket:
+	'''
+		Creates the token bucket from the token status of the API key
+	'''
+	async with session.get(f"{downloader.api_url}/token",
+	                       params={"key": downloader.api_key}) as response:
+		response.raise_for_status()
+		info_object = await response.json(content_type=None)
+	downloader.logger.info(f"Token status: {orjson.dumps(info_object).decode()}")
+	bucket = KeepaTokenBucket(info_object["tokensLeft"],
+	                          info_object["refillRate"], info_object["refillIn"])
+	bucket.update(info_object)
+	return bucket
+
+
+async def get_products_response(
+    session: aiohttp.ClientSession, bucket: KeepaTokenBucket, asins: list[str],
+    domain_id: int) -> tuple[dict, None] | tuple[None, str]:
+	'''
+		Gets the products of a batch of ASINs (with retries)
+	'''
+	params = downloader.get_products_params(asins, domain_id)
+	tokens = len(asins) * tokens_per_product
+	err_msg = f"Error getting {len(asins)} products for domain_id={domain_id}!"
+	for attempt in range(retries + 1):
+		reserved = await bucket.acquire(tokens)
+		info_object = None
+		try:
+			stats["requests"] += 1
+			async with session.get(f"{downloader.api_url}/product",
+			                       params=params) as response:
+				content = await response.read()
+				try:
+					info_object = orjson.loads(content)
+				except orjson.JSONDecodeError:
+					info_object = None
+				if response.status == 200 and info_object is not None:
+					return info_object, None
+				err_msg = f"Got status code {response.status} for {len(asins)} products of domain_id={domain_id}!"
+				if response.status == 429:
+					# out of tokens - the bucket waits for the refill
+					stats["throttled"] += 1
+					downloader.logger.warning(err_msg)
+					if info_object is None or "tokensLeft" not in info_object:
+						await asyncio.sleep(get_backoff(attempt, base=5))
+					continue
+				if 400 <= response.status < 500:
+					# invalid parameters or API key - retrying won't help
+					downloader.logger.error(err_msg)
+					return None, err_msg
+				downloader.logger.error(f"{err_msg} (attempt {attempt + 1})")
+		except Exception as e:
+			err_msg = f"Got exception for {len(asins)} products of domain_id={domain_id}: {e}"
+			downloader.logger.error(f"{err_msg} (attempt {attempt + 1})")
+		finally:
+			bucket.release(reserved, info_object)
+		await asyncio.sleep(get_backoff(attempt))
+	return None, err_msg
+
+
+def write_products(path_output_domain: str, asins: list[str],
+                   response: dict) -> int:
+	'''
+		Splits a batch response into per-ASIN files (the response with a single
+		product). Returns the number of written products.
+	'''
+	info_object = {k: v for k, v in response.items() if k != "products"}
+	products = {
+	    product["asin"]: product for product in response.get("products") or []
+	}
+	count = 0
+	for asin in asins:
+		path_product = os.path.join(path_output_domain, f"{asin}.json")
+		if asin in products:
+			result_object = {**info_object, "products": [products[asin]]}
+			count += 1
+		else:
+			# same as get_all - the product isn't requested again
+			result_object = {"error": "Product not in the response"}
+		path_product_tmp = path_product + ".tmp"
+		with open(path_product_tmp, "wb") as f:
+			f.write(orjson.dumps(result_object))
+		os.replace(path_product_tmp, path_product)
+	return count
+
+
+async def get_all(session: aiohttp.ClientSession, bucket: KeepaTokenBucket,
+                  semaphore: asyncio.Semaphore, domain_id: int,
+                  asins: list[str]) -> None:
+	'''
+		Downloads the products of a domain which haven't been downloaded yet
+	'''
+	path_output_domain = os.path.join(downloader.path_output_root,
+	                                  f"{domain_id}")
+	if not os.path.exists(path_output_domain):
+		downloader.logger.info(f"Creating directory: '{path_output_domain}'")
+		os.makedirs(path_output_domain)
+	asins = [
+	    asin for asin in asins
+	    if not os.path.exists(os.path.join(path_output_domain, f"{asin}.json"))
+	]
+	batches = [asins[i:i + batch_size] for i in range(0, len(asins), batch_size)]
+	downloader.logger.info(
+	    f"Retrieving {len(asins)} products in {len(batches)} batches for domain_id={domain_id}"
+	)
+	count = 0
+	for i, batch in enumerate(batches):
+		async with semaphore:
+			time_start = time.time()
+			response, err = await get_products_response(session, bucket, batch,
+			                                            domain_id)
+		if err is not None:
+			stats["failed"] += 1
+			downloader.logger.error(
+			    f"Skipping batch {i + 1}/{len(batches)} of domain_id={domain_id}: {err}"
+			)
+			continue
+		assert response is not None
+		written = await asyncio.to_thread(write_products, path_output_domain,
+		                                  batch, response)
+		count += written
+		stats["products"] += written
+		downloader.logger.info(
+		    f"Batch {i + 1}/{len(batches)} of domain_id={domain_id}: {written}/{len(batch)} products in {round(time.time() - time_start, 3)}s (tokens left: {response.get('tokensLeft')}, consumed: {response.get('tokensConsumed')})"
+		)
+	downloader.logger.info(
+	    f"Done with domain_id={domain_id}: {count}/{len(asins)} products")
+
+
+async def get_all_domains() -> None:
+	'''
+		Downloads all domains concurrently
+	'''
+	asins = list(downloader.get_products_json().keys())
+	time_start = time.time()
+	semaphore = asyncio.Semaphore(concurrency)
+	connector = aiohttp.TCPConnector(limit=concurrency)
+	timeout = aiohttp.ClientTimeout(total=300)
+	async with aiohttp.ClientSession(connector=connector,
+	                                 timeout=timeout) as session:
+		bucket = await get_token_bucket(session)
+		await asyncio.gather(*[
+		    get_all(session, bucket, semaphore, domain_id, asins)
+		    for domain_id in domains
+		])
+	elapsed = time.time() - time_start
+	downloader.logger.info(
+	    f"Got {stats['products']} products with {stats['requests']} requests in {round(elapsed, 3)}s ({stats['failed']} batches failed, {stats['throttled']} throttled, {round(stats['waited'], 3)}s waiting for tokens)"
+	)
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--domains", type=int, nargs="+", default=domains)
+	parser.add_argument("--batch-size",
+	                    type=int,
+	                    default=batch_size,
+	                    help="ASINs per request (max. 100)")
+	parser.add_argument("--concurrency",
+	                    type=int,
+	                    default=concurrency,
+	                    help="Max. number of requests in flight")
+	parser.add_argument("--retries",
+	                    type=int,
+	                    default=retries,
+	                    help="Retries per batch")
+	return parser.parse_args()
+
+
+def main():
+	'''
+		Main entrypoint
+	'''
+	global domains, batch_size, concurrency, retries
+	args = get_args()
+	domains = args.domains
+	batch_size = min(100, args.batch_size)
+	concurrency = args.concurrency
+	retries = args.retries
+	downloader.domains = domains
+	downloader.init()
+	asyncio.run(get_all_domains())
+
+
+if __name__ == "__main__":
+	main()
+	downloader.logger.info("All done!")
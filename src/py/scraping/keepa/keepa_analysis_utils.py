@@ -11,7 +11,8 @@ def load_result_object(path: str) -> dict:
 	'''
 		Loads the result object from a path.
 	'''
-	result_object = json.load(open(path))
+	with open(path, "r") as f:
+		result_object = json.load(f)
 	return result_object
 
 
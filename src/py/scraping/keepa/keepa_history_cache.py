@@ -0,0 +1,319 @@
+'''
+Columnar cache of the parsed keepa product histories.
+
+Every analysis used to re-parse the raw result objects written by
+api_products_downloader.py (large csv arrays in keepa minutes). This module
+converts them once into a long format Parquet dataset with the columns
+	- asin
+	- key: series key (NEW, USED, AMAZON, COUNT_NEW, ...)
+	- day: date32 (the series are discretized to days with
+		discretize_csv_smart, like in the category notebooks)
+	- value: float64
+partitioned by domain and category (hive style):
+	data/keepa/generated/histories/domain=1/category=VIDEO_CARD/part-0.parquet
+
+The files are zstd compressed, dictionary encoded (asin and key repeat a lot)
+and sorted by key and day, so the row group statistics of key and day are
+tight. Reads are restricted to the columns, partitions (domain / category
+directories are skipped) and row groups (by key and day statistics) they need.
+
+Products are assigned to categories with the category index
+(data/keepa/generated/categories-domain-1.json, see
+product_category_analysis.ipynb). Without it all products of a domain go to
+the category "uncategorized".
+
+Build:
+	python src/py/scraping/keepa/keepa_history_cache.py --domains 1 2 3 5 --jobs 8
+
+Read:
+	from src.py.scraping.keepa.keepa_history_cache import read_histories, get_product_csvs
+	table = read_histories(domains=["1"], categories=["VIDEO_CARD"], keys=["NEW"], date_start="2020-01-01")
+	products = get_product_csvs(table)  # asin -> {key: (values, days)}
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date
+from typing import Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.keepa.keepa_ingest import ProductCsv, get_domain_asins, ingest, jobs
+from src.py.scraping.keepa.keepa_timeseries import path_products_root
+
+# Globals
+path_category_index = "data/keepa/generated/categories-domain-1.json"
+path_cache = "data/keepa/generated/histories"
+category_default = "uncategorized"
+row_group_size = 250000
+compression = "zstd"
+SCHEMA = pa.schema([
+    pa.field("asin", pa.dictionary(pa.int32(), pa.string())),
+    pa.field("key", pa.dictionary(pa.int32(), pa.string())),
+    pa.field("day", pa.date32()),
+    pa.field("value", pa.float64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("domain", pa.string()),
+                                          ("category", pa.string())]),
+                               flavor="hive")
+
+
+def get_category_asins(
+    domain: str,
+    path_category_index: str = path_category_index) -> dict[str, list[str]]:
+	'''
+		Returns category -> ASINs (the category index is the same for all
+		domains)
+	'''
+	if not os.path.exists(path_category_index):
+		return {category_default: get_domain_asins(domain)}
+	with open(path_category_index, "r") as f:
+		index_categories = json.load(f)
+	return {
+	    category: sorted(products.keys())
+	    for category, products in index_categories.items()
+	}
+
+
+def get_partition_path(domain: str,
+                       category: str,
+                       path_cache: str = path_cache) -> str:
+	return os.path.join(path_cache, f"domain={domain}", f"category={category}")
+
+
+def to_table(products: dict[str, ProductCsv]) -> pa.Table:
+	'''
+		Flattens the products' series into a long format table sorted by key and
+		day
+	'''
+	asins = list(products.keys())
+	keys = sorted({key for csv in products.values() for key in csv})
+	key_ids = {key: i for i, key in enumerate(keys)}
+	asin_indices, key_indices, days, values = [], [], [], []
+	for asin_index, asin in enumerate(asins):
+		for key, (key_values, key_days) in products[asin].items():
+			if len(key_values) == 0:
+				continue
+			asin_indices.append(np.full(len(key_values), asin_index, np.int32))
+			key_indices.append(np.full(len(key_values), key_ids[key], np.int32))
+			days.append(np.asarray(key_days, dtype="datetime64[D]"))
+			values.append(np.asarray(key_values, dtype=np.float64))
+	if len(values) == 0:
+		return SCHEMA.empty_table()
+	asin_indices = np.concatenate(asin_indices)
+	key_indices = np.concatenate(key_indices)
+	days = np.concatenate(days)
+	values = np.concatenate(values)
+	order = np.lexsort((asin_indices, days, key_indices))
+	return pa.table(
+	    {
+	        "asin":
+	            pa.DictionaryArray.from_arrays(asin_indices[order],
+	                                           pa.array(asins, pa.string())),
+	        "key":
+	            pa.DictionaryArray.from_arrays(key_indices[order],
+	                                           pa.array(keys, pa.string())),
+	        "day":
+	            pa.array(days[order], pa.date32()),
+	        "value":
+	            pa.array(values[order], pa.float64()),
+	    },
+	    schema=SCHEMA)
+
+
+def write_partition(table: pa.Table,
+                    domain: str,
+                    category: str,
+                    path_cache: str = path_cache) -> str:
+	'''
+		Writes the table of a domain's category (replacing the previous one
+		atomically). Returns the path of the file.
+	'''
+	folderpath = get_partition_path(domain, category, path_cache)
+	if not os.path.exists(folderpath):
+		os.makedirs(folderpath)
+	path = os.path.join(folderpath, "part-0.parquet")
+	# dataset discovery skips files starting with "." (a leftover of a crashed
+	# build doesn't break read_histories)
+	path_tmp = os.path.join(folderpath, ".part-0.parquet.tmp")
+	try:
+		pq.write_table(table,
+		               path_tmp,
+		               row_group_size=row_group_size,
+		               compression=compression,
+		               use_dictionary=["asin", "key"],
+		               write_statistics=True)
+		os.replace(path_tmp, path)
+	finally:
+		if os.path.exists(path_tmp):
+			os.remove(path_tmp)
+	return path
+
+
+def build_domain(domain: str,
+                 path_cache: str = path_cache,
+                 path_category_index: str = path_category_index,
+                 categories: Optional[list[str]] = None,
+                 jobs: int = jobs) -> dict[str, int]:
+	'''
+		Converts the downloaded products of a domain (products missing in the
+		domain are skipped). Returns the number of rows per category.
+	'''
+	rows = {}
+	category_asins = get_category_asins(domain, path_category_index)
+	for category, asins in category_asins.items():
+		if categories is not None and category not in categories:
+			continue
+		time_start = time.time()
+		products, fails = ingest(domain, asins, jobs=jobs)
+		table = to_table(products)
+		path = write_partition(table, domain, category, path_cache)
+		rows[category] = table.num_rows
+		print(
+		    f"Domain '{domain}', category '{category}': {len(products)}/{len(asins)} products, {table.num_rows} rows, {round(os.path.getsize(path) / 1024 / 1024, 3)} MB in {round(time.time() - time_start, 3)}s"
+		)
+	return rows
+
+
+def to_date(value: str | date) -> date:
+	return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def get_filter(
+    domains: Optional[list[str]] = None,
+    categories: Optional[list[str]] = None,
+    asins: Optional[list[str]] = None,
+    keys: Optional[list[str]] = None,
+    date_start: Optional[str | date] = None,
+    date_end: Optional[str | date] = None) -> Optional[ds.Expression]:
+	'''
+		Returns the dataset filter of read_histories
+	'''
+	expressions = []
+	if domains is not None:
+		expressions.append(ds.field("domain").isin([str(d) for d in domains]))
+	if categories is not None:
+		expressions.append(ds.field("category").isin(categories))
+	if asins is not None:
+		expressions.append(ds.field("asin").isin(asins))
+	if keys is not None:
+		expressions.append(ds.field("key").isin(keys))
+	if date_start is not None:
+		expressions.append(ds.field("day") >= to_date(date_start))
+	if date_end is not None:
+		expressions.append(ds.field("day") <= to_date(date_end))
+	if len(expressions) == 0:
+		return None
+	expression = expressions[0]
+	for other in expressions[1:]:
+		expression = expression & other
+	return expression
+
+
+def get_dataset(path_cache: str = path_cache) -> ds.Dataset:
+	return ds.dataset(path_cache,
+	                  schema=SCHEMA.append(pa.field(
+	                      "domain",
+	                      pa.string())).append(pa.field("category",
+	                                                    pa.string())),
+	                  format="parquet",
+	                  partitioning=PARTITIONING)
+
+
+def read_histories(path_cache: str = path_cache,
+                   columns: Optional[list[str]] = None,
+                   domains: Optional[list[str]] = None,
+                   categories: Optional[list[str]] = None,
+                   asins: Optional[list[str]] = None,
+                   keys: Optional[list[str]] = None,
+                   date_start: Optional[str | date] = None,
+                   date_end: Optional[str | date] = None) -> pa.Table:
+	'''
+		Reads (a part of) the cache - only the given columns (asin, key, day,
+		value, domain, category), partitions and series from date_start to
+		date_end (inclusive).
+	'''
+	return get_dataset(path_cache).to_table(columns=columns,
+	                                        filter=get_filter(
+	                                            domains, categories, asins, keys,
+	                                            date_start, date_end))
+
+
+def get_product_csvs(table: pa.Table) -> dict[str, ProductCsv]:
+	'''
+		Returns asin -> {key: (values, days)} (the format of keepa_ingest.ingest)
+		of a table read with read_histories (needs the asin, key, day and value
+		columns, of a single domain)
+	'''
+	table = table.select(["asin", "key", "day", "value"])
+	if table.num_rows == 0:
+		return {}
+	table = table.unify_dictionaries().combine_chunks()
+	asin_column = table.column("asin").combine_chunks()
+	key_column = table.column("key").combine_chunks()
+	asin_indices = asin_column.indices.to_numpy()
+	key_indices = key_column.indices.to_numpy()
+	days = table.column("day").to_numpy()
+	values = table.column("value").to_numpy()
+	order = np.lexsort((days, key_indices, asin_indices))
+	asin_indices = asin_indices[order]
+	key_indices = key_indices[order]
+	days = days[order]
+	values = values[order]
+	# runs of equal (asin, key)
+	run_starts = np.flatnonzero(
+	    np.concatenate([[True], (asin_indices[1:] != asin_indices[:-1]) |
+	                    (key_indices[1:] != key_indices[:-1])]))
+	run_ends = np.append(run_starts[1:], len(order))
+	asin_names = asin_column.dictionary.to_pylist()
+	key_names = key_column.dictionary.to_pylist()
+	products = {}  # type: dict[str, ProductCsv]
+	for start, end in zip(run_starts, run_ends):
+		csv = products.setdefault(asin_names[asin_indices[start]], {})
+		csv[key_names[key_indices[start]]] = (values[start:end], days[start:end])
+	return products
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--domains", type=str, nargs="+", default=["1"])
+	parser.add_argument("--categories",
+	                    type=str,
+	                    nargs="+",
+	                    default=None,
+	                    help="Only (re)build these categories")
+	parser.add_argument("--category-index",
+	                    type=str,
+	                    default=path_category_index)
+	parser.add_argument("--output", type=str, default=path_cache)
+	parser.add_argument("--jobs", type=int, default=jobs)
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	time_start = time.time()
+	rows = 0
+	for domain in args.domains:
+		if not os.path.exists(os.path.join(path_products_root, domain)):
+			print(f"No products for domain '{domain}'")
+			continue
+		rows += sum(
+		    build_domain(domain, args.output, args.category_index, args.categories,
+		                 args.jobs).values())
+	print(f"Wrote {rows} rows in {round(time.time() - time_start, 3)}s")
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
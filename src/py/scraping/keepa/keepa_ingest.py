@@ -0,0 +1,236 @@
+'''
+Parallel batch ingestion of downloaded keepa products.
+
+The category notebooks load every data/keepa/products/domains/<id>/<asin>.json
+with load_result_object and run it through parse_csv, organize_csv and
+discretize_csv_smart one product at a time. Here a list of ASINs is split into
+chunks which are handled by a process pool:
+	- the result objects are decoded with orjson (several times faster than
+		json for the large csv arrays)
+	- the csv is parsed, organized (and optionally cleaned of outliers) and
+		discretized with the vectorized primitives in keepa_timeseries.py
+	- a worker returns compact per-product arrays (values as float64, dates as
+		datetime64[D] - no datetime objects) or, with aggregate=True, a
+		TrendAccumulator of its chunk, so only one (trend key x day) matrix per
+		chunk is sent back to the main process instead of the products
+
+Usage:
+	python src/py/scraping/keepa/keepa_ingest.py --domain 1 --jobs 8
+	python src/py/scraping/keepa/keepa_ingest.py --domain 3 --asins asins.txt --aggregate
+'''
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from typing import Iterator, Optional, Tuple
+import orjson
+import numpy as np
+import numpy.typing as npt
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.keepa.keepa_timeseries import TrendAccumulator, discretize_csv_smart, get_organized_csv, path_products_root, remove_outliers_csv
+
+# Globals
+jobs = max(1, (os.cpu_count() or 2) - 1)
+chunksize = 100  # products per task
+
+# key -> (values, days) of a discretized product
+ProductCsv = dict[str, Tuple[npt.NDArray[np.float64],
+                             npt.NDArray[np.datetime64]]]
+
+
+def get_product_path(domain: str, asin: str) -> str:
+	return os.path.join(path_products_root, domain, f"{asin}.json")
+
+
+def get_domain_asins(domain: str) -> list[str]:
+	'''
+		Returns the ASINs of the downloaded products of a domain
+	'''
+	with os.scandir(os.path.join(path_products_root, domain)) as entries:
+		return sorted(
+		    entry.name[:-5] for entry in entries if entry.name.endswith(".json"))
+
+
+def load_product(domain: str,
+                 asin: str,
+                 max_std_multiplier: Optional[float] = None) -> dict:
+	'''
+		Loads a product and returns it with its csv parsed, organized and
+		discretized (and without outliers if max_std_multiplier is set)
+	'''
+	with open(get_product_path(domain, asin), "rb") as f:
+		result_object = orjson.loads(f.read())
+	product = result_object["products"][0]
+	csv = get_organized_csv(product["csv"])
+	if max_std_multiplier is not None:
+		csv = remove_outliers_csv(csv, max_std_multiplier)
+	product["csv"] = discretize_csv_smart(csv)
+	return product
+
+
+def ingest_chunk(
+    task: Tuple[str, list[str], Optional[float], bool, int]
+) -> Tuple[dict[str, ProductCsv] | TrendAccumulator, list[Tuple[str, str]]]:
+	'''
+		Loads a chunk of products. Returns the csv of every product by ASIN (or a
+		TrendAccumulator of the chunk if aggregate) and the failed ASINs with
+		their errors.
+	'''
+	domain, asins, max_std_multiplier, aggregate, minimum_datapoints = task
+	products = {}  # type: dict[str, ProductCsv]
+	accumulator = TrendAccumulator()
+	fails = []
+	for asin in asins:
+		try:
+			product = load_product(domain, asin, max_std_multiplier)
+		except Exception as e:
+			# missing files across domains, products without a csv etc.
+			fails.append((asin, repr(e)))
+			continue
+		if aggregate:
+			accumulator.add(product["csv"], minimum_datapoints)
+		else:
+			products[asin] = product["csv"]
+	return (accumulator if aggregate else products), fails
+
+
+def iter_chunks(domain: str,
+                asins: list[str],
+                max_std_multiplier: Optional[float] = None,
+                aggregate: bool = False,
+                minimum_datapoints: int = -1,
+                jobs: int = jobs,
+                chunksize: int = chunksize) -> Iterator[tuple]:
+	'''
+		Yields the results of ingest_chunk as the chunks are finished (in no
+		particular order)
+	'''
+	tasks = [(domain, asins[i:i + chunksize], max_std_multiplier, aggregate,
+	          minimum_datapoints) for i in range(0, len(asins), chunksize)]
+	if jobs <= 1:
+		yield from map(ingest_chunk, tasks)
+		return
+	with multiprocessing.Pool(jobs) as pool:
+		yield from pool.imap_unordered(ingest_chunk, tasks)
+
+
+def ingest(
+    domain: str,
+    asins: list[str],
+    max_std_multiplier: Optional[float] = None,
+    jobs: int = jobs,
+    chunksize: int = chunksize
+) -> Tuple[dict[str, ProductCsv], list[Tuple[str, str]]]:
+	'''
+		Loads the products of a domain in parallel. Returns the discretized csv of
+		every product by ASIN and the failed ASINs with their errors.
+	'''
+	products = {}  # type: dict[str, ProductCsv]
+	fails = []
+	for chunk_products, chunk_fails in iter_chunks(domain,
+	                                               asins,
+	                                               max_std_multiplier,
+	                                               jobs=jobs,
+	                                               chunksize=chunksize):
+		products.update(chunk_products)
+		fails.extend(chunk_fails)
+	# same order as asins
+	products = {asin: products[asin] for asin in asins if asin in products}
+	return products, fails
+
+
+def ingest_trends(
+    domain: str,
+    asins: list[str],
+    max_std_multiplier: Optional[float] = None,
+    minimum_datapoints: int = -1,
+    accumulator: Optional[TrendAccumulator] = None,
+    jobs: int = jobs,
+    chunksize: int = chunksize
+) -> Tuple[TrendAccumulator, list[Tuple[str, str]]]:
+	'''
+		Loads the products of a domain in parallel and adds them to the
+		accumulator (a new one by default). Returns the accumulator and the
+		failed ASINs with their errors.
+	'''
+	if accumulator is None:
+		accumulator = TrendAccumulator()
+	fails = []
+	for chunk_accumulator, chunk_fails in iter_chunks(domain,
+	                                                  asins,
+	                                                  max_std_multiplier,
+	                                                  True,
+	                                                  minimum_datapoints,
+	                                                  jobs=jobs,
+	                                                  chunksize=chunksize):
+		accumulator.merge(chunk_accumulator)
+		fails.extend(chunk_fails)
+	return accumulator, fails
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--domain", type=str, default="1")
+	parser.add_argument(
+	    "--asins",
+	    type=str,
+	    default=None,
+	    help="File with one ASIN per line (all products of the domain by default)"
+	)
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=None,
+	                    help="Max. number of products")
+	parser.add_argument("--jobs", type=int, default=jobs)
+	parser.add_argument("--chunksize", type=int, default=chunksize)
+	parser.add_argument("--max-std-multiplier",
+	                    type=float,
+	                    default=None,
+	                    help="Remove outliers before discretizing")
+	parser.add_argument("--aggregate",
+	                    action="store_true",
+	                    help="Accumulate trends instead of returning products")
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	if args.asins is not None:
+		with open(args.asins, "r") as f:
+			asins = [line.strip() for line in f if line.strip() != ""]
+	else:
+		asins = get_domain_asins(args.domain)
+	asins = asins[:args.limit]
+	time_start = time.time()
+	if args.aggregate:
+		accumulator, fails = ingest_trends(args.domain,
+		                                   asins,
+		                                   args.max_std_multiplier,
+		                                   jobs=args.jobs,
+		                                   chunksize=args.chunksize)
+		count = accumulator.products
+	else:
+		products, fails = ingest(args.domain,
+		                         asins,
+		                         args.max_std_multiplier,
+		                         jobs=args.jobs,
+		                         chunksize=args.chunksize)
+		count = len(products)
+	elapsed = time.time() - time_start
+	print(
+	    f"Loaded {count}/{len(asins)} products in {round(elapsed, 3)}s ({round(count / elapsed, 1)} products/s, {args.jobs} jobs)"
+	)
+	for asin, error in fails[:10]:
+		print(f"Failed: {asin} ({error})")
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
@@ -0,0 +1,542 @@
+'''
+Vectorized versions of the time series primitives in keepa_analysis_utils.py.
+
+The functions have the same names and arguments, but work on whole arrays
+instead of Python loops over datetime objects:
+	- dates are floored to days with datetime64[D] (instead of get_clean_date
+		per element)
+	- discretize / discretize_smart find the runs of equal days with one
+		comparison of neighbouring days and pick the last (first) value of every
+		run by index
+	- remove_outliers filters with a boolean mask (instead of np.append in a
+		loop, which is quadratic)
+	- trends keep (days, sums, counts) arrays per trend key - adding a product
+		is a np.unique + np.bincount over the days (float sums, the dict version
+		truncates prices to integers), get_timeseries_from_trends is a slice of
+		the arrays instead of a day by day walk over the calendar
+	- TrendAccumulator keeps the sums and counts of all products in (trend key
+		x day) matrices of a fixed calendar - adding a product is a np.add.at,
+		partial accumulators of parallel workers are merged by adding matrices
+
+Outputs are numerically equivalent to keepa_analysis_utils.py (dates are
+returned as datetime64[D] instead of datetime objects), see benchmark().
+
+Converting datetime objects to datetime64 is slow - parse the product csv with
+get_organized_csv (keepa's parse_csv with to_datetime=False) to get
+datetime64 dates from the start.
+
+Usage:
+	python src/py/scraping/keepa/keepa_timeseries.py --domain 1 --limit 2000
+'''
+
+import os
+import sys
+import time
+import json
+import argparse
+from typing import Optional, Tuple
+import numpy as np
+import numpy.typing as npt
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.keepa.keepa_analysis_utils import organize_csv, parse_csv
+
+# Globals
+path_products_root = "data/keepa/products/domains"
+OPERATIONS = ["average", "sum", "count"]
+# calendar of TrendAccumulator (keepa's time starts in 2011)
+date_epoch = "2011-01-01"
+date_end = "2025-12-31"
+
+# (days, sums, counts) per trend key
+Trends = dict[str, Tuple[npt.NDArray[np.datetime64], npt.NDArray[np.float64],
+                         npt.NDArray[np.int64]]]
+
+
+def get_organized_csv(
+    csv: list
+) -> dict[str, Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]]:
+	'''
+		Parses and organizes a product's csv (see organize_csv) with datetime64[m]
+		dates instead of datetime objects
+	'''
+	return organize_csv(parse_csv(csv, to_datetime=False))
+
+
+def to_days(dates: npt.NDArray) -> npt.NDArray[np.datetime64]:
+	'''
+		Floors dates (datetime objects or datetime64) to days
+	'''
+	dates = np.asarray(dates)
+	if dates.dtype == object:
+		# keepa dates have minute resolution
+		dates = dates.astype("datetime64[m]")
+	return dates.astype("datetime64[D]")
+
+
+def get_run_bounds(
+    days: npt.NDArray[np.datetime64]
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+	'''
+		Returns the first and last index of every run of equal consecutive days
+	'''
+	is_start = np.ones(len(days), dtype=bool)
+	is_start[1:] = days[1:] != days[:-1]
+	starts = np.flatnonzero(is_start)
+	ends = np.append(starts[1:] - 1, len(days) - 1)
+	return starts, ends
+
+
+def discretize(
+    arr_values: npt.NDArray[np.float64], arr_dates: npt.NDArray
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]:
+	'''
+		Converts all dates in a time series to only keep the year, month and day,
+		choosing the most recent consecutive date and discarding all others
+		(the last value of every day for sorted dates).
+	'''
+	if len(arr_values) != len(arr_dates):
+		raise ValueError('Length of arr_values and arr_dates must be equal.')
+	arr_values = np.asarray(arr_values)
+	days = to_days(arr_dates)
+	if len(days) == 0:
+		return arr_values[:0], days
+	_, ends = get_run_bounds(days)
+	return arr_values[ends], days[ends]
+
+
+def discretize_smart(
+    arr_values: npt.NDArray[np.float64], arr_dates: npt.NDArray
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]:
+	'''
+		Similar to discretize, but trying to fill the gaps in the time series by
+		using the first data point within a day as the value to impute the
+		previous day if missing (the previous day isn't in the series).
+		The last data point within the day is used for that specific day.
+	'''
+	if len(arr_values) != len(arr_dates):
+		raise ValueError('Length of arr_values and arr_dates must be equal.')
+	arr_values = np.asarray(arr_values)
+	days = to_days(arr_dates)
+	if len(days) == 0:
+		return arr_values[:0], days
+	starts, ends = get_run_bounds(days)
+	run_days = days[starts]
+	# a day with several data points imputes the previous day, unless the
+	# previous run already is the previous day
+	is_imputed = ends > starts
+	is_imputed[1:] &= run_days[:-1] != run_days[1:] - 1
+	# every run takes one slot, preceded by the imputed one
+	positions = np.arange(len(starts)) + np.cumsum(is_imputed)
+	positions_imputed = positions[is_imputed] - 1
+	values = np.empty(len(starts) + np.count_nonzero(is_imputed),
+	                  dtype=arr_values.dtype)
+	dates = np.empty(len(values), dtype="datetime64[D]")
+	values[positions] = arr_values[ends]
+	dates[positions] = run_days
+	values[positions_imputed] = arr_values[starts[is_imputed]]
+	dates[positions_imputed] = run_days[is_imputed] - 1
+	return values, dates
+
+
+def discretize_csv_smart(
+    organized_csv: dict[str, Tuple[npt.NDArray[np.float64], npt.NDArray]]
+) -> dict[str, Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]]:
+	'''
+		Discretizes the organized csv using the discretize_smart function (in
+		place, the csv is returned as well).
+	'''
+	for k, v in organized_csv.items():
+		organized_csv[k] = discretize_smart(v[0], v[1])
+	return organized_csv
+
+
+def remove_outliers(
+    values: npt.NDArray[np.float64],
+    dates: npt.NDArray,
+    max_std_multiplier: float = 2
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray]:
+	'''
+		Removes all values further than max_std_multiplier standard deviations
+		from the mean (and below 0) with their dates.
+	'''
+	if len(values) == 0:
+		return values, dates
+	mean = np.mean(values)
+	std = np.std(values)
+	lower_bound = max(0, mean - max_std_multiplier * std)
+	upper_bound = mean + max_std_multiplier * std
+	mask = (values >= lower_bound) & (values <= upper_bound)
+	return values[mask], np.asarray(dates)[mask]
+
+
+def remove_outliers_csv(
+    csv: dict[str, Tuple[npt.NDArray[np.float64], npt.NDArray]],
+    max_std_multiplier: float = 2
+) -> dict[str, Tuple[npt.NDArray[np.float64], npt.NDArray]]:
+	'''
+		Removes all outliers from the given csv. Returns a new csv.
+	'''
+	return {
+	    key: remove_outliers(values, dates, max_std_multiplier)
+	    for key, (values, dates) in csv.items()
+	}
+
+
+def get_daily_sums(
+    values: npt.NDArray[np.float64],
+    dates: npt.NDArray,
+    date_start: str | np.datetime64,
+    date_end: str | np.datetime64,
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.int64]]:
+	'''
+		Returns the sum and the number of values of every day of the dense
+		calendar date_start - date_end (inclusive, values outside are dropped)
+	'''
+	day_start = np.datetime64(date_start, "D")
+	n_days = int((np.datetime64(date_end, "D") - day_start).astype(int)) + 1
+	offsets = (to_days(dates) - day_start).astype(np.int64)
+	mask = (offsets >= 0) & (offsets < n_days)
+	sums = np.bincount(offsets[mask],
+	                   weights=np.asarray(values, dtype=np.float64)[mask],
+	                   minlength=n_days)
+	counts = np.bincount(offsets[mask], minlength=n_days)
+	return sums, counts
+
+
+def get_trends(organized_csv: dict[str, Tuple[npt.NDArray[np.float64],
+                                              npt.NDArray]],
+               trends: Optional[Trends] = None,
+               minimum_datapoints: int = -1) -> Tuple[Trends, list[str]]:
+	'''
+		Adds the time series of a product to the trends - per trend key and day
+		the sum of the values and the number of products (see get_trends in
+		keepa_analysis_utils.py). Returns the trends and the keys which were
+		skipped for having less than minimum_datapoints values.
+	'''
+	if trends is None:
+		trends = {}
+	skipped_product_keys = []  # these do not have enough datapoints
+	for trend_type, (values, dates) in organized_csv.items():
+		if minimum_datapoints != -1 and len(values) < minimum_datapoints:
+			skipped_product_keys.append(trend_type)
+			continue
+		days = to_days(dates)
+		values = np.asarray(values, dtype=np.float64)
+		counts = np.ones(len(days), dtype=np.int64)
+		if trend_type in trends:
+			# existing sums first - the additions happen in the same order as in
+			# the dict version
+			days_old, sums_old, counts_old = trends[trend_type]
+			days = np.concatenate([days_old, days])
+			values = np.concatenate([sums_old, values])
+			counts = np.concatenate([counts_old, counts])
+		days_unique, inverse = np.unique(days, return_inverse=True)
+		trends[trend_type] = (
+		    days_unique,
+		    np.bincount(inverse, weights=values, minlength=len(days_unique)),
+		    np.bincount(inverse, weights=counts,
+		                minlength=len(days_unique)).astype(np.int64),
+		)
+	return trends, skipped_product_keys
+
+
+def get_timeseries_from_trends(
+    trends: "Trends | TrendAccumulator",
+    trend_key: str,
+    operation: str = "average"
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]:
+	'''
+		Returns a tuple of values and dates for a specific trend key (the days
+		with data, in order).
+	'''
+	if isinstance(trends, TrendAccumulator):
+		return trends.get_timeseries(trend_key, operation)
+	if operation not in OPERATIONS:
+		raise ValueError(f"Invalid operation: {operation}")
+	days, sums, counts = trends[trend_key]
+	if operation == "average":
+		return sums / counts, days
+	if operation == "sum":
+		return sums, days
+	# number of instances of a trend key for a specific date
+	return counts.astype(np.float64), days
+
+
+class TrendAccumulator:
+	'''
+		Sums and counts of the values of many products per trend key and day.
+
+		Replaces the trends dicts of get_trends (one small numpy array per
+		product-day) with two preallocated float64 matrices indexed by (trend key,
+		day offset from date_start), so memory grows with trend keys x days and
+		not with the number of products. Values outside of the calendar are
+		dropped (and counted in dropped).
+
+		Accumulators filled by parallel workers (same calendar) are combined with
+		merge - they are plain numpy arrays, so they pickle cheaply.
+	'''
+
+	def __init__(self,
+	             date_start: str = date_epoch,
+	             date_end: str = date_end,
+	             keys: Optional[list[str]] = None):
+		self.day_start = np.datetime64(date_start, "D")
+		self.n_days = int(
+		    (np.datetime64(date_end, "D") - self.day_start).astype(int)) + 1
+		self.keys = {}  # type: dict[str, int]
+		self.sums = np.zeros((0, self.n_days), dtype=np.float64)
+		self.counts = np.zeros((0, self.n_days), dtype=np.float64)
+		self.products = 0
+		self.dropped = 0
+		for key in keys or []:
+			self.get_row(key)
+
+	def get_row(self, key: str) -> int:
+		'''
+			Returns the row of the trend key (adds it if it's new)
+		'''
+		if key not in self.keys:
+			if len(self.keys) == len(self.sums):
+				# grow the matrices (rarely - there are ~30 csv types)
+				rows = max(8, 2 * len(self.sums)) - len(self.sums)
+				padding = np.zeros((rows, self.n_days), dtype=np.float64)
+				self.sums = np.concatenate([self.sums, padding])
+				self.counts = np.concatenate([self.counts, padding])
+			self.keys[key] = len(self.keys)
+		return self.keys[key]
+
+	def add(self,
+	        organized_csv: dict[str, Tuple[npt.NDArray[np.float64],
+	                                       npt.NDArray]],
+	        minimum_datapoints: int = -1) -> list[str]:
+		'''
+			Adds the time series of a product. Returns the keys which were skipped
+			for having less than minimum_datapoints values.
+		'''
+		skipped_product_keys = []  # these do not have enough datapoints
+		for key, (values, dates) in organized_csv.items():
+			if minimum_datapoints != -1 and len(values) < minimum_datapoints:
+				skipped_product_keys.append(key)
+				continue
+			offsets = (to_days(dates) - self.day_start).astype(np.int64)
+			mask = (offsets >= 0) & (offsets < self.n_days)
+			self.dropped += len(offsets) - int(np.count_nonzero(mask))
+			row = self.get_row(key)
+			np.add.at(self.sums[row], offsets[mask],
+			          np.asarray(values, dtype=np.float64)[mask])
+			np.add.at(self.counts[row], offsets[mask], 1)
+		self.products += 1
+		return skipped_product_keys
+
+	def merge(self, other: "TrendAccumulator") -> "TrendAccumulator":
+		'''
+			Adds the sums and counts of another accumulator (with the same
+			calendar). Returns self.
+		'''
+		if other.day_start != self.day_start or other.n_days != self.n_days:
+			raise ValueError("Accumulators must have the same calendar.")
+		for key, row_other in other.keys.items():
+			row = self.get_row(key)
+			self.sums[row] += other.sums[row_other]
+			self.counts[row] += other.counts[row_other]
+		self.products += other.products
+		self.dropped += other.dropped
+		return self
+
+	def get_dates(self) -> npt.NDArray[np.datetime64]:
+		return self.day_start + np.arange(self.n_days)
+
+	def get_timeseries(
+	    self,
+	    key: str,
+	    operation: str = "average",
+	    dense: bool = False
+	) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.datetime64]]:
+		'''
+			Returns the values and dates of a trend key - the days with data (same
+			as get_timeseries_from_trends) or, if dense, every day from the first
+			to the last day with data (averages of days without data are NaN).
+		'''
+		if operation not in OPERATIONS:
+			raise ValueError(f"Invalid operation: {operation}")
+		row = self.keys[key]
+		counts = self.counts[row]
+		days_with_data = np.flatnonzero(counts)
+		if dense:
+			if len(days_with_data) == 0:
+				days = slice(0, 0)
+			else:
+				days = slice(days_with_data[0], days_with_data[-1] + 1)
+		else:
+			days = days_with_data
+		dates = self.get_dates()[days]
+		if operation == "sum":
+			return self.sums[row, days], dates
+		if operation == "count":
+			return counts[days], dates
+		return np.divide(self.sums[row, days],
+		                 counts[days],
+		                 out=np.full(len(dates), np.nan),
+		                 where=counts[days] > 0), dates
+
+	def to_trends(self) -> Trends:
+		'''
+			Returns the trends in the format of get_trends
+		'''
+		trends = {}  # type: Trends
+		for key, row in self.keys.items():
+			days = np.flatnonzero(self.counts[row])
+			trends[key] = (self.day_start + days, self.sums[row, days],
+			               self.counts[row, days].astype(np.int64))
+		return trends
+
+	def __contains__(self, key: str) -> bool:
+		return key in self.keys
+
+	def __iter__(self):
+		return iter(self.keys)
+
+	def __len__(self) -> int:
+		return len(self.keys)
+
+
+def load_products(domain: str, limit: Optional[int] = None) -> list[dict]:
+	'''
+		Loads the csv of the downloaded products of a domain
+	'''
+	folderpath = os.path.join(path_products_root, domain)
+	products = []
+	with os.scandir(folderpath) as entries:
+		for entry in entries:
+			if not entry.name.endswith(".json"):
+				continue
+			with open(entry.path, "r") as f:
+				result_object = json.load(f)
+			products.append(result_object["products"][0])
+			if limit is not None and len(products) >= limit:
+				break
+	return products
+
+
+def is_equivalent(values_a: npt.NDArray, dates_a: npt.NDArray,
+                  values_b: npt.NDArray, dates_b: npt.NDArray) -> bool:
+	return len(values_a) == len(values_b) and np.allclose(
+	    np.asarray(values_a, dtype=np.float64),
+	    np.asarray(values_b, dtype=np.float64),
+	    rtol=0,
+	    atol=0,
+	    equal_nan=True) and np.array_equal(to_days(dates_a), to_days(dates_b))
+
+
+def benchmark(domain: str,
+              limit: Optional[int] = None,
+              max_std_multiplier: float = 3,
+              minimum_datapoints: int = 100) -> None:
+	'''
+		Runs the category analysis pipeline (remove_outliers_csv,
+		discretize_csv_smart, get_trends, get_timeseries_from_trends) over the
+		products of a domain with keepa_analysis_utils.py and with this module,
+		checks that the outputs are the same and compares the run times
+	'''
+	from src.py.scraping.keepa import keepa_analysis_utils as utils
+	products = load_products(domain, limit)
+	print(f"{len(products)} products")
+	times = {}
+	outputs = {}
+	pipelines = [
+	    ("loops", utils, lambda csv: utils.organize_csv(utils.parse_csv(csv))),
+	    ("vectorized", sys.modules[__name__], get_organized_csv),
+	]
+	for name, module, get_csv in pipelines:
+		time_start = time.perf_counter()
+		trends = {}  # type: dict
+		discretized = []
+		for product in products:
+			csv = module.remove_outliers_csv(get_csv(product["csv"]),
+			                                 max_std_multiplier)
+			module.discretize_csv_smart(csv)
+			discretized.append(csv)
+			trends, _ = module.get_trends(csv, trends, minimum_datapoints)
+		series = {
+		    (key, operation):
+		        module.get_timeseries_from_trends(trends, key, operation)
+		    for key in trends for operation in OPERATIONS
+		}
+		times[name] = time.perf_counter() - time_start
+		outputs[name] = (discretized, series)
+		print(f"{name:>12}: {times[name]:.3f}s")
+	print(f"Speedup: {times['loops'] / times['vectorized']:.2f}x")
+	discretized_loops, series_loops = outputs["loops"]
+	discretized_vectorized, series_vectorized = outputs["vectorized"]
+	for csv_loops, csv_vectorized in zip(discretized_loops,
+	                                     discretized_vectorized):
+		for key in csv_loops:
+			assert is_equivalent(*csv_loops[key], *csv_vectorized[key]), key
+	for key in series_loops:
+		values_loops, dates_loops = series_loops[key]
+		values_vectorized, dates_vectorized = series_vectorized[key]
+		assert np.array_equal(to_days(dates_loops), dates_vectorized), key
+		if key[1] == "count":
+			assert np.array_equal(values_loops, values_vectorized), key
+	# the dict version sums into integer arrays (truncating prices) - the sums
+	# are compared with the same loop using float sums
+	trends_reference = {}  # type: dict
+	for csv in discretized_loops:
+		for trend_type, (values, dates) in csv.items():
+			if len(values) < minimum_datapoints:
+				continue
+			trend = trends_reference.setdefault(trend_type, {})
+			for value, date in zip(values, dates):
+				if date not in trend:
+					trend[date] = np.array([0.0, 0.0])
+				trend[date] += [value, 1]
+	for (key, operation), (values, dates) in series_vectorized.items():
+		if operation == "count":
+			continue
+		trend = trends_reference[key]
+		reference = np.array([
+		    trend[date][0] /
+		    trend[date][1] if operation == "average" else trend[date][0]
+		    for date in sorted(trend)
+		])
+		assert np.array_equal(values, reference, equal_nan=True), key
+	# the same trends in a TrendAccumulator (filled by two "workers")
+	time_start = time.perf_counter()
+	accumulators = [TrendAccumulator(), TrendAccumulator()]
+	for i, csv in enumerate(discretized_vectorized):
+		accumulators[i % 2].add(csv, minimum_datapoints)
+	accumulator = accumulators[0].merge(accumulators[1])
+	print(
+	    f"{'accumulator':>12}: {time.perf_counter() - time_start:.3f}s (trends only, {(accumulator.sums.nbytes + accumulator.counts.nbytes) / 2**20:.1f} MiB)"
+	)
+	for (key, operation), (values, dates) in series_vectorized.items():
+		values_accumulator, dates_accumulator = get_timeseries_from_trends(
+		    accumulator, key, operation)
+		assert np.array_equal(dates, dates_accumulator), key
+		assert np.allclose(values, values_accumulator, rtol=1e-12,
+		                   equal_nan=True), key
+	print("Outputs are equivalent.")
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--domain", type=str, default="1")
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=2000,
+	                    help="Max. number of products")
+	return parser.parse_args()
+
+
+def main():
+	args = get_args()
+	benchmark(args.domain, args.limit)
+
+
+if __name__ == "__main__":
+	main()
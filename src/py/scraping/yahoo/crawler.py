@@ -7,15 +7,16 @@ import time
 import random
 from typing import Tuple
 import requests
-import bs4 as bs
 from datetime import datetime
-from collections import deque
 
 # TODO: fix some symbols not being crawled - requests.get("https://finance.yahoo.com/quote/IMOS", timeout=10)
 
 # Project imports
 sys.path.append(os.getcwd())
 from src.py.utils.logger import Logger
+from src.py.utils.scraping.html_parser import get_soup
+from src.py.scraping.yahoo.crawler_index import IndexStore
+from src.py.scraping.yahoo.crawler_frontier import Frontier
 
 # Globals
 symbol_entrypoint = "ASML"  # NVDA, ASML
@@ -27,9 +28,18 @@ stop_path = os.path.join(script_path,
 output_path_root = "data/scraped/yahoo"
 time_format = "%Y-%m-%dT%H:%M:%S.%f%z"
 index = {}
-crawl_queue = deque()
+crawl_queue = Frontier()
 crawl_count_limit = 100
 fails = {}
+# Index changes are appended to index.log.jsonl and compacted into index.json
+# (see crawler_index.py) instead of rewriting index.json after every symbol
+index_flush_every = 25  # flush after this many changes
+index_flush_interval = 30.0  # or after this many seconds
+index_compact_every = 1000  # compact the log into index.json after this many records
+index_store = IndexStore(index_path,
+                         flush_every=index_flush_every,
+                         flush_interval=index_flush_interval,
+                         compact_every=index_compact_every)
 logger = Logger({
     "filepath": os.path.join(*[output_path_root, "logs", "crawler.log"]),
     "level": "DEBUG",
@@ -96,14 +106,13 @@ def load_index(index_path: str = index_path) -> dict:
 	'''
 		Loads the index from a file
 	'''
-	index = {}
 	if not os.path.exists(index_path):
 		logger.info("Index file does not exist, creating a new one...")
-		index = get_default_index()
 	else:
 		logger.info("Index file exists, loading it...")
-		with open(index_path, "r", encoding="utf-8") as f:
-			index = json.load(f)
+	if os.path.exists(index_store.log_path):
+		logger.info(f"Replaying index log '{index_store.log_path}'...")
+	index = index_store.load(get_default_index)
 	# If symbol_entrypoint is not in index, add it
 	# as we can load the old index with a new symbol_entrypoint
 	# Example: we want to expand the index with a new symbol_entrypoint
@@ -117,9 +126,7 @@ def load_index(index_path: str = index_path) -> dict:
 		# Update metadata
 		index["metadata"]["updated_at"] = datetime.now().astimezone().strftime(
 		    time_format)
-	# Save index
-	logger.info("Saving index...")
-	save_index(index)
+	# The index is saved when the crawl queue is attached (see main)
 	return index
 
 
@@ -131,19 +138,15 @@ def save_index(index: dict, index_path: str = index_path) -> None:
 		json.dump(index, f, indent='\t', default=str)
 
 
-def get_crawl_queue(index: dict) -> deque:
+def get_crawl_queue(index: dict) -> Frontier:
 	'''
 		Returns a queue of symbols to crawl
 	'''
-	queue = deque()
 	# for symbol in index["symbols"]:
 	# 	if not index["symbols"][symbol]["is_crawled"]:
 	# 		queue.append(symbol)
-	index_queue = index["queue"]
-	for symbol in index_queue:
-		queue.append(symbol)
-	if symbol_entrypoint not in queue:
-		queue.appendleft(symbol_entrypoint)
+	queue = Frontier(index["queue"])
+	queue.push(symbol_entrypoint, left=True)
 	return queue
 
 
@@ -181,28 +184,17 @@ def get_quote_page(symbol: str) -> Tuple[str, None] | Tuple[None, str]:
 	return res.text, None
 
 
-def process_quote_page(
-    symbol: str, quote_page: str) -> Tuple[dict, None] | Tuple[None, str]:
+def parse_quote_page(symbol: str,
+                     quote_page: str) -> Tuple[dict, None] | Tuple[None, str]:
 	'''
-		Processes the quote page contents
+		Extracts the symbol's data from the quote page contents (doesn't use the
+		index, so it can run in a separate process)
 	'''
-	# We should only return an object if there are no errors
 	try:
-		soup = bs.BeautifulSoup(quote_page, "html.parser")
-		logger.info(f"Processing quote page for '{symbol}'...")
-		symbol_object = index["symbols"].get(symbol, None)
-		if symbol_object is None:
-			logger.info(
-			    f"Symbol '{symbol}' not in index, creating a new object for it...")
-			symbol_object = get_default_symbol_object(symbol)
-		if symbol_object["is_crawled"]:
-			err_msg = f"Symbol '{symbol}' already crawled, skipping..."
-			return None, err_msg
+		soup = get_soup(quote_page)
 		# Get title
-		logger.info(f"Getting title...")
 		title = soup.find("h1").text  # type: ignore
 		# Get exchange
-		logger.info(f"Getting exchange...")
 		exchange = soup.find("div", {
 		    "id": "quote-header-info"
 		}).find(  # type: ignore
@@ -211,13 +203,10 @@ def process_quote_page(
 		        "class": "C($tertiaryColor)"
 		    }).text  # type: ignore
 		# Get quote url
-		logger.info(f"Getting quote url...")
 		quote_url = f"{url_root}/quote/{symbol}"
 		# Get history url
-		logger.info(f"Getting history url...")
 		history_url = f"{url_root}/quote/{symbol}/history"
 		# Get similar
-		logger.info(f"Getting similar symbols...")
 		similar_symbols = soup.find("section", {
 		    "id": "similar-by-symbol"
 		}).find("table").find_all("tr")  # type: ignore
@@ -233,7 +222,6 @@ def process_quote_page(
 		for similar_symbol in similar_symbols:
 			similar[similar_symbol] = similar_symbol
 		# Get recommended
-		logger.info(f"Getting recommended symbols...")
 		recommended_symbols = soup.find("section", {
 		    "id": "recommendations-by-symbol"
 		}).find("table").find_all("tr")  # type: ignore
@@ -250,7 +238,6 @@ def process_quote_page(
 		for recommended_symbol in recommended_symbols:
 			recommended[recommended_symbol] = recommended_symbol
 		# Get company profile
-		logger.info(f"Getting company profile...")
 		company_profile = soup.find("div", {
 		    "class": "Mb(25px)"
 		}).find_all("p")  # type: ignore
@@ -275,25 +262,58 @@ def process_quote_page(
 		        "details": details_decoded,
 		    }
 		}
-		# Update symbol object
-		logger.info(f"Updating symbol object...")
-		symbol_object["title"] = title
-		symbol_object["exchange"] = exchange
-		symbol_object["url_quote"] = quote_url
-		symbol_object["url_history"] = history_url
-		symbol_object["similar"] = similar
-		symbol_object["recommended"] = recommended
-		symbol_object["company_profile"] = company_profile
-		symbol_object["is_crawled"] = True
-		symbol_object["crawl_index"] = index["metadata"]["symbols_crawled"] + 1
-		symbol_object["updated_at"] = datetime.now().astimezone().strftime(
-		    time_format)
-		return symbol_object, None
+		data = {
+		    "title": title,
+		    "exchange": exchange,
+		    "url_quote": quote_url,
+		    "url_history": history_url,
+		    "similar": similar,
+		    "recommended": recommended,
+		    "company_profile": company_profile,
+		}
+		return data, None
 	except Exception as e:
 		err_msg = f"Error processing quote page for '{symbol}'! ({json.dumps(e, indent='  ', default=str)})"
 		return None, err_msg
 
 
+def get_updated_symbol_object(
+    symbol: str, data: dict) -> Tuple[dict, None] | Tuple[None, str]:
+	'''
+		Returns the symbol's object from the index updated with the parsed data
+	'''
+	symbol_object = index["symbols"].get(symbol, None)
+	if symbol_object is None:
+		logger.info(
+		    f"Symbol '{symbol}' not in index, creating a new object for it...")
+		symbol_object = get_default_symbol_object(symbol)
+	if symbol_object["is_crawled"]:
+		err_msg = f"Symbol '{symbol}' already crawled, skipping..."
+		return None, err_msg
+	# Update symbol object
+	logger.info(f"Updating symbol object...")
+	symbol_object.update(data)
+	symbol_object["is_crawled"] = True
+	symbol_object["crawl_index"] = index["metadata"]["symbols_crawled"] + 1
+	symbol_object["updated_at"] = datetime.now().astimezone().strftime(
+	    time_format)
+	return symbol_object, None
+
+
+def process_quote_page(
+    symbol: str, quote_page: str) -> Tuple[dict, None] | Tuple[None, str]:
+	'''
+		Processes the quote page contents
+	'''
+	# We should only return an object if there are no errors
+	logger.info(f"Processing quote page for '{symbol}'...")
+	data, err_msg = parse_quote_page(symbol, quote_page)
+	if err_msg:
+		return None, err_msg
+	assert data is not None
+	return get_updated_symbol_object(symbol, data)
+
+
 def handle_fail(symbol: str, repeat: bool = False) -> None:
 	'''
 		Handles a failed symbol
@@ -305,7 +325,7 @@ def handle_fail(symbol: str, repeat: bool = False) -> None:
 		logger.info(
 		    f"Repeating symbol: '{symbol}' - putting it at the end of the queue..."
 		)
-		crawl_queue.append(symbol)
+		crawl_queue.push(symbol)
 	# Update fails
 	logger.info(f"Updating fails...")
 	if symbol not in fails:
@@ -314,16 +334,49 @@ def handle_fail(symbol: str, repeat: bool = False) -> None:
 	# Update index fails
 	logger.info(f"Updating index fails...")
 	index["fails"] = fails
+	index_store.update_fail(symbol, fails[symbol])
 	# Update index metadata
 	logger.info(f"Updating index metadata...")
 	index["metadata"]["updated_at"] = datetime.now().astimezone().strftime(
 	    time_format)
-	# Save index
-	logger.info(f"Saving index...")
-	save_index(index)
+	index_store.update_metadata()
+	# Save index changes (batched)
+	if index_store.maybe_flush():
+		logger.info(f"Saved index changes")
 	logger.info("")
 
 
+def update_index(symbol: str, symbol_object: dict) -> None:
+	'''
+		Adds a crawled symbol to the index and enqueues its similar and
+		recommended symbols
+	'''
+	# Update index
+	index_store.update_symbol(symbol, symbol_object)
+	# Update crawl queue with symbols from similar and recommended
+	logger.info(f"Updating crawl queue...")
+	symbols_similar = symbol_object["similar"]
+	symbols_recommended = symbol_object["recommended"]
+	symbols_to_enqueue = {}
+	symbols_to_enqueue.update(
+	    symbols_similar)  # NOTE: should we only use similar?
+	symbols_to_enqueue.update(symbols_recommended)
+	for symbol_to_enqueue in symbols_to_enqueue:
+		if (symbol_to_enqueue not in index["symbols"] or
+		    index["symbols"][symbol_to_enqueue]["is_crawled"] == False):
+			crawl_queue.push(symbol_to_enqueue)
+	# Update index metadata
+	logger.info(f"Updating index metadata...")
+	index["metadata"]["updated_at"] = datetime.now().astimezone().strftime(
+	    time_format)
+	index["metadata"][
+	    "symbols_crawled"] = index["metadata"]["symbols_crawled"] + 1
+	index_store.update_metadata()
+	# Save index changes (batched - queue operations are logged on flush)
+	if index_store.maybe_flush():
+		logger.info(f"Saved index changes")
+
+
 def crawl() -> None:
 	'''
 		Responsible for crawling the queue
@@ -337,9 +390,9 @@ def crawl() -> None:
 			    f"Symbols crawled limit reached ({crawl_count_limit}), stopping...")
 			break
 		if os.path.exists(stop_path):
-			logger.info(f"Stop file found, stopping...")
+			logger.info(f"Stop file found, saving index and stopping...")
 			break
-		symbol = crawl_queue.popleft()
+		symbol = crawl_queue.pop()
 		logger.info(f"Crawling symbol: '{symbol}'")
 		quote_page, err_msg = get_quote_page(symbol)
 		# Sleep for a random amount of time - regardless of error
@@ -361,34 +414,7 @@ def crawl() -> None:
 			handle_fail(symbol, repeat=False)
 			continue
 		assert symbol_object is not None
-		# Update index
-		index["symbols"][symbol] = symbol_object
-		# Update crawl queue with symbols from similar and recommended
-		logger.info(f"Updating crawl queue...")
-		symbols_similar = symbol_object["similar"]
-		symbols_recommended = symbol_object["recommended"]
-		symbols_to_enqueue = {}
-		symbols_to_enqueue.update(
-		    symbols_similar)  # NOTE: should we only use similar?
-		symbols_to_enqueue.update(symbols_recommended)
-		for symbol_to_enqueue in symbols_to_enqueue:
-			if (symbol_to_enqueue not in index["symbols"] or
-			    index["symbols"][symbol_to_enqueue]["is_crawled"]
-			    == False) and symbol_to_enqueue not in crawl_queue:
-				crawl_queue.append(symbol_to_enqueue)
-		# Update index queue
-		logger.info(f"Updating index queue...")
-		index_queue = list(crawl_queue)
-		index["queue"] = index_queue
-		# Update index metadata
-		logger.info(f"Updating index metadata...")
-		index["metadata"]["updated_at"] = datetime.now().astimezone().strftime(
-		    time_format)
-		index["metadata"][
-		    "symbols_crawled"] = index["metadata"]["symbols_crawled"] + 1
-		# Save index
-		logger.info(f"Saving index...")
-		save_index(index)
+		update_index(symbol, symbol_object)
 		logger.info(f"Done crawling symbol: '{symbol}'")
 		logger.info("")
 
@@ -404,13 +430,20 @@ def main() -> None:
 	index = load_index()
 	fails = index["fails"]
 	crawl_queue = get_crawl_queue(index)
+	logger.info("Saving index...")
+	index_store.set_frontier(crawl_queue)
 	logger.info(f"Crawl queue: {crawl_queue}")
 	cookie = load_cookie(cookie_path)
-	crawl()
+	try:
+		crawl()
+	finally:
+		# Checkpoint on limit / stop file / error
+		logger.info("Saving index...")
+		index_store.checkpoint()
 	fails_text = json.dumps(fails, indent='\t')
 	logger.info(f"Fails:\n{fails_text}")
 
 
 if __name__ == "__main__":
 	main()
-	print("Done!")
\ No newline at end of file
+	print("Done!")
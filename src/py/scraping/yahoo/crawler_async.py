@@ -0,0 +1,312 @@
+'''
+Pipelined version of crawler.py.
+
+The crawl runs in three overlapping stages:
+	- fetch: up to `concurrency` quote pages are downloaded at once (aiohttp)
+		through an adaptive token bucket (see
+		src/py/utils/scraping/rate_limiter.py) - the politeness budget replaces
+		the random 1-3s sleep between symbols
+	- parse: process_quote_page's HTML parsing (parse_quote_page) runs in a
+		process pool so it doesn't block the event loop
+	- write: a single coroutine applies the parsed symbols to the index, extends
+		the crawl queue and persists the changes (IndexStore), so the index is
+		only ever modified from one place
+
+The index, crawl queue, fails, limits and the stop file are shared with
+crawler.py, so both modes can continue each other's crawl.
+
+Usage:
+	python src/py/scraping/yahoo/crawler_async.py --concurrency 8 --rate 2 --processes 4
+'''
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+import aiohttp
+
+# Project imports
+sys.path.append(os.getcwd())
+from src.py.scraping.yahoo import crawler
+from src.py.utils.scraping.rate_limiter import HostRateLimiter, get_backoff, get_retry_after
+
+# Globals
+concurrency = 8  # max. number of requests in flight
+rate = 2.0  # max. requests per second
+retries = 3  # retries per symbol (429, 5xx and network errors)
+processes = max(1, (os.cpu_count() or 2) - 1)  # parse processes
+logger = crawler.logger
+pool = None  # type: Optional[ProcessPoolExecutor] # parse processes
+# Symbols started but not yet written (the writer can enqueue a symbol again
+# while it is being fetched)
+symbols_in_flight = set()  # type: set[str]
+stats = {
+    "crawled": 0,
+    "failed": 0,
+    "throttled": 0,
+}
+
+
+async def fetch_quote_page(session: aiohttp.ClientSession,
+                           limiter: HostRateLimiter,
+                           symbol: str) -> tuple[str, None] | tuple[None, str]:
+	'''
+		Downloads the quote page of a symbol (with retries)
+	'''
+	url = f"{crawler.url_root}/quote/{symbol}"
+	err_msg = f"Error getting quote page for '{symbol}'!"
+	for attempt in range(retries + 1):
+		bucket = await limiter.acquire(url)
+		try:
+			async with session.get(url) as response:
+				if response.status == 200:
+					quote_page = await response.text()
+					bucket.on_success()
+					return quote_page, None
+				err_msg = f"Error getting quote page for '{symbol}'! (Status code: {response.status})"
+				if response.status == 429:
+					stats["throttled"] += 1
+					retry_after = get_retry_after(response.headers.get("Retry-After"))
+					pause = bucket.on_throttle(retry_after)
+					logger.warning(
+					    f"Got status code 429 for '{symbol}' - lowering the rate to {round(bucket.rate, 3)} req/s and pausing for {round(pause, 3)}s."
+					)
+					continue
+				if response.status < 500:
+					# 404 etc. - retrying won't help
+					return None, err_msg
+		except Exception as e:
+			err_msg = f"Error getting quote page for '{symbol}'! ({e})"
+		logger.warning(f"{err_msg} (attempt {attempt + 1})")
+		await asyncio.sleep(get_backoff(attempt))
+	return None, err_msg
+
+
+def get_pool() -> ProcessPoolExecutor:
+	'''
+		Creates the pool of parse processes
+	'''
+	# spawn - forked children would inherit the event loop and open sockets
+	return ProcessPoolExecutor(max_workers=processes,
+	                           mp_context=multiprocessing.get_context("spawn"))
+
+
+def restart_pool(pool_broken: ProcessPoolExecutor) -> None:
+	'''
+		Replaces a broken pool (a parse process died) with a new one - once, even
+		if several symbols find it broken
+	'''
+	global pool
+	if pool is not pool_broken:
+		return
+	logger.error("Parse pool is broken (a parse process died). Restarting it...")
+	pool_broken.shutdown(wait=False, cancel_futures=True)
+	pool = get_pool()
+
+
+async def parse_quote_page(
+    symbol: str, quote_page: str) -> tuple[dict, None] | tuple[None, str]:
+	'''
+		Parses the quote page in the pool (retried once in a new pool if the
+		pool breaks)
+	'''
+	loop = asyncio.get_running_loop()
+	pool_current = pool
+	assert pool_current is not None
+	try:
+		return await loop.run_in_executor(pool_current, crawler.parse_quote_page,
+		                                  symbol, quote_page)
+	except BrokenProcessPool:
+		restart_pool(pool_current)
+	# once more in the new pool (if it breaks again the error goes to the caller)
+	return await loop.run_in_executor(pool, crawler.parse_quote_page, symbol,
+	                                  quote_page)
+
+
+async def fetch_and_parse(session: aiohttp.ClientSession,
+                          limiter: HostRateLimiter, symbol: str,
+                          results: asyncio.Queue) -> None:
+	'''
+		Fetch and parse stages for one symbol - the result (or the error) always
+		goes to the writer, which releases the symbol
+	'''
+	data = None
+	try:
+		quote_page, err_msg = await fetch_quote_page(session, limiter, symbol)
+		if quote_page is not None:
+			data, err_msg = await parse_quote_page(symbol, quote_page)
+	except Exception as e:
+		# broken pool, pickling errors etc.
+		data, err_msg = None, f"Error crawling '{symbol}'! ({repr(e)})"
+	await results.put((symbol, data, err_msg))
+
+
+async def write_results(results: asyncio.Queue, time_start: float) -> None:
+	'''
+		Writer stage - the only place where the index and the crawl queue are
+		extended. Stops when it receives None.
+	'''
+	while True:
+		item = await results.get()
+		if item is None:
+			return
+		symbol, data, err_msg = item
+		symbols_in_flight.discard(symbol)
+		symbol_object = None
+		if err_msg is None:
+			assert data is not None
+			symbol_object, err_msg = crawler.get_updated_symbol_object(symbol, data)
+		if err_msg is not None:
+			logger.error(err_msg)
+			stats["failed"] += 1
+			crawler.handle_fail(symbol, repeat=False)
+		else:
+			assert symbol_object is not None
+			crawler.update_index(symbol, symbol_object)
+			stats["crawled"] += 1
+			logger.info(f"Done crawling symbol: '{symbol}'")
+		done = stats["crawled"] + stats["failed"]
+		if done % 10 == 0:
+			elapsed = time.time() - time_start
+			logger.info(
+			    f"{done} symbols - {round(done / elapsed, 3)} symbols/s ({stats['failed']} failed, {stats['throttled']} throttled, {len(crawler.crawl_queue)} queued)"
+			)
+
+
+def get_stop_reason(in_flight: int) -> Optional[str]:
+	'''
+		Returns why no more symbols should be started (None if they should)
+	'''
+	symbols_crawled = crawler.index["metadata"]["symbols_crawled"]
+	if symbols_crawled + in_flight >= crawler.crawl_count_limit:
+		return f"Symbols crawled limit reached ({crawler.crawl_count_limit}), stopping..."
+	if os.path.exists(crawler.stop_path):
+		return "Stop file found, saving index and stopping..."
+	return None
+
+
+async def crawl() -> None:
+	'''
+		Starts symbols from the crawl queue as fetch slots free up
+	'''
+	time_start = time.time()
+	limiter = HostRateLimiter(rate)
+	connector = aiohttp.TCPConnector(limit=concurrency,
+	                                 limit_per_host=concurrency)
+	timeout = aiohttp.ClientTimeout(total=30)
+	headers = {"User-Agent": crawler.user_agent}
+	global pool
+	pool = get_pool()
+	results = asyncio.Queue()
+	writer = asyncio.create_task(write_results(results, time_start))
+	in_flight = set()  # type: set[asyncio.Task]
+	try:
+		async with aiohttp.ClientSession(connector=connector,
+		                                 timeout=timeout,
+		                                 headers=headers) as session:
+			while True:
+				reason = get_stop_reason(len(symbols_in_flight))
+				if reason is not None:
+					logger.info(reason)
+					break
+				if len(crawler.crawl_queue) == 0 and len(symbols_in_flight) == 0:
+					# Nothing queued and nothing left for the writer to enqueue
+					break
+				if len(crawler.crawl_queue) == 0 or len(in_flight) >= concurrency:
+					if len(in_flight) > 0:
+						await asyncio.wait(in_flight,
+						                   timeout=1,
+						                   return_when=asyncio.FIRST_COMPLETED)
+					else:
+						await asyncio.sleep(0.1)
+					continue
+				symbol = crawler.crawl_queue.pop()
+				symbol_object = crawler.index["symbols"].get(symbol, None)
+				if symbol_object is not None and symbol_object["is_crawled"]:
+					logger.info(f"Symbol '{symbol}' already crawled, skipping...")
+					continue
+				if symbol in symbols_in_flight:
+					continue
+				logger.info(f"Crawling symbol: '{symbol}'")
+				task = asyncio.create_task(
+				    fetch_and_parse(session, limiter, symbol, results))
+				in_flight.add(task)
+				symbols_in_flight.add(symbol)
+				task.add_done_callback(in_flight.discard)
+			if len(in_flight) > 0:
+				await asyncio.gather(*in_flight)
+	finally:
+		await results.put(None)
+		await writer
+		pool.shutdown()
+		pool = None
+	elapsed = time.time() - time_start
+	logger.info(
+	    f"Crawled {stats['crawled']} symbols in {round(elapsed, 3)}s ({round(stats['crawled'] / elapsed, 3)} symbols/s)."
+	)
+
+
+def get_args():
+	'''
+		Parses command line arguments
+	'''
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--concurrency",
+	                    type=int,
+	                    default=concurrency,
+	                    help="Max. number of requests in flight")
+	parser.add_argument("--rate",
+	                    type=float,
+	                    default=rate,
+	                    help="Max. requests per second")
+	parser.add_argument("--retries",
+	                    type=int,
+	                    default=retries,
+	                    help="Retries per symbol")
+	parser.add_argument("--processes",
+	                    type=int,
+	                    default=processes,
+	                    help="Number of parse processes")
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=crawler.crawl_count_limit,
+	                    help="Max. number of crawled symbols in the index")
+	return parser.parse_args()
+
+
+def main() -> None:
+	'''
+		Main function
+	'''
+	global concurrency, rate, retries, processes
+	args = get_args()
+	concurrency = args.concurrency
+	rate = args.rate
+	retries = args.retries
+	processes = args.processes
+	crawler.crawl_count_limit = args.limit
+	crawler.index = crawler.load_index()
+	crawler.fails = crawler.index["fails"]
+	crawler.crawl_queue = crawler.get_crawl_queue(crawler.index)
+	logger.info("Saving index...")
+	crawler.index_store.set_frontier(crawler.crawl_queue)
+	logger.info(f"Crawl queue: {crawler.crawl_queue}")
+	try:
+		asyncio.run(crawl())
+	finally:
+		# Checkpoint on limit / stop file / error
+		logger.info("Saving index...")
+		crawler.index_store.checkpoint()
+	fails_text = json.dumps(crawler.fails, indent='\t')
+	logger.info(f"Fails:\n{fails_text}")
+
+
+if __name__ == "__main__":
+	main()
+	print("Done!")
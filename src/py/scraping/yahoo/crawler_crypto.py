@@ -5,12 +5,12 @@ import time
 import random
 import requests
 from typing import Tuple
-from bs4 import BeautifulSoup
 from datetime import datetime
 
 # Project imports
 sys.path.append(os.getcwd())
 from src.py.utils.generic_utils import wrapper
+from src.py.utils.scraping.html_parser import parse
 
 # Example url: "https://finance.yahoo.com/crypto?count=100&offset=0
 
@@ -52,12 +52,12 @@ def scrape_page(page_index: int) -> Tuple[list, None] | Tuple[None, Exception]:
 		return None, error
 	assert page is not None
 	# Get div with id=scr-res-table
-	soup = BeautifulSoup(page, 'html.parser')
-	div = soup.find('div', {'id': 'scr-res-table'})
+	root = parse(page)
+	div = root.css_first('div#scr-res-table')
 	# Get all <a> tags where data-test="quoteLink"
 	if div is None:
 		return None, Exception("Could not find div with id=scr-res-table")
-	a_tags = div.find_all('a', {'data-test': 'quoteLink'})  # type: ignore
+	a_tags = div.css("a[data-test='quoteLink']")
 	urls = []
 	for a_tag in a_tags:
 		urls.append(a_tag['href'])
@@ -0,0 +1,120 @@
+# Crawl frontier (queue of symbols to crawl) for the Yahoo crawler
+
+import time
+from collections import deque
+from typing import Iterable, Iterator
+
+
+class Frontier:
+	'''
+		FIFO queue of symbols with O(1) membership checks.
+
+		A deque keeps the crawl order and a set mirrors its contents, so
+		"is this symbol already queued" doesn't scan the queue. Every push / pop
+		is also recorded as an operation, which IndexStore appends to its log
+		instead of a copy of the whole queue (see drain_ops and replay).
+	'''
+
+	def __init__(self, symbols: Iterable[str] = ()):
+		self.queue = deque()  # type: deque[str]
+		self.queued = set()  # type: set[str]
+		self.ops = []  # type: list[list]
+		for symbol in symbols:
+			self.push(symbol)
+		# the initial contents are part of the snapshot, not new operations
+		self.ops = []
+
+	def __len__(self) -> int:
+		return len(self.queue)
+
+	def __contains__(self, symbol: str) -> bool:
+		return symbol in self.queued
+
+	def __iter__(self) -> Iterator[str]:
+		return iter(self.queue)
+
+	def __repr__(self) -> str:
+		return f"Frontier({list(self.queue)})"
+
+	def push(self, symbol: str, left: bool = False) -> bool:
+		'''
+			Adds a symbol to the end (or the front) of the queue. Returns False if
+			it is already queued.
+		'''
+		if symbol in self.queued:
+			return False
+		if left:
+			self.queue.appendleft(symbol)
+		else:
+			self.queue.append(symbol)
+		self.queued.add(symbol)
+		self.ops.append(["pushleft" if left else "push", symbol])
+		return True
+
+	def pop(self) -> str:
+		'''
+			Removes and returns the symbol at the front of the queue.
+		'''
+		symbol = self.queue.popleft()
+		self.queued.discard(symbol)
+		# consecutive pops are stored as a count
+		if len(self.ops) > 0 and self.ops[-1][0] == "pop":
+			self.ops[-1][1] += 1
+		else:
+			self.ops.append(["pop", 1])
+		return symbol
+
+	def snapshot(self) -> list[str]:
+		return list(self.queue)
+
+	def drain_ops(self) -> list[list]:
+		'''
+			Returns the operations since the last call.
+		'''
+		ops = self.ops
+		self.ops = []
+		return ops
+
+	@staticmethod
+	def replay(queue: deque, ops: list[list]) -> deque:
+		'''
+			Applies operations returned by drain_ops to a queue.
+		'''
+		for op in ops:
+			if op[0] == "push":
+				queue.append(op[1])
+			elif op[0] == "pushleft":
+				queue.appendleft(op[1])
+			elif op[0] == "pop":
+				for _ in range(min(op[1], len(queue))):
+					queue.popleft()
+		return queue
+
+
+def benchmark(sizes: list[int] = [1000, 10000, 100000],
+              batch: int = 1000) -> None:
+	'''
+		Compares the cost of enqueueing a batch of new symbols (with the
+		membership check) as the queue grows - a deque with "not in" against the
+		Frontier.
+	'''
+	print(f"{'queue size':>12}{'deque (us/op)':>16}{'frontier (us/op)':>18}")
+	for size in sizes:
+		symbols = [f"S{i}" for i in range(size)]
+		new_symbols = [f"N{i}" for i in range(batch)]
+		queue = deque(symbols)
+		time_start = time.perf_counter()
+		for symbol in new_symbols:
+			if symbol not in queue:
+				queue.append(symbol)
+		time_deque = (time.perf_counter() - time_start) / batch * 1e6
+		frontier = Frontier(symbols)
+		time_start = time.perf_counter()
+		for symbol in new_symbols:
+			frontier.push(symbol)
+		time_frontier = (time.perf_counter() - time_start) / batch * 1e6
+		print(f"{size:>12}{time_deque:>16.3f}{time_frontier:>18.3f}")
+
+
+if __name__ == "__main__":
+	benchmark()
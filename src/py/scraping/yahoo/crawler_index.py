@@ -0,0 +1,160 @@
+# Incremental persistence of the crawler index
+
+import os
+import json
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from src.py.scraping.yahoo.crawler_frontier import Frontier
+
+
+class IndexStore:
+	'''
+		Persists the crawler index incrementally.
+
+		Changes (crawled symbols, fails, metadata) are buffered and appended to a
+		JSON lines log next to index.json every flush_every changes or
+		flush_interval seconds, instead of re-serialising the whole index after
+		every symbol. The log is periodically compacted into index.json (same
+		format as before, so scraper.py and the notebooks keep working).
+
+		The crawl queue is logged as the frontier's push / pop operations since
+		the last compaction, not as a copy of the whole queue.
+
+		On load, index.json is read and the log is replayed on top of it.
+	'''
+
+	def __init__(self,
+	             index_path: str,
+	             flush_every: int = 25,
+	             flush_interval: float = 30.0,
+	             compact_every: int = 1000):
+		self.index_path = index_path
+		self.log_path = index_path.replace(".json", ".log.jsonl")
+		self.flush_every = flush_every
+		self.flush_interval = flush_interval
+		self.compact_every = compact_every
+		self.frontier = None  # type: Optional[Frontier]
+		self.index = {}  # type: dict
+		self.buffer = []  # type: list[str]
+		self.records_in_log = 0
+		self.time_last_flush = time.time()
+
+	def load(self, get_default_index: Callable[[], dict]) -> dict:
+		'''
+			Loads index.json and replays the log on top of it.
+		'''
+		if os.path.exists(self.index_path):
+			with open(self.index_path, "r", encoding="utf-8") as f:
+				self.index = json.load(f)
+		else:
+			self.index = get_default_index()
+		if os.path.exists(self.log_path):
+			self.index["queue"] = deque(self.index["queue"])
+			with open(self.log_path, "r", encoding="utf-8") as f:
+				for line in f:
+					try:
+						record = json.loads(line)
+					except json.JSONDecodeError:
+						# partially written last line
+						continue
+					self.apply(record)
+					self.records_in_log += 1
+			self.index["queue"] = list(self.index["queue"])
+		return self.index
+
+	def apply(self, record: dict) -> None:
+		'''
+			Applies a log record to the in-memory index.
+		'''
+		if record["type"] == "symbol":
+			self.index["symbols"][record["symbol"]] = record["data"]
+		elif record["type"] == "fail":
+			self.index["fails"][record["symbol"]] = record["count"]
+		elif record["type"] == "metadata":
+			self.index["metadata"] = record["data"]
+		elif record["type"] == "queue":
+			self.index["queue"] = deque(record["data"])
+		elif record["type"] == "queue_ops":
+			Frontier.replay(self.index["queue"], record["data"])
+
+	def set_frontier(self, frontier: Frontier) -> None:
+		'''
+			Attaches the crawl queue. Compacts, so the logged queue operations
+			start from the frontier's current contents.
+		'''
+		self.frontier = frontier
+		self.flush()
+		self.compact()
+
+	def append(self, record: dict) -> None:
+		self.buffer.append(json.dumps(record, default=str))
+
+	def update_symbol(self, symbol: str, symbol_object: dict) -> None:
+		self.index["symbols"][symbol] = symbol_object
+		self.append({"type": "symbol", "symbol": symbol, "data": symbol_object})
+
+	def update_fail(self, symbol: str, count: int) -> None:
+		self.index["fails"][symbol] = count
+		self.append({"type": "fail", "symbol": symbol, "count": count})
+
+	def update_metadata(self) -> None:
+		self.append({"type": "metadata", "data": self.index["metadata"]})
+
+	def log_queue(self) -> None:
+		if self.frontier is not None:
+			ops = self.frontier.drain_ops()
+			if len(ops) > 0:
+				self.append({"type": "queue_ops", "data": ops})
+
+	def maybe_flush(self) -> bool:
+		'''
+			Flushes if enough changes are buffered or enough time has passed.
+		'''
+		if len(self.buffer) >= self.flush_every or (
+		    len(self.buffer) > 0 and
+		    time.time() - self.time_last_flush >= self.flush_interval):
+			self.flush()
+			return True
+		return False
+
+	def flush(self) -> None:
+		'''
+			Appends the buffered changes (and queue operations) to the log.
+		'''
+		self.log_queue()
+		if len(self.buffer) > 0:
+			with open(self.log_path, "a", encoding="utf-8") as f:
+				f.write("\n".join(self.buffer) + "\n")
+				f.flush()
+				os.fsync(f.fileno())
+			self.records_in_log += len(self.buffer)
+			self.buffer = []
+		self.time_last_flush = time.time()
+		if self.records_in_log >= self.compact_every:
+			self.compact()
+
+	def compact(self) -> None:
+		'''
+			Writes the whole index to index.json (atomically) and truncates the log.
+		'''
+		if self.frontier is not None:
+			self.index["queue"] = self.frontier.snapshot()
+			self.frontier.drain_ops()
+		index_path_tmp = self.index_path + ".tmp"
+		with open(index_path_tmp, "w", encoding="utf-8") as f:
+			json.dump(self.index, f, indent='\t', default=str)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(index_path_tmp, self.index_path)
+		if os.path.exists(self.log_path):
+			os.remove(self.log_path)
+		self.records_in_log = 0
+
+	def checkpoint(self) -> None:
+		'''
+			Flushes everything and compacts (on stop / exit).
+		'''
+		self.flush()
+		self.compact()
@@ -12,11 +12,11 @@ import time
 from typing import Tuple
 import requests
 from datetime import datetime, timezone
-from bs4 import BeautifulSoup as bs
 
 # Project imports
 sys.path.append(os.getcwd())
 from src.py.utils.logger import Logger
+from src.py.utils.scraping.html_parser import get_soup
 
 # Globals
 script_path = os.path.dirname(os.path.realpath(__file__))
@@ -118,7 +118,7 @@ def get_profile_data(
 	logger.info("Getting company data from profile page...")
 	try:
 		profile_data = {}
-		soup = bs(profile_page, "html.parser")
+		soup = get_soup(profile_page)
 		# element_profile_container = soup.find("div",
 		#                                       {"class": "asset-profile-container"})
 		# assert element_profile_container is not None
@@ -1,27 +1,182 @@
 import os
+import sys
+import time
+import queue
+import atexit
 import logging
+import logging.handlers
 import json
 from typing import Optional
 
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+# Background writers of async loggers (key = logger name)
+listeners = {}  # type: dict[str, BatchingQueueListener]
+
+
+class JsonFormatter(logging.Formatter):
+	'''Formats records as JSON lines'''
+
+	def format(self, record: logging.LogRecord) -> str:
+		return json.dumps(
+		    {
+		        "time":
+		            self.formatTime(record, "%Y-%m-%dT%H:%M:%S") +
+		            f".{int(record.msecs):03d}",
+		        "level":
+		            record.levelname,
+		        "message":
+		            record.getMessage(),
+		    },
+		    ensure_ascii=False)
+
+
+class BatchingFileHandler(logging.FileHandler):
+	'''
+	File handler which only flushes every batch_size records (or when the
+	BatchingQueueListener has drained its queue) instead of after every record
+	'''
+
+	def __init__(self, filepath: str, batch_size: int = 100, **kwargs):
+		super().__init__(filepath, **kwargs)
+		self.batch_size = batch_size
+		self.pending = 0
+
+	def flush(self):
+		self.pending += 1
+		if self.pending >= self.batch_size:
+			self.flush_batch()
+
+	def flush_batch(self):
+		self.pending = 0
+		super().flush()
+
+	def close(self):
+		self.flush_batch()
+		super().close()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+	'''
+	Queue listener which flushes its handlers whenever the queue is drained, so
+	records are written in batches under load and immediately when idle
+	'''
+
+	def flush_handlers(self):
+		for handler in self.handlers:
+			if isinstance(handler, BatchingFileHandler):
+				handler.flush_batch()
+			else:
+				handler.flush()
+
+	def dequeue(self, block: bool):
+		try:
+			return self.queue.get(block=False)
+		except queue.Empty:
+			self.flush_handlers()
+			return self.queue.get(block)
+
+
+class LightQueueHandler(logging.handlers.QueueHandler):
+	'''
+	Queue handler which leaves the formatting to the background thread (the
+	default one formats every record in the calling thread)
+	'''
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		# merge the %-style args so the record no longer references them
+		record.msg = record.getMessage()
+		record.args = None
+		return record
+
+
+@atexit.register
+def stop_listeners():
+	'''
+	Writes out the remaining records of all async loggers at exit (listener
+	threads are daemon threads)
+	'''
+	for name in list(listeners.keys()):
+		listener = listeners.pop(name)
+		listener.stop()
+		listener.flush_handlers()
+
+
+def get_async_handler(options: dict,
+                      file_handler: logging.Handler) -> logging.Handler:
+	'''
+	Returns a QueueHandler whose records are written by a background thread
+	(file and console output)
+	'''
+	handlers = [file_handler]
+	if options["console"]:
+		console_handler = logging.StreamHandler(sys.stdout)
+		console_handler.setFormatter(logging.Formatter("%(message)s"))
+		handlers.append(console_handler)
+	log_queue = queue.SimpleQueue()
+	listener = BatchingQueueListener(log_queue,
+	                                 *handlers,
+	                                 respect_handler_level=False)
+	listener.start()
+	listeners[options["filepath"]] = listener
+	return LightQueueHandler(log_queue)
+
 
 def get_logger(options: dict) -> logging.Logger:
+	'''
+	Options:
+	- filepath: log file path (required)
+	- level: minimum level (default INFO) - lower levels are dropped before formatting
+	- formatter: logging.Formatter for the file
+	- json: write JSON lines instead of formatted text (default False)
+	- console: also print messages to stdout (default True)
+	- async: write the file and console output from a background thread in
+		batches (default False) - call stop() to flush when done
+	- batch_size: max. number of records per write in async mode (default 100)
+	'''
 	if "filepath" not in options:
 		raise Exception("Missing filepath in options")
 	if not os.path.exists(os.path.dirname(options["filepath"])):
 		os.makedirs(os.path.dirname(options["filepath"]))
 	if "level" not in options:
 		options["level"] = "INFO"
+	if "console" not in options:
+		options["console"] = True
+	if "async" not in options:
+		options["async"] = False
 	if "formatter" not in options:
-		options["formatter"] = logging.Formatter(
-		    '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
-		    datefmt='%Y-%m-%d %H:%M:%S')
-	handler = logging.FileHandler(options["filepath"],
-	                              mode="a+",
-	                              encoding="utf-8")
+		if options.get("json", False):
+			options["formatter"] = JsonFormatter()
+		else:
+			options["formatter"] = logging.Formatter(
+			    '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+			    datefmt='%Y-%m-%d %H:%M:%S')
+	if options["async"]:
+		handler = BatchingFileHandler(options["filepath"],
+		                              batch_size=options.get("batch_size", 100),
+		                              mode="a+",
+		                              encoding="utf-8")
+	else:
+		handler = logging.FileHandler(options["filepath"],
+		                              mode="a+",
+		                              encoding="utf-8")
 	handler.setFormatter(options["formatter"])
 	logger = logging.getLogger(options["filepath"])
 	logger.setLevel(options["level"])
-	logger.addHandler(handler)
+	if options["async"]:
+		logger.addHandler(get_async_handler(options, handler))
+	else:
+		logger.addHandler(handler)
+	# used by say() to decide whether to print (async loggers print from the
+	# background thread)
+	logger.print_messages = options["console"] and not options[  # type: ignore
+	    "async"]
 	logger.info("=============================================================")
 	logger.info(
 	    f"Starting logger with options: {json.dumps(options, indent=2, sort_keys=True, default=str)}"
@@ -30,6 +185,15 @@ def get_logger(options: dict) -> logging.Logger:
 
 
 def stop_logger(logger: logging.Logger):
+	# Async loggers - write out the remaining records first
+	listener = listeners.pop(logger.name, None)
+	if listener is not None:
+		listener.stop()
+		for handler in listener.handlers:
+			try:
+				handler.close()
+			except Exception as e:
+				print(f"Exception while closing logger handler: {e}")
 	for handler in logger.handlers[:]:
 		try:
 			handler.close()
@@ -38,23 +202,26 @@ def stop_logger(logger: logging.Logger):
 			print(f"Exception while closing logger handler: {e}")
 
 
-def say(message: str, logger: logging.Logger, level: Optional[str] = "INFO"):
+def say(message: str,
+        logger: logging.Logger,
+        level: Optional[str] = "INFO",
+        *args):
+	'''
+	Logs and prints the message. Messages below the logger's level are dropped
+	before any formatting - pass %-style args instead of using f-strings to
+	also defer the formatting of the message itself
+	(e.g. say("Got %d items", logger, "DEBUG", count)).
+	'''
 	if level is None:
 		level = "INFO"
-	level = level.upper()
-	if level == "INFO":
-		logger.info(message)
-	elif level == "DEBUG":
-		logger.debug(message)
-	elif level == "WARNING":
-		logger.warning(message)
-	elif level == "ERROR":
-		logger.error(message)
-	elif level == "CRITICAL":
-		logger.critical(message)
-	else:
-		logger.info(message)
-	print(message, flush=True)
+	levelno = LEVELS.get(level.upper(), logging.INFO)
+	if not logger.isEnabledFor(levelno):
+		return
+	logger.log(levelno, message, *args)
+	if getattr(logger, "print_messages", True):
+		if args:
+			message = message % args
+		print(message, flush=True)
 
 
 def test_get_logger():
@@ -99,23 +266,27 @@ class Logger():
 		self.options = options
 		self.logger = get_logger(options)
 
-	def say(self, message: str, level: Optional[str] = "INFO"):
-		say(message, self.logger, level)
+	def say(self, message: str, level: Optional[str] = "INFO", *args):
+		say(message, self.logger, level, *args)
+
+	def info(self, message: str, *args):
+		self.say(message, "INFO", *args)
 
-	def info(self, message: str):
-		self.say(message, "INFO")
+	def error(self, message: str, *args):
+		self.say(message, "ERROR", *args)
 
-	def error(self, message: str):
-		self.say(message, "ERROR")
+	def debug(self, message: str, *args):
+		self.say(message, "DEBUG", *args)
 
-	def debug(self, message: str):
-		self.say(message, "DEBUG")
+	def warning(self, message: str, *args):
+		self.say(message, "WARNING", *args)
 
-	def warning(self, message: str):
-		self.say(message, "WARNING")
+	def critical(self, message: str, *args):
+		self.say(message, "CRITICAL", *args)
 
-	def critical(self, message: str):
-		self.say(message, "CRITICAL")
+	def is_enabled(self, level: str) -> bool:
+		'''Use to guard expensive messages in hot loops'''
+		return self.logger.isEnabledFor(LEVELS.get(level.upper(), logging.INFO))
 
 	def stop(self):
 		stop_logger(self.logger)
@@ -150,6 +321,23 @@ def test_Logger():
 	logger.critical("(LOGGER 3) CRITICAL message 1")
 
 
+def test_Logger_async():
+	logger = Logger({
+	    "filepath": "logs/test_async.log",
+	    "level": "INFO",
+	    "async": True,
+	    "json": True,
+	})
+	logger.info("(ASYNC) INFO message 1")
+	logger.debug("(ASYNC) DEBUG message - dropped %s", "before formatting")
+	logger.info("(ASYNC) %d items in %.3fs", 42, 1.5)
+	time_start = time.time()
+	for i in range(100000):
+		logger.debug("(ASYNC) suppressed %d", i)
+	print(f"100000 suppressed DEBUG messages in {time.time() - time_start}s")
+	logger.stop()
+
+
 if __name__ == "__main__":
 	# print(f"Testing get_logger()")
 	# test_get_logger()
@@ -157,4 +345,6 @@ if __name__ == "__main__":
 	# test_say()
 	print(f"Testing Logger()")
 	test_Logger()
+	print(f"Testing Logger() (async)")
+	test_Logger_async()
 	print("ALL DONE")
\ No newline at end of file
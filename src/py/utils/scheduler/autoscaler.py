@@ -0,0 +1,156 @@
+'''
+Concurrency controller for the scheduler.
+
+Adjusts the target number of concurrently running workers between
+workers_min and workers_max using AIMD (additive increase, multiplicative
+decrease), based on:
+	- smoothed (EWMA) system CPU and memory utilization
+	- memory used per task (RSS of the scheduler's child processes / active workers)
+	- optionally the error rate and latency of recently finished tasks
+
+The limit starts at workers_max (like the scheduler without autoscaling). It
+is decreased by a factor when a scale down threshold is exceeded and increased
+by one step per update while the pool is saturated (all slots busy and tasks
+waiting) and one more task (of the average size) would still stay below the
+scale down thresholds.
+
+HTTP bound pools therefore shrink when they hit the error / latency limits
+(e.g. rate limiting) and grow back towards workers_max, CPU bound pools settle
+around the number of cores.
+'''
+
+import time
+from collections import deque
+from typing import Optional
+
+
+def ewma(previous: Optional[float], value: float, alpha: float) -> float:
+	'''
+		Exponentially weighted moving average.
+	'''
+	if previous is None:
+		return value
+	return alpha * value + (1 - alpha) * previous
+
+
+class ConcurrencyController:
+	'''
+		AIMD controller for the number of concurrent workers.
+	'''
+
+	def __init__(self,
+	             workers_min: int,
+	             workers_max: int,
+	             utilization_settings: dict,
+	             workers_start: Optional[int] = None,
+	             increase_step: int = 1,
+	             decrease_factor: float = 0.75,
+	             cooldown: float = 5.0,
+	             alpha: float = 0.3,
+	             error_rate_threshold: Optional[float] = None,
+	             latency_factor: Optional[float] = None,
+	             window: int = 50):
+		self.workers_min = max(1, workers_min)
+		self.workers_max = max(self.workers_min, workers_max)
+		self.utilization_settings = utilization_settings
+		if workers_start is None:
+			workers_start = self.workers_max
+		self.limit = min(self.workers_max, max(self.workers_min, workers_start))
+		self.increase_step = increase_step
+		self.decrease_factor = decrease_factor
+		self.cooldown = cooldown
+		self.alpha = alpha
+		self.error_rate_threshold = error_rate_threshold
+		self.latency_factor = latency_factor
+		self.cpu = None  # type: Optional[float]
+		self.mem = None  # type: Optional[float]
+		self.rss_per_task = 0.0  # bytes
+		self.outcomes = deque(maxlen=window)  # (duration, success)
+		self.latency = None  # type: Optional[float]
+		self.latency_baseline = None  # type: Optional[float]
+		self.time_last_decrease = 0.0
+		self.reason = "init"  # reason for the last change (for logging)
+
+	def record_task(self, duration: float, exit_code: int) -> None:
+		'''
+			Records the outcome of a finished task (attempt).
+		'''
+		success = exit_code == 0
+		self.outcomes.append((duration, success))
+		if success:
+			self.latency = ewma(self.latency, duration, self.alpha)
+			if len(self.outcomes) >= self.outcomes.maxlen / 2 and (
+			    self.latency_baseline is None or
+			    self.latency < self.latency_baseline):
+				self.latency_baseline = self.latency
+
+	def get_error_rate(self) -> Optional[float]:
+		if len(self.outcomes) < self.outcomes.maxlen / 2:
+			return None
+		fails = sum(1 for _, success in self.outcomes if not success)
+		return fails / len(self.outcomes)
+
+	def get_scale_down_reason(self) -> Optional[str]:
+		'''
+			Returns why the limit should be decreased (None if it shouldn't).
+		'''
+		assert self.cpu is not None and self.mem is not None
+		if self.cpu > self.utilization_settings["cpu"]["scale_down_threshold"]:
+			return f"CPU {round(self.cpu, 1)}%"
+		if self.mem > self.utilization_settings["memory"]["scale_down_threshold"]:
+			return f"memory {round(self.mem, 1)}%"
+		error_rate = self.get_error_rate()
+		if self.error_rate_threshold is not None and error_rate is not None:
+			if error_rate > self.error_rate_threshold:
+				return f"error rate {round(error_rate, 3)}"
+		if self.latency_factor is not None and self.latency is not None:
+			baseline = self.latency_baseline
+			if baseline is not None and self.latency > baseline * self.latency_factor:
+				return f"latency {round(self.latency, 3)}s (baseline {round(baseline, 3)}s)"
+		return None
+
+	def can_scale_up(self, mem_total: float) -> bool:
+		'''
+			Returns whether one more worker fits below the scale down thresholds.
+		'''
+		assert self.cpu is not None and self.mem is not None
+		if self.cpu >= self.utilization_settings["cpu"]["scale_down_threshold"]:
+			return False
+		# Would one more task (of the average size) push memory over the limit?
+		mem_projected = self.mem
+		if mem_total > 0:
+			mem_projected += self.rss_per_task / mem_total * 100
+		return mem_projected < self.utilization_settings["memory"][
+		    "scale_down_threshold"]
+
+	def update(self, reading: dict, workers_active: int,
+	           tasks_queued: int) -> int:
+		'''
+			Updates the controller with a new resource reading and returns the new
+			concurrency limit. The reading must contain cpu_percent, mem_percent,
+			mem_total and rss_children (bytes).
+		'''
+		self.cpu = ewma(self.cpu, reading["cpu_percent"], self.alpha)
+		self.mem = ewma(self.mem, reading["mem_percent"], self.alpha)
+		if workers_active > 0:
+			self.rss_per_task = ewma(self.rss_per_task or None,
+			                         reading["rss_children"] / workers_active,
+			                         self.alpha)
+		now = time.time()
+		reason = self.get_scale_down_reason()
+		if reason is not None:
+			cooled_down = now - self.time_last_decrease >= self.cooldown
+			if cooled_down and self.limit > self.workers_min:
+				self.limit = max(self.workers_min,
+				                 int(self.limit * self.decrease_factor))
+				self.time_last_decrease = now
+				self.reason = f"scale down ({reason})"
+				# measure errors / latency at the new level from scratch
+				self.outcomes.clear()
+			return self.limit
+		saturated = workers_active >= self.limit and tasks_queued > 0
+		if saturated and self.limit < self.workers_max and self.can_scale_up(
+		    reading["mem_total"]):
+			self.limit = min(self.workers_max, self.limit + self.increase_step)
+			self.reason = "scale up"
+		return self.limit
@@ -0,0 +1,113 @@
+'''
+Runs Python entry points ("module:function") inside the scheduler's pooled
+workers (see PooledWorker in scheduler.py).
+
+An entry point task looks like this:
+	{
+		"metadata": {"handle": "...", "retries": 1, ...},
+		"entrypoint": "src.py.scraping.cnet.article_downloader_worker:run",
+		"args": ["<article_id>", "<article_slug>"]
+	}
+
+The function is called with *args and its result is mapped to an exit code the
+same way a process would exit:
+	- None / non-int return value -> 0
+	- True / False return value -> 0 / 1
+	- int return value -> that value
+	- sys.exit(code) -> code (None -> 0, non-int -> 1)
+	- uncaught exception -> 1 (traceback is written to stderr)
+
+Modules are imported once per pool process and cached, so the interpreter
+startup and import cost is paid once per pool process instead of once per task.
+'''
+
+import io
+import sys
+import importlib
+import traceback
+import contextlib
+from typing import Callable
+
+entrypoint_cache = {}  # type: dict[str, Callable]
+
+
+def parse_entrypoint(entrypoint: str) -> tuple[str, str]:
+	'''
+		Splits "module:function" into its parts.
+	'''
+	parts = entrypoint.split(":")
+	if len(parts) != 2 or parts[0] == "" or parts[1] == "":
+		raise ValueError(
+		    f"Invalid entrypoint '{entrypoint}' (expected 'module:function')")
+	return parts[0], parts[1]
+
+
+def load_entrypoint(entrypoint: str) -> Callable:
+	'''
+		Imports (once) and returns the function for the given entrypoint.
+	'''
+	if entrypoint in entrypoint_cache:
+		return entrypoint_cache[entrypoint]
+	module_name, function_name = parse_entrypoint(entrypoint)
+	module = importlib.import_module(module_name)
+	function = getattr(module, function_name)
+	entrypoint_cache[entrypoint] = function
+	return function
+
+
+def get_exit_code(code) -> int:
+	'''
+		Maps a return value or a SystemExit code to a process-like exit code.
+	'''
+	if code is None:
+		return 0
+	if isinstance(code, bool):
+		return 0 if code else 1
+	if isinstance(code, int):
+		return code
+	return 0
+
+
+def call_entrypoint(entrypoint: str, args: list) -> int:
+	'''
+		Calls the entrypoint and returns its exit code.
+	'''
+	try:
+		function = load_entrypoint(entrypoint)
+		return get_exit_code(function(*args))
+	except SystemExit as e:
+		if e.code is None:
+			return 0
+		if isinstance(e.code, int):
+			return e.code
+		print(e.code, file=sys.stderr)
+		return 1
+	except Exception:
+		traceback.print_exc()
+		return 1
+
+
+def run_entrypoint(entrypoint: str,
+                   args: list,
+                   capture_output: bool = True) -> dict:
+	'''
+		Runs the entrypoint and returns its exit code and (optionally) the
+		captured stdout and stderr. Output can only be captured safely when
+		each task runs in its own process (process pool), as the redirection
+		is process wide.
+	'''
+	if not capture_output:
+		return {
+		    "exit_code": call_entrypoint(entrypoint, args),
+		    "stdout": "",
+		    "stderr": "",
+		}
+	stdout = io.StringIO()
+	stderr = io.StringIO()
+	with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+		exit_code = call_entrypoint(entrypoint, args)
+	return {
+	    "exit_code": exit_code,
+	    "stdout": stdout.getvalue(),
+	    "stderr": stderr.getvalue(),
+	}
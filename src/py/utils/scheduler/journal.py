@@ -0,0 +1,167 @@
+'''
+Append-only progress journal for the scheduler.
+
+Every time a task exits the full task object (metadata + workerdata) is appended
+to a single JSON lines file. On startup the journal is read once into an
+in-memory map (task handle -> last task state) so resuming a run doesn't require
+opening a file per task. Later lines overwrite earlier ones for the same handle.
+
+Writes are flushed on every append but fsync-ed in batches (every N appends or
+every T seconds, whichever comes first) - a crash can lose at most the last
+unsynced batch, which simply means those tasks are re-run.
+'''
+
+import os
+import json
+import time
+import threading
+from typing import Optional
+
+
+class ProgressJournal:
+	'''
+		Append-only JSON lines journal of task progress.
+	'''
+
+	def __init__(self,
+	             filepath: str,
+	             fsync_every: int = 100,
+	             fsync_interval: float = 5.0):
+		self.filepath = filepath
+		self.fsync_every = fsync_every
+		self.fsync_interval = fsync_interval
+		self.states = {}  # type: dict[str, dict]
+		self.lines = 0  # number of lines in the file (including stale ones)
+		self.lock = threading.Lock()
+		self.file = None
+		self.unsynced = 0
+		self.time_last_sync = time.time()
+
+	def load(self) -> dict:
+		'''
+			Reads the whole journal into memory. Returns the handle -> state map.
+		'''
+		self.states = {}
+		self.lines = 0
+		if not os.path.isfile(self.filepath):
+			return self.states
+		with open(self.filepath, "r", encoding="utf-8") as f:
+			for line in f:
+				line = line.strip()
+				if line == "":
+					continue
+				try:
+					task = json.loads(line)
+				except json.JSONDecodeError:
+					# a partially written last line after a crash - ignore it
+					continue
+				self.states[task["metadata"]["handle"]] = task
+				self.lines += 1
+		return self.states
+
+	def import_folder(self, folderpath: str) -> int:
+		'''
+			Imports progress files written by the legacy per-task backend
+			(scheduler_data/<handle>.json). Returns the number of imported tasks.
+		'''
+		if not os.path.isdir(folderpath):
+			return 0
+		count = 0
+		with os.scandir(folderpath) as entries:
+			for entry in entries:
+				if not entry.is_file() or not entry.name.endswith(".json"):
+					continue
+				try:
+					with open(entry.path, "r", encoding="utf-8") as f:
+						task = json.load(f)
+					self.append(task)
+					count += 1
+				except Exception:
+					pass
+		self.sync()
+		return count
+
+	def open(self):
+		'''
+			Opens the journal for appending (no-op if it's already open).
+		'''
+		if self.file is not None:
+			return
+		folderpath = os.path.dirname(self.filepath)
+		if folderpath != "" and not os.path.isdir(folderpath):
+			os.makedirs(folderpath)
+		self.file = open(self.filepath, "a", encoding="utf-8")
+		self.time_last_sync = time.time()
+
+	def get(self, handle: str) -> Optional[dict]:
+		'''
+			Returns the last known state of a task (None if never journaled).
+		'''
+		return self.states.get(handle, None)
+
+	def append(self, task: dict) -> None:
+		'''
+			Appends the task state to the journal (thread safe).
+		'''
+		line = json.dumps(task, default=str)
+		with self.lock:
+			if self.file is None:
+				self.open()
+			assert self.file
+			self.file.write(line + "\n")
+			self.file.flush()
+			self.states[task["metadata"]["handle"]] = task
+			self.lines += 1
+			self.unsynced += 1
+			if self.unsynced >= self.fsync_every or time.time(
+			) - self.time_last_sync >= self.fsync_interval:
+				self._sync()
+
+	def _sync(self):
+		if self.file is None:
+			return
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.unsynced = 0
+		self.time_last_sync = time.time()
+
+	def sync(self) -> None:
+		'''
+			Forces an fsync of all appended lines.
+		'''
+		with self.lock:
+			self._sync()
+
+	def compact(self) -> None:
+		'''
+			Rewrites the journal with only the latest state of each task.
+		'''
+		with self.lock:
+			if self.file is not None:
+				self._sync()
+				self.file.close()
+				self.file = None
+			filepath_tmp = self.filepath + ".tmp"
+			with open(filepath_tmp, "w", encoding="utf-8") as f:
+				for task in self.states.values():
+					f.write(json.dumps(task, default=str) + "\n")
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(filepath_tmp, self.filepath)
+			self.lines = len(self.states)
+
+	def needs_compaction(self, ratio: float = 2.0) -> bool:
+		'''
+			Returns True if the journal holds many stale lines (retries, reruns).
+		'''
+		return self.lines > 0 and self.lines > ratio * len(self.states)
+
+	def close(self) -> None:
+		'''
+			Syncs and closes the journal.
+		'''
+		with self.lock:
+			if self.file is not None:
+				self._sync()
+				self.file.close()
+				self.file = None
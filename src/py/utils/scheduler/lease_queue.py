@@ -0,0 +1,229 @@
+'''
+Shared task queue for running one task list on several machines (nodes).
+
+The tasks live in a SQLite database (on a shared filesystem or on a single box
+for local testing). Every scheduler instance started with the same
+filepath_lease_db pulls tasks by taking a lease on them. Leases are extended
+by a heartbeat thread while the task is running. If a node crashes its leases
+expire after lease_ttl seconds and the tasks are handed out again.
+
+The same interface as TaskQueue is implemented (put, get, get_delay, empty,
+qsize, task_done) so the scheduler's dispatcher works unchanged - each node
+still applies its own worker limits and resource thresholds.
+
+Task states: pending -> leased -> done / failed (or back to pending on retry).
+'''
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from typing import Optional
+
+
+def get_node_id() -> str:
+	'''
+		Returns a node id unique to this scheduler instance.
+	'''
+	return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseQueue:
+	'''
+		SQLite backed task queue with leases.
+	'''
+
+	def __init__(self,
+	             filepath: str,
+	             node_id: Optional[str] = None,
+	             lease_ttl: float = 60.0,
+	             poll_interval: float = 2.0):
+		self.filepath = filepath
+		self.node_id = node_id if node_id is not None else get_node_id()
+		self.lease_ttl = lease_ttl
+		self.poll_interval = poll_interval
+		self.held = set()  # handles leased by this node
+		self.lock = threading.Lock()
+		folderpath = os.path.dirname(filepath)
+		if folderpath != "" and not os.path.isdir(folderpath):
+			os.makedirs(folderpath)
+		# isolation_level=None - transactions are managed explicitly
+		self.connection = sqlite3.connect(filepath,
+		                                  timeout=60,
+		                                  isolation_level=None,
+		                                  check_same_thread=False)
+		# WAL needs shared memory which doesn't work on network filesystems
+		self.connection.execute("PRAGMA journal_mode=DELETE")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS tasks (
+				handle TEXT PRIMARY KEY,
+				task TEXT NOT NULL,
+				state TEXT NOT NULL DEFAULT 'pending',
+				priority INTEGER NOT NULL DEFAULT 0,
+				position INTEGER NOT NULL DEFAULT 0,
+				not_before REAL NOT NULL DEFAULT 0,
+				lease_owner TEXT,
+				lease_expires REAL,
+				updated_at REAL
+			)""")
+		self.connection.execute(
+		    "CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, priority, position)"
+		)
+		self.heartbeat_stop = threading.Event()
+		self.heartbeat_thread = None  # type: Optional[threading.Thread]
+
+	def execute(self, query: str, params: tuple = ()) -> list:
+		with self.lock:
+			return self.connection.execute(query, params).fetchall()
+
+	def seed(self,
+	         tasks: list[dict],
+	         tasks_done: Optional[list[dict]] = None) -> int:
+		'''
+			Adds the tasks to the database (tasks which already exist are left as
+			they are, so every node can seed the same task list). Returns the
+			number of new tasks.
+		'''
+		now = time.time()
+		rows = []
+		for position, task in enumerate(tasks):
+			rows.append((task["metadata"]["handle"], json.dumps(task, default=str),
+			             "pending", task["metadata"].get("priority", 0), position,
+			             task["metadata"].get("not_before", 0), now))
+		for task in tasks_done or []:
+			rows.append((task["metadata"]["handle"], json.dumps(task, default=str),
+			             "done", 0, 0, 0, now))
+		with self.lock:
+			count_before = self.connection.execute(
+			    "SELECT COUNT(*) FROM tasks").fetchone()[0]
+			self.connection.execute("BEGIN IMMEDIATE")
+			self.connection.executemany(
+			    "INSERT OR IGNORE INTO tasks (handle, task, state, priority, position, not_before, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+			    rows)
+			self.connection.execute("COMMIT")
+			count_after = self.connection.execute(
+			    "SELECT COUNT(*) FROM tasks").fetchone()[0]
+		return count_after - count_before
+
+	def get(self) -> Optional[dict]:
+		'''
+			Leases the next available task (None if there is none - e.g. another
+			node was faster).
+		'''
+		now = time.time()
+		with self.lock:
+			self.connection.execute("BEGIN IMMEDIATE")
+			try:
+				row = self.connection.execute(
+				    """SELECT handle, task FROM tasks
+					WHERE (state = 'pending' AND not_before <= ?)
+						OR (state = 'leased' AND lease_expires < ?)
+					ORDER BY priority DESC, position LIMIT 1""", (now, now)).fetchone()
+				if row is None:
+					self.connection.execute("COMMIT")
+					return None
+				self.connection.execute(
+				    "UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, updated_at = ? WHERE handle = ?",
+				    (self.node_id, now + self.lease_ttl, now, row[0]))
+				self.connection.execute("COMMIT")
+			except Exception:
+				self.connection.execute("ROLLBACK")
+				raise
+			self.held.add(row[0])
+		return json.loads(row[1])
+
+	def put(self, task: dict) -> None:
+		'''
+			Releases the lease and puts the task back (used for retries - the
+			task's not_before is respected by all nodes).
+		'''
+		handle = task["metadata"]["handle"]
+		self.execute(
+		    "UPDATE tasks SET state = 'pending', task = ?, not_before = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE handle = ? AND lease_owner = ?",
+		    (json.dumps(task, default=str), task["metadata"].get(
+		        "not_before", 0), time.time(), handle, self.node_id))
+		self.held.discard(handle)
+
+	def task_done(self, task: dict) -> bool:
+		'''
+			Marks the task as done / failed. Returns False if this node no longer
+			held the lease (it expired and the task was handed out again).
+		'''
+		handle = task["metadata"]["handle"]
+		state = "done"
+		if "workerdata" in task and task["workerdata"]["exit_code"] != 0:
+			state = "failed"
+		with self.lock:
+			cursor = self.connection.execute(
+			    "UPDATE tasks SET state = ?, task = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE handle = ? AND lease_owner = ?",
+			    (state, json.dumps(task,
+			                       default=str), time.time(), handle, self.node_id))
+			updated = cursor.rowcount > 0
+		self.held.discard(handle)
+		return updated
+
+	def heartbeat(self) -> None:
+		'''
+			Extends the leases of all tasks held by this node.
+		'''
+		if len(self.held) == 0:
+			return
+		self.execute(
+		    "UPDATE tasks SET lease_expires = ? WHERE state = 'leased' AND lease_owner = ?",
+		    (time.time() + self.lease_ttl, self.node_id))
+
+	def run_heartbeat(self):
+		while not self.heartbeat_stop.wait(self.lease_ttl / 3):
+			try:
+				self.heartbeat()
+			except sqlite3.Error:
+				# database busy - try again on the next beat (well before the lease expires)
+				pass
+
+	def start_heartbeat(self) -> None:
+		self.heartbeat_thread = threading.Thread(target=self.run_heartbeat,
+		                                         daemon=True)
+		self.heartbeat_thread.start()
+
+	def stop_heartbeat(self) -> None:
+		self.heartbeat_stop.set()
+
+	def get_delay(self) -> float:
+		'''
+			Returns the number of seconds until a task might be available (0 if one
+			is available now, inf if there is nothing left which this node could
+			ever get). Capped at poll_interval since other nodes change the queue.
+		'''
+		now = time.time()
+		row = self.execute(
+		    """SELECT MIN(CASE WHEN state = 'pending' THEN not_before ELSE lease_expires END)
+			FROM tasks WHERE state = 'pending' OR (state = 'leased' AND lease_owner != ?)""",
+		    (self.node_id,))[0]
+		if row[0] is None:
+			return float("inf")
+		return min(self.poll_interval, max(0.0, row[0] - now))
+
+	def qsize(self) -> int:
+		'''
+			Returns the number of tasks which are pending or leased by other nodes.
+		'''
+		return self.execute(
+		    "SELECT COUNT(*) FROM tasks WHERE state = 'pending' OR (state = 'leased' AND lease_owner != ?)",
+		    (self.node_id,))[0][0]
+
+	def empty(self) -> bool:
+		return self.qsize() == 0
+
+	def get_counts(self) -> dict:
+		'''
+			Returns the number of tasks per state (over all nodes).
+		'''
+		rows = self.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state")
+		return {state: count for state, count in rows}
+
+	def close(self) -> None:
+		self.stop_heartbeat()
+		with self.lock:
+			self.connection.close()
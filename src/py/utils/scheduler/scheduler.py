@@ -9,8 +9,8 @@ Scheduler will create workers which will execute the arguments in parallel. It w
 and exit codes. If a worker fails, it will be restarted (up to max. number of retries). If a worker fails too many times, it will be removed from the
 pool of workers. Once all of the tasks have been completed, the scheduler will exit.
 
-The worker will also dynamically scale the maximum number of workers based on the number of remaining tasks and
-resource usage (CPU, memory, etc.).
+If autoscale is set, the scheduler will also dynamically scale the maximum number of workers (between workers_min and workers_max)
+based on the number of remaining tasks and resource usage (CPU, memory, etc.) - see autoscaler.py.
 '''
 
 # TODO: cleanup of this file - added loads of functionality and it's a bit of a mess now
@@ -26,14 +26,20 @@ import time
 import subprocess
 import psutil
 import threading
-import queue
 import argparse
+import multiprocessing
+import concurrent.futures
 from datetime import datetime
 from typing import Callable, Optional
 
 # Project imports
 sys.path.append(os.getcwd())
 from src.py.utils.logger import Logger
+from src.py.utils.scheduler.journal import ProgressJournal
+from src.py.utils.scheduler.entrypoint import run_entrypoint
+from src.py.utils.scheduler.autoscaler import ConcurrencyController
+from src.py.utils.scheduler.task_queue import TaskQueue, get_task_cost
+from src.py.utils.scheduler.lease_queue import LeaseQueue, get_node_id
 
 #
 ##  Constants and globals
@@ -43,9 +49,46 @@ config = {}
 filepath_config = "src/py/utils/scheduler/scheduler_config.json"  # this is the default path - can be changed with a named argument
 filepath_tasks = "src/py/utils/scheduler/scheduler_tasks.json"  # this is the default path - can be changed in the config file
 filepath_log = "logs/scheduler.log"
+# Write the log from a background thread (worker output is multiplexed through
+# the scheduler's logger from many reader threads)
+log_async = True
 script_start_time = time.time()
 tasks_finished_at = None
 workers_max = 5
+workers_min = 1
+# Scale the number of concurrent workers between workers_min and workers_max
+# based on resource usage (see autoscaler.py) - if False, workers_max is used
+autoscale = False
+# Extra ConcurrencyController arguments (workers_start, increase_step,
+# decrease_factor, cooldown, alpha, error_rate_threshold, latency_factor, window)
+autoscale_settings = {}
+controller = None  # type: Optional[ConcurrencyController]
+# Order of tasks with the same priority - "fifo" (file order), "sjf" (shortest
+# job first) or "ljf" (longest job first) - see task_queue.py
+task_order = "fifo"
+# Failed tasks are put back into the queue and retried after
+# retry_delay * 2^(attempt - 1) seconds (capped at retry_delay_max)
+retry_delay = 1.0
+retry_delay_max = 300.0
+# Distributed mode - if set, tasks are pulled from this shared SQLite database
+# (see lease_queue.py) so several scheduler instances (nodes) can work on the
+# same task list
+filepath_lease_db = None  # type: Optional[str]
+node_id = None  # type: Optional[str] # defaults to <hostname>-<pid>
+lease_ttl = 60.0  # seconds without a heartbeat before a task is handed out again
+lease_poll_interval = 2.0  # how often to check for tasks released by other nodes
+resource_sampling_interval = 1.0  # seconds between resource utilization samples
+# Task progress backend - "journal" (single append-only JSONL file next to the tasks file)
+# or "files" (legacy - one JSON file per task handle in scheduler_data/)
+progress_backend = "journal"
+filepath_journal = None  # type: Optional[str] # defaults to scheduler_data.jsonl next to the tasks file (scheduler_data-<node_id>.jsonl in distributed mode)
+journal_fsync_every = 100  # fsync the journal every N task exits ...
+journal_fsync_interval = 5.0  # ... or every T seconds, whichever comes first
+journal = None  # type: Optional[ProgressJournal]
+# Tasks with an "entrypoint" ("module:function") instead of a process are run
+# inside a pool of long-lived workers - "process" or "thread"
+pool_type = "process"
+pool = None  # type: Optional[concurrent.futures.Executor]
 # Tasks can be loaded at runtime from a file (if given a named argument tasks={filepath})
 task_list = []  # type: list[dict]
 # task_dict is updated with data from workers and saved to a file after a worker finishes (key = task handle, value = task object with updated metadata)
@@ -58,6 +101,9 @@ tasks_failed = 0  # all failed workers count as failed (exit with 0 retries left
 tasks_skipped = 0  # number of tasks that were skipped (conditions from task_dict_task)
 tasks_failed_handles = []  # list of failed task handles
 state = "init"  # can be "init", "running", "paused", "stopped"
+# Signalled whenever a worker exits for good or the state changes so the main
+# thread can sleep until there is something to do instead of busy-polling
+workers_cond = threading.Condition()
 # TODO add metadata time_limit, etc.
 
 # using psutils to monitor resource usage and adjust the number of workers accordingly
@@ -74,11 +120,24 @@ utilization_settings = {
     }
 }
 
-# Init logger - default
-logger = Logger({
-    "filepath": filepath_log,
-    "level": "DEBUG",
-})
+# Logger - created by init_logger() in main() instead of at import, because the
+# processes of the entrypoint pool (spawn) re-import this module
+logger = None  # type: Optional[Logger]
+
+
+def init_logger() -> Logger:
+	'''
+		(Re)creates the logger with the current filepath_log and log_async.
+	'''
+	global logger
+	if logger is not None:
+		logger.stop()  # needed to close the file handle
+	logger = Logger({
+	    "filepath": filepath_log,
+	    "level": "DEBUG",
+	    "async": log_async,
+	})
+	return logger
 
 
 def load_config(filepath: str = filepath_config) -> dict:
@@ -86,29 +145,90 @@ def load_config(filepath: str = filepath_config) -> dict:
 		Loads the scheduler config file.
 	'''
 	global config
-	global logger
 	config = {}
 	logger.say(f"Loding config file: {filepath}")
 	with open(filepath, "r") as f:
 		config = json.load(f)
 	# Reinit logger with config settings if (if given)
+	if "log_async" in config:
+		global log_async
+		log_async = config["log_async"]
 	if "filepath_log" in config:
 		global filepath_log
 		filepath_log = config["filepath_log"]
 		logger.say(
 		    f"Log file path loaded from config and set to '{filepath_log}' - reinitializing logger there."
 		)
-		logger.stop()  # needed to close the file handle
-		logger = Logger({
-		    "filepath": filepath_log,
-		    "level": "DEBUG",
-		})
+		init_logger()
 	logger.say(f"Loaded config settings: {json.dumps(config, indent=2)}")
 	# Load more config settings with the new logger initialized (if given)
 	if "workers_max" in config:
 		global workers_max
 		workers_max = config["workers_max"]
 		logger.say(f"Max. number of workers set to '{workers_max}'.")
+	if "workers_min" in config:
+		global workers_min
+		workers_min = config["workers_min"]
+		logger.say(f"Min. number of workers set to '{workers_min}'.")
+	if "autoscale" in config:
+		global autoscale
+		autoscale = config["autoscale"]
+		logger.say(f"Autoscaling set to '{autoscale}'.")
+	if "autoscale_settings" in config:
+		global autoscale_settings
+		autoscale_settings = config["autoscale_settings"]
+	if "task_order" in config:
+		global task_order
+		task_order = config["task_order"]
+		logger.say(f"Task order set to '{task_order}'.")
+	if "retry_delay" in config:
+		global retry_delay
+		retry_delay = config["retry_delay"]
+	if "retry_delay_max" in config:
+		global retry_delay_max
+		retry_delay_max = config["retry_delay_max"]
+	if "filepath_lease_db" in config:
+		global filepath_lease_db
+		filepath_lease_db = config["filepath_lease_db"]
+		logger.say(
+		    f"Distributed mode - using lease database '{filepath_lease_db}'.")
+	if "node_id" in config:
+		global node_id
+		node_id = config["node_id"]
+	if "lease_ttl" in config:
+		global lease_ttl
+		lease_ttl = config["lease_ttl"]
+	if "lease_poll_interval" in config:
+		global lease_poll_interval
+		lease_poll_interval = config["lease_poll_interval"]
+	if "utilization_settings" in config:
+		for resource, thresholds in config["utilization_settings"].items():
+			utilization_settings[resource].update(thresholds)
+		logger.say(
+		    f"Utilization settings set to {json.dumps(utilization_settings)}.")
+	if "resource_sampling_interval" in config:
+		global resource_sampling_interval
+		resource_sampling_interval = config["resource_sampling_interval"]
+		logger.say(
+		    f"Resource sampling interval set to '{resource_sampling_interval}' seconds."
+		)
+	if "progress_backend" in config:
+		global progress_backend
+		progress_backend = config["progress_backend"]
+		logger.say(f"Progress backend set to '{progress_backend}'.")
+	if "filepath_journal" in config:
+		global filepath_journal
+		filepath_journal = config["filepath_journal"]
+	if "journal_fsync_every" in config:
+		global journal_fsync_every
+		journal_fsync_every = config["journal_fsync_every"]
+	if "journal_fsync_interval" in config:
+		global journal_fsync_interval
+		journal_fsync_interval = config["journal_fsync_interval"]
+	if "pool_type" in config:
+		global pool_type
+		pool_type = config["pool_type"]
+		logger.say(f"Pool type for entrypoint tasks set to '{pool_type}'.")
 	if "filepath_tasks" in config:
 		global filepath_tasks
 		filepath_tasks = config["filepath_tasks"]
@@ -175,6 +295,14 @@ def validate_task(task: dict) -> bool:
 	if "handle" not in task["metadata"]:
 		logger.say("Task is missing handle.")
 		return False
+	if "entrypoint" in task:
+		if "args" not in task:
+			task["args"] = []
+		if len(task["entrypoint"].split(":")) != 2:
+			logger.say(
+			    f"Task entrypoint '{task['entrypoint']}' is not in the 'module:function' format."
+			)
+			return False
 	if "args" not in task:
 		logger.say("Task is missing args.")
 		return False
@@ -245,10 +373,58 @@ def get_filepath_progress(task_handle: str) -> str:
 	return filepath_progress
 
 
+def get_filepath_journal() -> str:
+	'''
+		Returns the filepath of the progress journal (one per node in
+		distributed mode).
+	'''
+	global node_id
+	if filepath_journal is not None:
+		return filepath_journal
+	folderpath = os.path.dirname(filepath_tasks)
+	if filepath_lease_db is not None:
+		# Nodes share the tasks file - a shared journal would be compacted
+		# (replaced) under the other nodes' open handles
+		if node_id is None:
+			node_id = get_node_id()
+		return os.path.join(folderpath, f"scheduler_data-{node_id}.jsonl")
+	return os.path.join(folderpath, "scheduler_data.jsonl")
+
+
+def load_journal() -> ProgressJournal:
+	'''
+		Loads the progress journal into memory (once, at startup).
+		Progress files from the legacy backend are imported on first use.
+	'''
+	global journal
+	time_start = time.time()
+	filepath = get_filepath_journal()
+	journal = ProgressJournal(filepath, journal_fsync_every,
+	                          journal_fsync_interval)
+	if not os.path.isfile(filepath):
+		folderpath_legacy = os.path.dirname(get_filepath_progress("_"))
+		count = journal.import_folder(folderpath_legacy)
+		if count > 0:
+			logger.say(
+			    f"Imported {count} task progress files from '{folderpath_legacy}' into the journal."
+			)
+	journal.load()
+	if journal.needs_compaction():
+		logger.say(f"Compacting journal ({journal.lines} lines)...")
+		journal.compact()
+	journal.open()
+	logger.say(
+	    f"Loaded progress of {len(journal.states)} tasks from '{filepath}' in {round(time.time() - time_start, 3)}s."
+	)
+	return journal
+
+
 def load_task_progress(task_handle: str) -> Optional[dict]:
 	'''
 		Loads the task progress from a file.
 	'''
+	if progress_backend == "journal" and journal is not None:
+		return journal.get(task_handle)
 	try:
 		filepath_progress = get_filepath_progress(task_handle)
 		# load json to dict
@@ -266,6 +442,13 @@ def save_task_progress(task_options: dict) -> bool:
 	'''
 		Saves the task progress to a file.
 	'''
+	if progress_backend == "journal" and journal is not None:
+		try:
+			journal.append(task_options)
+			return True
+		except Exception as e:
+			logger.say(f"Failed to save task progress to the journal: {e}")
+			return False
 	try:
 		task_handle = task_options["metadata"]["handle"]
 		# logger.say(f"Saving task progress for '{task_handle}'...")
@@ -284,6 +467,18 @@ def save_task_progress(task_options: dict) -> bool:
 	return False
 
 
+def is_task_runnable(task: dict) -> bool:
+	'''
+		Returns True if a task should be started.
+		A task can be started if it has no workerdata
+		or if it has workerdata and it has exit code != 0 and retries > 0
+	'''
+	if "workerdata" not in task:
+		return True
+	return task["workerdata"]["exit_code"] != 0 and task["metadata"][
+	    "retries"] > 0
+
+
 def print_resource_utilization():
 	'''
 		Prints the resource utilization (overall - not just this process)
@@ -312,6 +507,107 @@ def test_print_resource_utilization():
 		time.sleep(0.5)
 
 
+class ResourceSampler(threading.Thread):
+	'''
+		Samples the resource utilization in fixed intervals and caches the last
+		reading so the scheduler doesn't have to query psutil on every dispatch.
+	'''
+
+	def __init__(self, interval: float = resource_sampling_interval):
+		super(ResourceSampler, self).__init__(daemon=True)
+		self.interval = interval
+		self.stop_event = threading.Event()
+		# cpu_percent() with no interval compares against the previous call so
+		# the first reading is meaningless - prime it here
+		psutil.cpu_percent()
+		self.process = psutil.Process()
+		memory = psutil.virtual_memory()
+		self.reading = {
+		    "cpu_percent": 0.0,
+		    "mem_percent": memory.percent,
+		    "mem_total": memory.total,
+		    "rss_children": 0,
+		    "time": time.time(),
+		}
+
+	def get_rss_children(self) -> int:
+		'''
+			Returns the memory (RSS) used by all worker processes (including the
+			pool processes) in bytes.
+		'''
+		rss = 0
+		for child in self.process.children(recursive=True):
+			try:
+				rss += child.memory_info().rss
+			except (psutil.NoSuchProcess, psutil.AccessDenied):
+				pass
+		return rss
+
+	def sample(self):
+		'''
+			Takes a single sample and replaces the cached reading.
+		'''
+		memory = psutil.virtual_memory()
+		self.reading = {
+		    # system wide - averaged over all cores (0-100)
+		    "cpu_percent": psutil.cpu_percent(),
+		    "mem_percent": memory.percent,
+		    "mem_total": memory.total,
+		    "rss_children": self.get_rss_children(),
+		    "time": time.time(),
+		}
+		if controller is not None:
+			update_controller(self.reading)
+
+	def get_reading(self) -> dict:
+		'''
+			Returns the last cached reading.
+		'''
+		return self.reading
+
+	def run(self):
+		while not self.stop_event.wait(self.interval):
+			try:
+				self.sample()
+			except Exception as e:
+				logger.say(f"An error occurred while sampling resources: {e}")
+
+	def stop(self):
+		self.stop_event.set()
+
+
+def update_controller(reading: dict):
+	'''
+		Feeds a new reading to the concurrency controller and wakes up the
+		dispatcher if the limit changed.
+	'''
+	assert controller
+	limit_old = controller.limit
+	limit = controller.update(reading, len(workers), tasks.qsize())
+	if limit != limit_old:
+		logger.say(
+		    f"Concurrency limit changed from {limit_old} to {limit}: {controller.reason} (CPU {round(controller.cpu or 0, 1)}%, memory {round(controller.mem or 0, 1)}%, {round(controller.rss_per_task / 1024 / 1024, 1)} MB per task)"
+		)
+		notify_dispatcher()
+
+
+def get_workers_limit() -> int:
+	'''
+		Returns the current max. number of concurrent workers.
+	'''
+	if controller is not None:
+		return controller.limit
+	return workers_max
+
+
+def notify_dispatcher():
+	'''
+		Wakes up the main thread so it can re-check the workers and state.
+	'''
+	with workers_cond:
+		workers_cond.notify_all()
+
+
 class Worker:
 	'''
 		Represents a worker process.
@@ -411,17 +707,30 @@ class Worker:
 			Handles the worker process exit code.
 		'''
 		self.process.wait()
-		exit_code = self.process.returncode
+		self.finish(self.process.returncode)
+
+	def finish(self, exit_code: int):
+		'''
+			Retries the task or marks it as completed based on its exit code.
+		'''
+		if controller is not None:
+			controller.record_task(time.time() - self.time_start, exit_code)
 		if exit_code != 0:
 			logger.say(
 			    f"{datetime.now()} [{self.options['metadata']['handle']}] EXIT: with non-zero code {exit_code}"
 			)
 			if self.options["metadata"]["retries"] > 0:
 				self.options["metadata"]["retries"] -= 1
+				delay = get_retry_delay(self.options)
 				logger.say(
-				    f"{datetime.now()} [{self.options['metadata']['handle']}] RETRY: {self.options['metadata']['retries']} retries left"
+				    f"{datetime.now()} [{self.options['metadata']['handle']}] RETRY: {self.options['metadata']['retries']} retries left (in {round(delay, 3)}s)"
 				)
-				self.start_process()
+				# Free the slot and put the task back into the queue with a backoff
+				self.options["metadata"]["not_before"] = time.time() + delay
+				with workers_cond:
+					del workers[self.options["metadata"]["handle"]]
+					tasks.put(self.options)
+					workers_cond.notify_all()
 				return
 			else:
 				global tasks_failed
@@ -433,9 +742,11 @@ class Worker:
 		self.time_end = time.time()
 		duration = self.time_end - self.time_start
 		global tasks_completed
-		tasks_completed += 1
-		# Remove worker from workers dict
-		del workers[self.options["metadata"]["handle"]]
+		# Remove worker from workers dict and signal the freed slot
+		with workers_cond:
+			tasks_completed += 1
+			del workers[self.options["metadata"]["handle"]]
+			workers_cond.notify_all()
 		logger.say(
 		    f"{datetime.now()} [{self.options['metadata']['handle']}] EXIT (FINAL): with code {exit_code} in {duration} seconds"
 		)
@@ -450,6 +761,10 @@ class Worker:
 			save_task_progress(self.options)
 		except:
 			pass
+		if not tasks.task_done(self.options) and filepath_lease_db is not None:
+			logger.say(
+			    f"{datetime.now()} [{self.options['metadata']['handle']}] Lease expired before the task finished - it may have been run by another node."
+			)
 
 	# def __del__(self):
 	# 	'''
@@ -461,6 +776,135 @@ class Worker:
 		self.options = options
 
 
+class PooledWorker(Worker):
+	'''
+		Represents a task which runs a Python entrypoint inside the shared pool
+		instead of in its own process. Retries, progress and REPL commands work
+		the same as with Worker, but the output is only available once the task
+		has finished.
+	'''
+
+	def start_process(self):
+		'''
+			Submits the task to the pool.
+		'''
+		logger.say(
+		    f"{datetime.now()} [{self.options['metadata']['handle']}] START")
+		assert pool
+		try:
+			self.future = pool.submit(run_entrypoint, self.options["entrypoint"],
+			                          self.options["args"], pool_type == "process")
+		except concurrent.futures.process.BrokenProcessPool:
+			restart_pool()
+			self.future = pool.submit(run_entrypoint, self.options["entrypoint"],
+			                          self.options["args"], pool_type == "process")
+		self.time_start = time.time()
+		self.thread_exit = threading.Thread(target=self.handle_exit)
+		self.thread_exit.start()
+
+	def stop_process(self):
+		'''
+			Cancels the task if it hasn't started yet (running tasks can't be killed).
+		'''
+		try:
+			self.future.cancel()
+		except:
+			pass
+
+	def handle_output(self):
+		'''
+			Handles the captured task output.
+		'''
+		for line in self.result["stdout"].splitlines():
+			if not self.options["metadata"]["can_handle_output"]:
+				break
+			logger.say(
+			    f"{datetime.now()} [{self.options['metadata']['handle']}] OUT: {line}"
+			)
+
+	def handle_error(self):
+		'''
+			Handles the captured task error output.
+		'''
+		for line in self.result["stderr"].splitlines():
+			if not self.options["metadata"]["can_handle_error"]:
+				break
+			logger.say(
+			    f"{datetime.now()} [{self.options['metadata']['handle']}] ERR: {line}"
+			)
+
+	def init_thread_stdout(self):
+		# output is handled once the task is done
+		pass
+
+	def init_thread_stderr(self):
+		# output is handled once the task is done
+		pass
+
+	def handle_exit(self):
+		'''
+			Waits for the task result and handles its exit code.
+		'''
+		try:
+			self.result = self.future.result()
+		except concurrent.futures.CancelledError:
+			self.result = {"exit_code": -1, "stdout": "", "stderr": "Cancelled"}
+		except Exception as e:
+			# e.g. BrokenProcessPool if a pool process died
+			self.result = {"exit_code": 1, "stdout": "", "stderr": str(e)}
+			if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+				restart_pool()
+		self.handle_output()
+		self.handle_error()
+		self.finish(self.result["exit_code"])
+
+
+def get_retry_delay(task: dict) -> float:
+	'''
+		Returns the exponential backoff delay for the next attempt of a task.
+	'''
+	attempt = task["metadata"].get("attempt", 0) + 1
+	task["metadata"]["attempt"] = attempt
+	return min(retry_delay_max, retry_delay * 2**(attempt - 1))
+
+
+def get_pool() -> concurrent.futures.Executor:
+	'''
+		Creates the pool for entrypoint tasks (one slot per worker).
+	'''
+	if pool_type == "thread":
+		return concurrent.futures.ThreadPoolExecutor(max_workers=workers_max)
+	# Forking isn't safe here - the REPL thread holds the stdin lock while waiting
+	# in input() and forked children deadlock when closing stdin
+	return concurrent.futures.ProcessPoolExecutor(
+	    max_workers=workers_max, mp_context=multiprocessing.get_context("spawn"))
+
+
+def restart_pool():
+	'''
+		Replaces a broken process pool with a new one.
+	'''
+	global pool
+	with workers_cond:
+		if pool is not None and not getattr(pool, "_broken", False):
+			return
+		logger.say("Pool is broken (a pool process died). Restarting the pool...")
+		pool = get_pool()
+
+
+def create_worker(task: dict) -> Worker:
+	'''
+		Returns the worker type for a task (process or entrypoint).
+	'''
+	if "entrypoint" in task:
+		global pool
+		if pool is None:
+			logger.say(f"Starting a '{pool_type}' pool with {workers_max} workers.")
+			pool = get_pool()
+		return PooledWorker(task)
+	return Worker(task)
+
+
 class ReplThread(threading.Thread):
 	'''
 		Represents a thread that runs the REPL.
@@ -527,12 +971,14 @@ def repl(user_input: str):
 				    "Pausing script (not starting any new workers)...\nType 'status' to check the number of active workers.\nOnce it reaches 0, you can safely save the VM state and resume the scheduler later.\nType 'resume' to resume the script once you're ready."
 				)
 				state = "paused"
+				notify_dispatcher()
 			else:
 				logger.say("Script is already stopped.")
 		elif user_input == "resume":
 			if state != "stopped":
 				logger.say("Resuming script...")
 				state = "running"
+				notify_dispatcher()
 			else:
 				logger.say("Script is already stopped.")
 		elif user_input.startswith("worker"):
@@ -586,6 +1032,7 @@ def repl(user_input: str):
 		elif user_input == "status":
 			logger.say("Status:")
 			logger.say(f"  - active workers: {len(workers)}")
+			logger.say(f"  - workers limit: {get_workers_limit()}")
 			logger.say(f"  - total tasks: {len(task_list)}")
 			logger.say(f"  - tasks completed: {tasks_completed}")
 			logger.say(f"  - tasks successful: {tasks_completed - tasks_failed}")
@@ -619,6 +1066,12 @@ def get_args():
 	    help="Path to config file",
 	    default=filepath_config,
 	)
+	parser.add_argument(
+	    "-y",
+	    "--yes",
+	    help="Start the run without asking for confirmation",
+	    action="store_true",
+	)
 	# parser.add_argument(
 	#     "-v",
 	#     "--verbose",
@@ -650,13 +1103,14 @@ def main():
 	time_start = time.time()
 	# Read command line arguments
 	args = get_args()
+	init_logger()
 	if args.config:
 		global filepath_config
 		filepath_config = args.config
 	# Load config - new logger might be created here
 	load_config(filepath_config)
 	# Ask for confirmation
-	all_good = ask_for_confirmation()
+	all_good = args.yes or ask_for_confirmation()
 	if not all_good:
 		logger.say("User choosing not to start the run - exiting.")
 		exit(203)
@@ -672,9 +1126,47 @@ def main():
 		logger.say("Invalid tasks given. Exiting.")
 		exit(1)
 
-	tasks = queue.Queue()
+	if progress_backend == "journal":
+		load_journal()
+
+	# Resolve progress up front so finished tasks never reach the queue
+	global tasks_skipped
+	tasks_runnable = []
+	tasks_processed = []
 	for task in task_list:
-		tasks.put(task)
+		handle = task["metadata"]["handle"]
+		task_progress = load_task_progress(handle)
+		# If task progress exists, use it instead of the task from the task list
+		# (keeping the priority and cost estimate from the task list)
+		if task_progress:
+			for key in ["priority", "cost_estimate"]:
+				if key in task["metadata"]:
+					task_progress["metadata"][key] = task["metadata"][key]
+			task = task_progress
+		if is_task_runnable(task):
+			tasks_runnable.append(task)
+		else:
+			tasks_processed.append(task)
+			tasks_skipped += 1
+	# Tasks without a known cost are assumed to be average
+	costs = [get_task_cost(task) for task in tasks_runnable]
+	costs_known = [cost for cost in costs if cost is not None]
+	cost_default = sum(costs_known) / len(costs_known) if len(
+	    costs_known) > 0 else 0.0
+	if filepath_lease_db is not None:
+		tasks = LeaseQueue(filepath_lease_db, node_id, lease_ttl,
+		                   lease_poll_interval)
+		count_new = tasks.seed(tasks_runnable, tasks_processed)
+		logger.say(
+		    f"Node '{tasks.node_id}' joined - added {count_new} new tasks to the lease database ({json.dumps(tasks.get_counts())})."
+		)
+		tasks.start_heartbeat()
+	else:
+		tasks = TaskQueue(task_order, cost_default)
+		for task in tasks_runnable:
+			tasks.put(task)
+	logger.say(
+	    f"Skipping {tasks_skipped} tasks which have already been processed.")
 
 	# Keys are worker handles, values are Worker objects
 	workers = {}
@@ -699,52 +1191,73 @@ def main():
 	# Set state to "running"
 	state = "running"
 
+	# Sample resource utilization in the background - the dispatcher only reads
+	# the cached value
+	global controller
+	if autoscale:
+		controller = ConcurrencyController(workers_min, workers_max,
+		                                   utilization_settings,
+		                                   **autoscale_settings)
+		logger.say(
+		    f"Autoscaling the number of workers between {controller.workers_min} and {controller.workers_max} (starting at {controller.limit})."
+		)
+	sampler = ResourceSampler(resource_sampling_interval)
+	sampler.start()
+
 	# Init workers from tasks
-	while not tasks.empty():
-		if state != "running":  # this enables pausing the script (not starting any new workers)
-			time.sleep(0.1)
-			continue
-		# Don't load more tasks if low on resources
-		cpu_percent = (psutil.cpu_percent() / psutil.cpu_count()
-		              )  # is this per logical core or cumulative?
-		mem_percent = psutil.virtual_memory().percent
-		if cpu_percent > utilization_settings["cpu"][
-		    "scale_down_threshold"] or mem_percent > utilization_settings[
-		        "memory"]["scale_down_threshold"]:
-			sleep_time = 1.0
-			logger.say(
-			    f"CPU or memory utilization is too high ({cpu_percent}% CPU, {mem_percent}% memory). Not starting any more workers. Sleeping for {sleep_time}s."
-			)
-			time.sleep(sleep_time)
-			continue
-		# if number of workers is smaller to the number of tasks, create a new worker
-		# otherwise wait for a worker to finish
-		if len(workers) < workers_max:
+	# The main thread sleeps on workers_cond and is woken up by Worker.handle_exit
+	# (freed slot or a retry put back into the queue), the REPL (pause / resume)
+	# or a timeout (overloaded or waiting for a delayed task)
+	queue_empty_logged = False
+	with workers_cond:
+		while not tasks.empty() or len(workers) > 0:
+			if state != "running":  # this enables pausing the script (not starting any new workers)
+				workers_cond.wait()
+				continue
+			# if number of workers is smaller to the number of tasks, create a new worker
+			# otherwise wait for a worker to finish
+			if len(workers) >= get_workers_limit():
+				workers_cond.wait()
+				continue
+			if tasks.empty():
+				if not queue_empty_logged:
+					logger.say("Task queue is empty. Waiting for workers to finish...")
+					queue_empty_logged = True
+				workers_cond.wait()
+				continue
+			queue_empty_logged = False
+			delay = tasks.get_delay()
+			if delay > 0:
+				# only delayed tasks (retries) left for now
+				workers_cond.wait(delay)
+				continue
+			# Don't load more tasks if low on resources
+			reading = sampler.get_reading()
+			cpu_percent = reading["cpu_percent"]  # average over all cores
+			mem_percent = reading["mem_percent"]
+			if cpu_percent > utilization_settings["cpu"][
+			    "scale_down_threshold"] or mem_percent > utilization_settings[
+			        "memory"]["scale_down_threshold"]:
+				logger.say(
+				    f"CPU or memory utilization is too high ({cpu_percent}% CPU, {mem_percent}% memory). Not starting any more workers. Waiting for {resource_sampling_interval}s."
+				)
+				workers_cond.wait(resource_sampling_interval)
+				continue
 			task = tasks.get()
-			handle = task["metadata"]["handle"]
-			# task_dict_task = task_dict[handle]
-			task_progress = load_task_progress(handle)
-			# If task progress exists, use it instead of the task from the task list
-			if task_progress:
-				logger.say(f"Loaded task progress for '{handle}'.")
-				task = task_progress
-			# when loading from task dict, we can start a task if it has no workerdata
-			# or if it has workerdata and it has exit code != 0 and retries > 0
-			if "workerdata" not in task or ("workerdata" in task and
-			                                (task["workerdata"]["exit_code"] != 0 and
-			                                 task["metadata"]["retries"] > 0)):
-				worker = Worker(task)
-				workers[worker.options["metadata"]["handle"]] = worker
-				worker.start_process()
-			else:
-				logger.say(f"Task '{handle}' has already been processed. Skipping...")
-				global tasks_skipped
-				tasks_skipped += 1
-		else:
-			time.sleep(0.01)
-	logger.say("Task queue is empty. Waiting for workers to finish...")
-	while len(workers) > 0:
-		time.sleep(0.1)
+			if task is None:
+				# another node leased the task first
+				continue
+			worker = create_worker(task)
+			workers[worker.options["metadata"]["handle"]] = worker
+			worker.start_process()
+	sampler.stop()
+	if pool is not None:
+		pool.shutdown()
+	if journal is not None:
+		journal.close()
+	if filepath_lease_db is not None:
+		logger.say(f"Lease database: {json.dumps(tasks.get_counts())}")
+		tasks.close()
 	tasks_finished_at = time.time()
 	# Set state to "stopped"
 	state = "stopped"
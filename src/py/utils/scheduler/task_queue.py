@@ -0,0 +1,119 @@
+'''
+Priority and deadline aware task queue for the scheduler.
+
+Task metadata fields used for ordering (all optional):
+	- priority: higher runs first (default 0)
+	- not_before: unix timestamp before which the task must not start (used
+		for retry backoff)
+	- cost_estimate: expected duration in seconds (used by the "sjf" and "ljf"
+		orders, falls back to workerdata.duration from a previous run)
+
+Tasks which can start are kept in a ready heap ordered by
+(-priority, cost, insertion order), tasks with a not_before in the future wait
+in a delayed heap ordered by not_before and are moved over once they are due.
+With the default "fifo" order tasks of the same priority start in file order.
+'''
+
+import time
+import heapq
+import threading
+from typing import Optional
+
+# sjf = shortest job first, ljf = longest job first
+ORDERS = ["fifo", "sjf", "ljf"]
+
+
+def get_task_cost(task: dict) -> Optional[float]:
+	'''
+		Returns the estimated duration of a task (None if unknown).
+	'''
+	if "cost_estimate" in task["metadata"]:
+		return float(task["metadata"]["cost_estimate"])
+	if "workerdata" in task and "duration" in task["workerdata"]:
+		return float(task["workerdata"]["duration"])
+	return None
+
+
+class TaskQueue:
+	'''
+		Heap based ready queue with delayed (not_before) tasks.
+	'''
+
+	def __init__(self, order: str = "fifo", default_cost: float = 0.0):
+		if order not in ORDERS:
+			raise ValueError(
+			    f"Invalid task order '{order}' (expected one of {ORDERS})")
+		self.order = order
+		self.default_cost = default_cost
+		self.ready = []  # type: list[tuple]
+		self.delayed = []  # type: list[tuple]
+		self.counter = 0  # tie breaker - keeps insertion order and avoids comparing dicts
+		self.lock = threading.Lock()
+
+	def get_key(self, task: dict, counter: int) -> tuple:
+		priority = task["metadata"].get("priority", 0)
+		cost = 0.0
+		if self.order != "fifo":
+			cost = get_task_cost(task)
+			if cost is None:
+				cost = self.default_cost
+			if self.order == "ljf":
+				cost = -cost
+		return (-priority, cost, counter)
+
+	def put(self, task: dict) -> None:
+		'''
+			Adds a task - to the delayed heap if its not_before is in the future.
+		'''
+		with self.lock:
+			self.counter += 1
+			not_before = task["metadata"].get("not_before", None)
+			if not_before is not None and not_before > time.time():
+				heapq.heappush(self.delayed, (not_before, self.counter, task))
+			else:
+				heapq.heappush(self.ready, self.get_key(task, self.counter) + (task,))
+
+	def promote(self, now: float) -> None:
+		'''
+			Moves due delayed tasks to the ready heap.
+		'''
+		while len(self.delayed) > 0 and self.delayed[0][0] <= now:
+			_, counter, task = heapq.heappop(self.delayed)
+			heapq.heappush(self.ready, self.get_key(task, counter) + (task,))
+
+	def get_delay(self) -> float:
+		'''
+			Returns the number of seconds until a task can start (0 if one is ready
+			now, inf if the queue is empty).
+		'''
+		with self.lock:
+			now = time.time()
+			self.promote(now)
+			if len(self.ready) > 0:
+				return 0.0
+			if len(self.delayed) > 0:
+				return max(0.0, self.delayed[0][0] - now)
+			return float("inf")
+
+	def get(self) -> dict:
+		'''
+			Pops the next ready task (raises IndexError if there is none).
+		'''
+		with self.lock:
+			self.promote(time.time())
+			return heapq.heappop(self.ready)[-1]
+
+	def task_done(self, task: dict) -> None:
+		'''
+			Nothing to do for a local queue (see LeaseQueue.task_done).
+		'''
+		pass
+
+	def qsize(self) -> int:
+		return len(self.ready) + len(self.delayed)
+
+	def qsize_ready(self) -> int:
+		return len(self.ready)
+
+	def empty(self) -> bool:
+		return self.qsize() == 0
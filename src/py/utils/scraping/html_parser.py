@@ -0,0 +1,281 @@
+'''
+Shared HTML parsing layer for the scrapers.
+
+Two ways in:
+	- get_soup(markup) - BeautifulSoup compatibility shim. Returns a regular
+		BeautifulSoup object (find, find_all, select, extract, ...) so existing
+		extraction code only has to replace BeautifulSoup(markup, "html.parser"),
+		but builds the tree with lxml (C) instead of the pure Python html.parser
+		when lxml is installed.
+	- parse(markup) - CSS selector API (css, css_first, text, attrs, remove)
+		backed by selectolax (lexbor) when it is installed, which skips building
+		BeautifulSoup's Python object tree altogether. Falls back to
+		BeautifulSoup (lxml / html.parser) + soupsieve with the same interface.
+
+Backends (fastest first): "selectolax", "lxml", "html.parser". The backend can
+be passed explicitly (e.g. "html.parser" to reproduce older outputs exactly -
+the parsers repair malformed HTML differently) or set globally with
+set_backend().
+
+Run this file to benchmark the backends on a folder of HTML files:
+	python src/py/utils/scraping/html_parser.py --folder data/scraped/cnet/articles/html --limit 1000
+'''
+
+import os
+import time
+import argparse
+import importlib.util
+from abc import ABC, abstractmethod
+import multiprocessing
+from typing import Iterator, Optional
+from bs4 import BeautifulSoup, Tag
+
+BACKENDS = ["selectolax", "lxml", "html.parser"]
+# None - fastest available (see get_backend)
+backend = None  # type: Optional[str]
+
+
+def is_available(backend_name: str) -> bool:
+	if backend_name == "html.parser":
+		return True
+	return importlib.util.find_spec(backend_name) is not None
+
+
+def get_available_backends() -> list[str]:
+	return [
+	    backend_name for backend_name in BACKENDS if is_available(backend_name)
+	]
+
+
+def set_backend(backend_name: Optional[str]) -> None:
+	'''
+		Sets the default backend (None - fastest available)
+	'''
+	global backend
+	if backend_name is not None and backend_name not in BACKENDS:
+		raise ValueError(
+		    f"Invalid HTML parser backend '{backend_name}' (expected one of {BACKENDS})"
+		)
+	backend = backend_name
+
+
+def get_backend(backend_name: Optional[str] = None) -> str:
+	'''
+		Returns the backend to use - the given one, the default one or the fastest
+		available one (unavailable backends fall back to the next fastest).
+	'''
+	if backend_name is None:
+		backend_name = backend
+	if backend_name is None:
+		return get_available_backends()[0]
+	if backend_name not in BACKENDS:
+		raise ValueError(
+		    f"Invalid HTML parser backend '{backend_name}' (expected one of {BACKENDS})"
+		)
+	for fallback in BACKENDS[BACKENDS.index(backend_name):]:
+		if is_available(fallback):
+			return fallback
+	return "html.parser"
+
+
+def get_soup(markup: str, backend_name: Optional[str] = None) -> BeautifulSoup:
+	'''
+		Returns a BeautifulSoup object built with the fastest available tree
+		builder (selectolax isn't a BeautifulSoup builder - lxml is used instead).
+	'''
+	backend_name = get_backend(backend_name)
+	if backend_name == "selectolax":
+		backend_name = get_backend("lxml")
+	return BeautifulSoup(markup, backend_name)
+
+
+class Node(ABC):
+	'''
+		Element returned by parse() - the common interface of both
+		implementations below.
+	'''
+
+	@abstractmethod
+	def css(self, selector: str) -> list["Node"]:
+		...
+
+	@abstractmethod
+	def css_first(self, selector: str) -> Optional["Node"]:
+		...
+
+	@abstractmethod
+	def text(self) -> str:
+		'''
+			Text of the element and all of its descendants
+		'''
+
+	@property
+	@abstractmethod
+	def attrs(self) -> dict:
+		...
+
+	def get(self, name: str, default=None):
+		return self.attrs.get(name, default)
+
+	def __getitem__(self, name: str):
+		return self.attrs[name]
+
+	@abstractmethod
+	def remove(self, tagnames: list[str]) -> None:
+		'''
+			Removes all descendants with the given tag names (with their contents)
+		'''
+
+
+class SoupNode(Node):
+	'''
+		Node backed by a BeautifulSoup tag (lxml / html.parser backends)
+	'''
+
+	def __init__(self, tag: Tag):
+		self.tag = tag
+
+	def css(self, selector: str) -> list[Node]:
+		return [SoupNode(tag) for tag in self.tag.select(selector)]
+
+	def css_first(self, selector: str) -> Optional[Node]:
+		tag = self.tag.select_one(selector)
+		return SoupNode(tag) if tag is not None else None
+
+	def text(self) -> str:
+		return self.tag.get_text()
+
+	@property
+	def attrs(self) -> dict:
+		# multi valued attributes (class) are joined like in the HTML source
+		return {
+		    name: " ".join(value) if isinstance(value, list) else value
+		    for name, value in self.tag.attrs.items()
+		}
+
+	def remove(self, tagnames: list[str]) -> None:
+		for tag in self.tag.find_all(tagnames):
+			tag.decompose()
+
+
+class LexborNode(Node):
+	'''
+		Node backed by a selectolax (lexbor) node
+	'''
+
+	def __init__(self, node):
+		self.node = node
+
+	def css(self, selector: str) -> list[Node]:
+		return [LexborNode(node) for node in self.node.css(selector)]
+
+	def css_first(self, selector: str) -> Optional[Node]:
+		node = self.node.css_first(selector)
+		return LexborNode(node) if node is not None else None
+
+	def text(self) -> str:
+		return self.node.text(deep=True)
+
+	@property
+	def attrs(self) -> dict:
+		return {
+		    name: value if value is not None else ""
+		    for name, value in self.node.attributes.items()
+		}
+
+	def remove(self, tagnames: list[str]) -> None:
+		self.node.strip_tags(tagnames)
+
+
+def parse(markup: str, backend_name: Optional[str] = None) -> Node:
+	'''
+		Parses the document and returns its root node
+	'''
+	backend_name = get_backend(backend_name)
+	if backend_name == "selectolax":
+		from selectolax.lexbor import LexborHTMLParser
+		return LexborNode(LexborHTMLParser(markup).root)
+	return SoupNode(BeautifulSoup(markup, backend_name))
+
+
+def get_filepaths(folderpath: str, limit: Optional[int] = None) -> list[str]:
+	filepaths = []
+	with os.scandir(folderpath) as entries:
+		for entry in entries:
+			if entry.name.endswith(".html"):
+				filepaths.append(entry.path)
+				if limit is not None and len(filepaths) >= limit:
+					break
+	return filepaths
+
+
+def read_files(filepaths: list[str]) -> Iterator[str]:
+	for filepath in filepaths:
+		with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+			yield f.read()
+
+
+def run_benchmark(backend_name: str, filepaths: list[str]) -> dict:
+	'''
+		Parses the files and extracts all paragraphs (what the scrapers do)
+		with one backend. Runs in its own process so the peak memory (max. RSS)
+		belongs to this backend only.
+	'''
+	# Unix only - imported here so the scrapers (which import this module)
+	# also run on Windows
+	import resource
+	time_parse = 0.0
+	paragraphs = 0
+	for markup in read_files(filepaths):
+		time_start = time.perf_counter()
+		root = parse(markup, backend_name)
+		root.remove(["script", "style", "svg"])
+		paragraphs += sum(1 for p in root.css("p") if len(p.text()) > 0)
+		time_parse += time.perf_counter() - time_start
+	return {
+	    "backend": backend_name,
+	    "time": time_parse,
+	    "paragraphs": paragraphs,
+	    # kilobytes on Linux
+	    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+	}
+
+
+def benchmark(folderpath: str, limit: Optional[int] = None) -> None:
+	'''
+		Compares parse + extraction time and peak memory of the available backends
+	'''
+	filepaths = get_filepaths(folderpath, limit)
+	size = sum(os.path.getsize(filepath) for filepath in filepaths)
+	print(
+	    f"{len(filepaths)} files ({round(size / 1024 / 1024, 3)} MB) from '{folderpath}'"
+	)
+	print(
+	    f"{'backend':>12}{'total (s)':>12}{'per file (ms)':>16}{'max. RSS (MB)':>16}{'paragraphs':>12}"
+	)
+	context = multiprocessing.get_context("spawn")
+	for backend_name in get_available_backends():
+		with context.Pool(1) as pool:
+			result = pool.apply(run_benchmark, (backend_name, filepaths))
+		per_file = result["time"] / max(1, len(filepaths)) * 1000
+		print(
+		    f"{backend_name:>12}{result['time']:>12.3f}{per_file:>16.3f}{result['maxrss_mb']:>16.1f}{result['paragraphs']:>12}"
+		)
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--folder",
+	                    type=str,
+	                    default="data/scraped/cnet/articles/html",
+	                    help="Folder with .html files")
+	parser.add_argument("--limit",
+	                    type=int,
+	                    default=1000,
+	                    help="Max. number of files")
+	args = parser.parse_args()
+	benchmark(args.folder, args.limit)
+
+
+if __name__ == "__main__":
+	main()
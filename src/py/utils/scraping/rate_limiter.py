@@ -0,0 +1,129 @@
+'''
+Asyncio rate limiting utilities for scrapers.
+
+TokenBucket allows bursts of up to `capacity` requests and a sustained rate of
+`rate` requests per second. The rate adapts to the server's responses (AIMD):
+every 429 halves the rate and pauses the bucket (respecting Retry-After), every
+success slowly increases it back towards the configured maximum.
+
+HostRateLimiter keeps one bucket per host so several hosts can be scraped
+concurrently without sharing a single budget.
+'''
+
+import time
+import random
+import asyncio
+from typing import Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+	'''
+		Adaptive asyncio token bucket.
+	'''
+
+	def __init__(self,
+	             rate: float,
+	             capacity: Optional[float] = None,
+	             rate_min: Optional[float] = None,
+	             increase_step: Optional[float] = None,
+	             decrease_factor: float = 0.5):
+		self.rate_max = rate
+		self.rate = rate
+		self.rate_min = rate_min if rate_min is not None else rate / 20
+		self.capacity = capacity if capacity is not None else max(1.0, rate)
+		# reach the max. rate again after ~100 successful requests
+		self.increase_step = increase_step if increase_step is not None else rate / 100
+		self.decrease_factor = decrease_factor
+		self.tokens = self.capacity
+		self.time_last = time.monotonic()
+		self.paused_until = 0.0
+		self.lock = asyncio.Lock()
+
+	def refill(self):
+		now = time.monotonic()
+		self.tokens = min(self.capacity,
+		                  self.tokens + (now - self.time_last) * self.rate)
+		self.time_last = now
+
+	async def acquire(self, tokens: float = 1.0) -> None:
+		'''
+			Waits until the given number of tokens is available and takes them.
+		'''
+		# The lock makes waiters queue up in FIFO order
+		async with self.lock:
+			while True:
+				now = time.monotonic()
+				if now < self.paused_until:
+					await asyncio.sleep(self.paused_until - now)
+					continue
+				self.refill()
+				if self.tokens >= tokens:
+					self.tokens -= tokens
+					return
+				await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+	def on_success(self) -> None:
+		'''
+			Additive increase of the rate.
+		'''
+		self.rate = min(self.rate_max, self.rate + self.increase_step)
+
+	def on_throttle(self, retry_after: Optional[float] = None) -> float:
+		'''
+			Multiplicative decrease of the rate and a pause of the whole bucket.
+			Returns the pause duration in seconds.
+		'''
+		self.refill()
+		self.rate = max(self.rate_min, self.rate * self.decrease_factor)
+		self.tokens = 0.0
+		if retry_after is None:
+			# wait for roughly one token at the new rate (with jitter)
+			retry_after = random.uniform(1.0, 2.0) / self.rate
+		self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+		return retry_after
+
+
+class HostRateLimiter:
+	'''
+		One TokenBucket per host (created on first use).
+	'''
+
+	def __init__(self, rate: float, capacity: Optional[float] = None):
+		self.rate = rate
+		self.capacity = capacity
+		self.buckets = {}  # type: dict[str, TokenBucket]
+
+	def get_bucket(self, url: str) -> TokenBucket:
+		host = urlparse(url).netloc
+		if host not in self.buckets:
+			self.buckets[host] = TokenBucket(self.rate, self.capacity)
+		return self.buckets[host]
+
+	async def acquire(self, url: str) -> TokenBucket:
+		'''
+			Waits for a token of the url's host. Returns the bucket so the caller
+			can report the outcome (on_success / on_throttle).
+		'''
+		bucket = self.get_bucket(url)
+		await bucket.acquire()
+		return bucket
+
+
+def get_retry_after(value: Optional[str]) -> Optional[float]:
+	'''
+		Parses the Retry-After header (only the delay-seconds form).
+	'''
+	if value is None:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		return None
+
+
+def get_backoff(attempt: int, base: float = 1.0, cap: float = 120.0) -> float:
+	'''
+		Exponential backoff with full jitter.
+	'''
+	return random.uniform(0, min(cap, base * 2**attempt))